@@ -0,0 +1,227 @@
+# answer_cache.py
+
+import os
+import json
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+
+from config import (
+    ANSWER_CACHE_THRESHOLD,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_MAX_MB,
+    ANSWER_CACHE_PERSIST,
+    ANSWER_CACHE_FILE,
+)
+
+
+def _unit(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32).ravel()
+    n = np.linalg.norm(v)
+    return v / n if n > 0 else v
+
+
+def _entry_size(entry: Dict) -> int:
+    """Approximate memory footprint of a cache entry in bytes."""
+    return (
+        entry["vector"].nbytes
+        + len(entry["question"].encode("utf-8"))
+        + len(entry["answer"].encode("utf-8"))
+        + len(json.dumps(entry["docs"], ensure_ascii=False).encode("utf-8"))
+    )
+
+
+class SemanticAnswerCache:
+    """
+    In-memory semantic cache of generated answers.
+
+    Entries are keyed by (tone, question embedding). A lookup returns the
+    stored answer when the cosine similarity to a cached question of the
+    same tone reaches `threshold`.
+
+    The cache holds at most a few thousand entries, so the "index" is a
+    single normalized matrix scanned with one matrix-vector product; at
+    that size this is faster than any ANN structure. Eviction is LRU,
+    bounded by entry count, TTL and an approximate memory cap.
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        max_mb: float = ANSWER_CACHE_MAX_MB,
+        persist_path=ANSWER_CACHE_FILE if ANSWER_CACHE_PERSIST else None,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.persist_path = persist_path
+
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._next_key = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # Lazily rebuilt search matrix over all live entries
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[int] = []
+        self._matrix_tones: Optional[np.ndarray] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if persist_path is not None:
+            self.load()
+            atexit.register(self.save)
+
+    # --------- LOOKUP ---------
+    def lookup(self, vector, tone: str) -> Optional[Tuple[str, List[Dict]]]:
+        """Return (answer, docs) for a close-enough cached question, else None."""
+        q = _unit(vector)
+        with self._lock:
+            key = self._nearest(q, tone)
+            if key is not None and self._is_expired(self._entries[key]):
+                self._remove(key)
+                key = None
+            if key is None:
+                self.misses += 1
+                return None
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["answer"], entry["docs"]
+
+    def _nearest(self, q: np.ndarray, tone: str) -> Optional[int]:
+        if not self._entries:
+            return None
+        if self._matrix is None:
+            self._rebuild_matrix()
+        sims = self._matrix @ q
+        sims[self._matrix_tones != tone] = -1.0
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        return self._matrix_keys[best]
+
+    def _rebuild_matrix(self) -> None:
+        keys = list(self._entries.keys())
+        self._matrix_keys = keys
+        self._matrix = np.stack([self._entries[k]["vector"] for k in keys])
+        self._matrix_tones = np.array([self._entries[k]["tone"] for k in keys])
+
+    # --------- INSERT / EVICT ---------
+    def store(self, vector, tone: str, question: str, answer: str, docs: List[Dict]) -> None:
+        """Cache a freshly generated answer."""
+        entry = {
+            "vector": _unit(vector),
+            "tone": tone,
+            "question": question,
+            "answer": answer,
+            "docs": docs,
+            "created": time.time(),
+        }
+        entry["nbytes"] = _entry_size(entry)
+        with self._lock:
+            self._expire()
+            self._add(entry)
+            self._evict_over_capacity()
+
+    def _add(self, entry: Dict) -> None:
+        key = self._next_key
+        self._next_key += 1
+        self._entries[key] = entry
+        self._bytes += entry["nbytes"]
+        self._matrix = None
+
+    def _remove(self, key: int) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry["nbytes"]
+        self._matrix = None
+        self.evictions += 1
+
+    def _is_expired(self, entry: Dict) -> bool:
+        return bool(self.ttl_seconds) and time.time() - entry["created"] > self.ttl_seconds
+
+    def _expire(self) -> None:
+        if not self.ttl_seconds:
+            return
+        expired = [k for k, e in self._entries.items() if self._is_expired(e)]
+        for k in expired:
+            self._remove(k)
+
+    def _evict_over_capacity(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._matrix = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+    # --------- PERSISTENCE ---------
+    def save(self, path=None) -> None:
+        """Write live entries (in LRU order) to an .npz file."""
+        path = path or self.persist_path
+        if path is None:
+            return
+        with self._lock:
+            self._expire()
+            entries = list(self._entries.values())
+        if not entries:
+            return
+
+        vectors = np.stack([e["vector"] for e in entries])
+        meta = [
+            {k: e[k] for k in ("tone", "question", "answer", "docs", "created")}
+            for e in entries
+        ]
+        os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, vectors=vectors, meta=np.array(json.dumps(meta, ensure_ascii=False)))
+        os.replace(tmp_path, path)
+
+    def load(self, path=None) -> None:
+        """Restore entries written by `save`, dropping anything past its TTL."""
+        path = path or self.persist_path
+        if path is None or not os.path.exists(path):
+            return
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                vectors = data["vectors"]
+                meta = json.loads(str(data["meta"]))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Ignoring unreadable answer cache {path}: {e}")
+            return
+
+        with self._lock:
+            for vec, m in zip(vectors, meta):
+                entry = dict(m, vector=vec.astype(np.float32))
+                entry["nbytes"] = _entry_size(entry)
+                self._add(entry)
+            self._expire()
+            self._evict_over_capacity()
+            self.evictions = 0
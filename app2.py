@@ -3,14 +3,14 @@
 import json
 import html
 import time
+import uuid
 
 import streamlit as st
 import streamlit.components.v1 as components
 import pandas as pd
-from pandas.errors import EmptyDataError
 
-from config import APP_TITLE, APP_TAGLINE, ESCALATION_LOG, FAQS_FILE
-from rag_pipeline import SupportRAGPipeline, log_escalation
+from config import APP_TITLE, APP_TAGLINE, FAQS_FILE
+from rag_pipeline import SupportRAGPipeline, log_escalation, recent_escalations
 
 
 # ----------------- PAGE CONFIG -----------------
@@ -219,10 +219,12 @@ with st.sidebar:
     with open(FAQS_FILE, "r", encoding="utf-8") as f:
         faq_data = json.load(f)
 
-    categories = sorted(list({row["category"] for row in faq_data}))
+    # FAQ categories plus the ones the retrieval router knows (e.g. from the Bitext data)
+    categories = sorted({row["category"] for row in faq_data} | set(pipeline.categories()))
     selected_category = st.selectbox(
         "Browse FAQs by Category",
-        options=["All"] + categories
+        options=["All"] + categories,
+        help="Answers are also searched within this category only."
     )
 
     if selected_category == "All":
@@ -240,6 +242,14 @@ with st.sidebar:
     st.markdown("---")
     st.caption("🔁 This demo uses local models + Pinecone vector store (free tier).")
 
+    status = pipeline.status()
+    if status["generator_ready"]:
+        st.caption(f"🟢 Answer model ready (startup {status['startup_timings'].get('ready_s', 0.0):.1f}s).")
+    elif status["generator_error"]:
+        st.caption("🔴 Answer model failed to load. Check the server logs.")
+    else:
+        st.caption("🟡 Answer model is warming up. The first answer may take longer.")
+
 
 # ----------------- SESSION STATE -----------------
 if "chat_history" not in st.session_state:
@@ -248,6 +258,9 @@ if "chat_history" not in st.session_state:
 if "last_answer" not in st.session_state:
     st.session_state.last_answer = None
 
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex  # keys the pipeline's retrieval state
+
 st.markdown("### 🗨️ Conversation")
 
 # ----------------- HELPERS -----------------
@@ -306,8 +319,10 @@ chat_container = st.container()
 clear_col, _ = st.columns([1, 3])
 with clear_col:
     if st.button("🧹 Clear chat"):
+        pipeline.end_session(st.session_state.session_id)
         st.session_state.chat_history = []
         st.session_state.last_answer = None
+        st.session_state.session_id = uuid.uuid4().hex
         st.rerun()
 
 # Initial render of existing history
@@ -360,26 +375,50 @@ if submitted and user_query.strip():
             unsafe_allow_html=True,
         )
 
-        # Placeholder for assistant message (we'll "type" into this)
+        # Placeholder for assistant message (answer is streamed into this)
         assistant_placeholder = st.empty()
 
         st.markdown("</div>", unsafe_allow_html=True)
 
-        # 2️⃣ Show spinner while RAG pipeline runs
-        with st.spinner("SupportSphere is thinking with RAG..."):
-            answer, docs = pipeline.answer_question(question, tone=tone)
-
-        # 3️⃣ Typing effect for assistant reply (character by character)
-        typed_text = ""
-        for ch in answer:
-            typed_text += ch
-            assistant_placeholder.markdown(
-                render_message("assistant", typed_text),
-                unsafe_allow_html=True,
+        # 2️⃣ Show spinner while retrieval runs
+        spinner_text = (
+            "SupportSphere is thinking with RAG..."
+            if pipeline.is_ready()
+            else "Warming up the answer model (first request only)..."
+        )
+        with st.spinner(spinner_text):
+            chunks, docs = pipeline.stream_answer(
+                question,
+                tone=tone,
+                history=st.session_state.chat_history,
+                session_id=st.session_state.session_id,
+                category=None if selected_category == "All" else selected_category,
             )
-            time.sleep(0.01)  # typing speed
 
-    # 4️⃣ Update history AFTER full answer is typed
+        # 3️⃣ Stream the assistant reply as tokens are generated
+        #    (re-render at most every ~50 ms instead of once per character)
+        answer = ""
+        last_render = 0.0
+        assistant_placeholder.markdown(
+            render_message("assistant", "…"),
+            unsafe_allow_html=True,
+        )
+        for chunk in chunks:
+            answer += chunk
+            now = time.monotonic()
+            if now - last_render >= 0.05:
+                assistant_placeholder.markdown(
+                    render_message("assistant", answer),
+                    unsafe_allow_html=True,
+                )
+                last_render = now
+        answer = answer.strip()
+        assistant_placeholder.markdown(
+            render_message("assistant", answer),
+            unsafe_allow_html=True,
+        )
+
+    # 4️⃣ Update history AFTER full answer is streamed
     st.session_state.chat_history.append({"role": "user", "content": question})
     st.session_state.chat_history.append({"role": "assistant", "content": answer})
 
@@ -415,22 +454,16 @@ if escalate_btn:
             st.write("**AI Answer:**", last["answer"])
             st.write("**Top Retrieved FAQ entries:**")
             for d in last["docs"]:
-                st.markdown(f"- **{d['question']}** (Category: {d.get('category', 'FAQ')})")
+                st.markdown(f"- **{d['question']}** (Category: {d.get('category') or 'FAQ'})")
 
 
 # ----------------- ESCALATION LOG VIEW -----------------
-if ESCALATION_LOG.exists():
-    with st.expander("📂 View Escalation Log (for supervisors)", expanded=False):
-        try:
-            if ESCALATION_LOG.stat().st_size > 0:
-                df = pd.read_csv(ESCALATION_LOG)
-                if not df.empty:
-                    st.dataframe(df.tail(10))
-                else:
-                    st.info("No escalations logged yet.")
-            else:
-                st.info("No escalations logged yet.")
-        except EmptyDataError:
+with st.expander("📂 View Escalation Log (for supervisors)", expanded=False):
+    try:
+        recent = recent_escalations(10)
+        if recent:
+            st.dataframe(pd.DataFrame(recent))
+        else:
             st.info("No escalations logged yet.")
-        except Exception as e:
-            st.error(f"Could not load escalation log: {e}")
+    except Exception as e:
+        st.error(f"Could not load escalation log: {e}")
@@ -0,0 +1,396 @@
+# benchmark.py
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+
+# Metrics compared against a baseline run: (section path, higher_is_better)
+REGRESSION_KEYS = [
+    (("retrieval", "latency_ms", "p95"), False),
+    (("retrieval", "recall@1"), True),
+    (("retrieval", "recall@k"), True),
+    (("end_to_end", "latency_ms", "p95"), False),
+    (("end_to_end", "tokens_in_mean"), False),
+]
+
+
+def _force_offline() -> None:
+    """Models and datasets must come from the local Hugging Face cache."""
+    for var in ("HF_HUB_OFFLINE", "HF_DATASETS_OFFLINE", "TRANSFORMERS_OFFLINE"):
+        os.environ.setdefault(var, "1")
+
+
+def percentiles(values: List[float]) -> Dict:
+    if not values:
+        return {"n": 0}
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        "n": int(arr.size),
+        "mean": round(float(arr.mean()), 3),
+        "p50": round(float(np.percentile(arr, 50)), 3),
+        "p95": round(float(np.percentile(arr, 95)), 3),
+        "p99": round(float(np.percentile(arr, 99)), 3),
+        "max": round(float(arr.max()), 3),
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ------------------ FIXTURES ------------------
+
+def load_corpus(bitext_rows: int, seed: int):
+    """
+    FAQ rows plus a fixed, seeded sample of Bitext rows (from the local dataset
+    cache). Returns (DataFrame indexed by row id, number of Bitext rows used).
+    """
+    import pandas as pd
+    from ingest_to_pinecone import iter_faq_batches, bitext_categories, BITEXT_DATASET
+
+    frames = list(iter_faq_batches())
+    n_bitext = 0
+    if bitext_rows:
+        try:
+            from datasets import load_dataset
+
+            ds = load_dataset(BITEXT_DATASET, split="train")
+            rows = sorted(random.Random(seed).sample(range(len(ds)), min(bitext_rows, len(ds))))
+            sample = ds.select(rows)
+            frames.append(pd.DataFrame(
+                {
+                    "question": sample["instruction"],
+                    "answer": sample["response"],
+                    "category": bitext_categories(sample["category"]).tolist(),
+                    "intent": sample["intent"],
+                },
+                index=rows,
+            ))
+            n_bitext = len(rows)
+        except Exception as e:  # not cached locally
+            print(f"⚠️ Bitext sample unavailable offline ({e.__class__.__name__}); using FAQs only.")
+    return pd.concat(frames), n_bitext
+
+
+def build_stores(corpus, embedder, backend: str, workdir: str, hybrid: bool, fake_latency_ms: float = 0.0):
+    """
+    Dense store (in-memory, local FAISS, or PineconeRetriever over the in-memory
+    FakeVectorIndex with `fake_latency_ms` per call) and optional BM25 index.
+    """
+    from config import EMBEDDING_MODEL_NAME
+    from chunking import build_chunks
+    from ingest_to_pinecone import _to_vectors, _sparse_docs
+    from retrievers import InMemoryRetriever, FaissRetriever, PineconeRetriever, embedding_fingerprint
+    from vector_client import FakeVectorIndex
+    from sparse_index import BM25Index
+
+    chunk_df = build_chunks(corpus)
+    chunk_df["id"] = [f"{r}-{c}" for r, c in zip(chunk_df["row_id"], chunk_df["chunk_id"])]
+    embeddings = embedder.encode(chunk_df["answer_chunk"].tolist(), batch_size=64, convert_to_numpy=True)
+
+    if backend == "memory":
+        store = InMemoryRetriever()
+    elif backend == "pinecone-fake":
+        store = PineconeRetriever(index=FakeVectorIndex(latency_ms=fake_latency_ms, jitter_ms=fake_latency_ms / 2))
+    else:
+        index_type = backend.split("-", 1)[1]
+        store = FaissRetriever(
+            index_file=os.path.join(workdir, "faiss_index.bin"),
+            metadata_file=os.path.join(workdir, "metadata.json"),
+            index_type=index_type,
+        )
+    store.upsert(_to_vectors(chunk_df, embeddings))
+    store.flush()
+    store.write_fingerprint(embedding_fingerprint(EMBEDDING_MODEL_NAME, embeddings.shape[1]))
+
+    sparse = None
+    if hybrid:
+        sparse = BM25Index()
+        sparse.add_documents(_sparse_docs(chunk_df))
+        sparse.flush()
+    return store, sparse, len(chunk_df)
+
+
+def build_queries(corpus, n: int, seed: int) -> List[Tuple[str, str]]:
+    """(question, relevant row id) pairs: every FAQ plus seeded Bitext rows, capped at n."""
+    ids = [str(i) for i in corpus.index]
+    faq = [i for i in range(len(ids)) if ids[i].startswith("faq-")]
+    other = [i for i in range(len(ids)) if not ids[i].startswith("faq-")]
+    random.Random(seed).shuffle(other)
+    picked = (faq + other)[:n]
+    return [(corpus.iloc[i]["question"], ids[i]) for i in picked]
+
+
+# ------------------ MEASUREMENTS ------------------
+
+def bench_retrieval(pipeline, queries: List[Tuple[str, str]], k: int) -> Dict:
+    latencies, hits_1, hits_k, rr = [], 0, 0, 0.0
+    for question, relevant in queries:
+        start = time.perf_counter()
+        docs = pipeline._retrieve(question, top_k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ranked = [str(d.get("row_id")) for d in docs]
+        if relevant in ranked:
+            rank = ranked.index(relevant) + 1
+            hits_1 += rank == 1
+            hits_k += 1
+            rr += 1.0 / rank
+    n = max(len(queries), 1)
+    return {
+        "k": k,
+        "queries": len(queries),
+        "recall@1": round(hits_1 / n, 4),
+        "recall@k": round(hits_k / n, 4),
+        "mrr": round(rr / n, 4),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+def bench_end_to_end(pipeline, questions: List[str], tone: str) -> Dict:
+    """Sequential answer_question calls; per-stage numbers come from the pipeline traces."""
+    from metrics import metrics
+
+    traces: List[Dict] = []
+    metrics.add_trace_listener(traces.append)
+    try:
+        for q in questions:
+            pipeline.answer_question(q, tone=tone)
+    finally:
+        metrics.remove_trace_listener(traces.append)
+
+    stages = defaultdict(list)
+    for t in traces:
+        per_trace = defaultdict(float)
+        for span in t["spans"]:
+            per_trace[span["stage"]] += span["ms"]
+        for stage, ms in per_trace.items():
+            stages[stage].append(ms)
+
+    tokens_in = [t["tokens_in"] for t in traces if "tokens_in" in t]
+    tokens_out = [t["tokens_out"] for t in traces if "tokens_out" in t]
+    paths, policies = defaultdict(int), defaultdict(int)
+    for t in traces:
+        paths[t.get("path", "unknown")] += 1
+        if "decoding" in t:
+            policies[t["decoding"]] += 1
+    return {
+        "queries": len(traces),
+        "latency_ms": percentiles([t["duration_ms"] for t in traces]),
+        "stages_ms": {stage: percentiles(v) for stage, v in sorted(stages.items())},
+        "tokens_in_mean": round(float(np.mean(tokens_in)), 1) if tokens_in else None,
+        "tokens_out_mean": round(float(np.mean(tokens_out)), 1) if tokens_out else None,
+        "paths": dict(paths),
+        "decoding": dict(policies),
+    }
+
+
+def bench_concurrency(pipeline, questions: List[str], clients: int, tone: str) -> Dict:
+    """N client threads sharing one pipeline, each sending requests back to back."""
+
+    def timed(q: str) -> float:
+        start = time.perf_counter()
+        pipeline.answer_question(q, tone=tone)
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = list(pool.map(timed, questions))
+    wall = time.perf_counter() - start
+    return {
+        "clients": clients,
+        "requests": len(questions),
+        "throughput_rps": round(len(questions) / wall, 3) if wall else None,
+        "latency_ms": percentiles(latencies),
+    }
+
+
+# ------------------ BASELINE COMPARISON ------------------
+
+def _lookup(report: Dict, path: Tuple[str, ...]):
+    for key in path:
+        if not isinstance(report, dict) or key not in report:
+            return None
+        report = report[key]
+    return report
+
+
+def compare(report: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """Human-readable regressions beyond `max_regression` (relative) against a baseline report."""
+    problems = []
+    for path, higher_is_better in REGRESSION_KEYS:
+        new, old = _lookup(report, path), _lookup(baseline, path)
+        if not isinstance(new, (int, float)) or not isinstance(old, (int, float)) or old == 0:
+            continue
+        change = (new - old) / abs(old)
+        worse = -change if higher_is_better else change
+        print(f"   {'.'.join(path):<32} {old:>10} -> {new:<10} ({change:+.1%})")
+        if worse > max_regression:
+            problems.append(f"{'.'.join(path)} regressed {worse:.1%} ({old} -> {new})")
+    return problems
+
+
+# ------------------ MAIN ------------------
+
+def run(args) -> Dict:
+    if not args.allow_network:
+        _force_offline()
+
+    from sentence_transformers import SentenceTransformer
+
+    import config
+    from decoding_policy import DecodingPolicy
+    from embedding_service import EmbeddingService
+    from rag_pipeline import SupportRAGPipeline
+
+    started = time.perf_counter()
+    corpus, n_bitext = load_corpus(args.bitext_rows, args.seed)
+    embedder = SentenceTransformer(config.EMBEDDING_MODEL_NAME)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        store, sparse, n_chunks = build_stores(
+            corpus, embedder, args.backend, workdir, not args.no_hybrid, args.fake_latency_ms
+        )
+        print(f"📦 Indexed {n_chunks} chunks ({len(corpus) - n_bitext} FAQs, {n_bitext} Bitext rows).")
+
+        pipeline = SupportRAGPipeline(
+            retriever=store,
+            background_load=False,
+            warm_up=True,
+            generator_model=args.generator_model,
+            # No disk cache (results must not depend on earlier runs); the in-memory
+            # cache only counts as a fast path
+            embedder=EmbeddingService(
+                config.EMBEDDING_MODEL_NAME,
+                model=embedder,
+                cache_size=config.EMBEDDING_CACHE_SIZE if args.fast_paths else 0,
+                disk_cache_path=None,
+            ),
+        )
+        # Same adaptive choice of policy, but uncapped: latency and token numbers must not
+        # come from answers the time cap cut short
+        pipeline.decoding = DecodingPolicy(max_time_s=0)
+        # An injected retriever loads no BM25 index or router from disk; use this corpus's
+        pipeline.sparse_index = sparse
+        if args.category_routing:
+            from category_router import CategoryRouter, QuestionSampler
+
+            sampler = QuestionSampler()
+            sampler.add(corpus["category"].fillna("").tolist(), corpus["question"].tolist())
+            pipeline.router = CategoryRouter.from_samples(pipeline.embedder, sampler.samples)
+        if not args.fast_paths:
+            # Measure the full RAG path: every query retrieves and generates
+            pipeline.cache = None
+            pipeline.faq_matcher = None
+
+        queries = build_queries(corpus, args.queries, args.seed)
+        report = {
+            "meta": {
+                "commit": _git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpu_count": os.cpu_count(),
+                "seed": args.seed,
+                "backend": args.backend,
+                "hybrid": sparse is not None,
+                "fast_paths": args.fast_paths,
+                "category_routing": args.category_routing,
+                "corpus_rows": len(corpus),
+                "bitext_rows": n_bitext,
+                "chunks": n_chunks,
+                "embedding_model": config.EMBEDDING_MODEL_NAME,
+                "generator_model": pipeline.generator_model,
+                "generator_backend": config.GENERATOR_BACKEND,
+                "decoding_policy": config.DECODING_POLICY,
+                "max_time_s": 0,
+                "num_beams": config.GENERATOR_NUM_BEAMS,
+                "max_input_tokens": config.GENERATOR_MAX_INPUT_TOKENS,
+                "max_length": config.GENERATOR_MAX_LENGTH,
+                "top_k": config.TOP_K,
+                "context_candidates": config.CONTEXT_CANDIDATES,
+                "reranker": config.RERANKER_ENABLED,
+            },
+            "startup_s": {k: round(v, 3) for k, v in pipeline.startup_timings.items()},
+        }
+
+        print(f"🔎 Retrieval: {len(queries)} queries...")
+        report["retrieval"] = bench_retrieval(pipeline, queries, args.k)
+
+        if not args.skip_generation:
+            questions = [q for q, _ in queries[:args.e2e_queries]]
+            print(f"💬 End-to-end: {len(questions)} questions...")
+            report["end_to_end"] = bench_end_to_end(pipeline, questions, args.tone)
+            report["concurrency"] = []
+            for clients in args.concurrency:
+                print(f"👥 {clients} concurrent clients...")
+                report["concurrency"].append(bench_concurrency(pipeline, questions, clients, args.tone))
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    report["total_s"] = round(time.perf_counter() - started, 1)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline retrieval + generation benchmark (JSON output).")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against.")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Fail if a tracked metric is this much worse (relative) than the baseline.")
+    parser.add_argument("--backend", choices=("memory", "faiss-flat", "faiss-ivf", "faiss-hnsw", "pinecone-fake"),
+                        default="memory")
+    parser.add_argument("--fake-latency-ms", type=float, default=20.0,
+                        help="Per-call latency of the fake index behind --backend pinecone-fake.")
+    parser.add_argument("--no-hybrid", action="store_true", help="Dense retrieval only (no BM25 fusion).")
+    parser.add_argument("--fast-paths", action="store_true", help="Keep the FAQ match and answer cache on.")
+    parser.add_argument("--category-routing", action="store_true",
+                        help="Route queries to a category with a nearest-centroid router built from the corpus.")
+    parser.add_argument("--generator-model", default="google/flan-t5-small")
+    parser.add_argument("--bitext-rows", type=int, default=500, help="Bitext rows to index (0 = FAQs only).")
+    parser.add_argument("--queries", type=int, default=100, help="Retrieval queries.")
+    parser.add_argument("--e2e-queries", type=int, default=20, help="Questions answered end to end.")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--tone", default="Friendly")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--skip-generation", action="store_true")
+    parser.add_argument("--allow-network", action="store_true", help="Allow downloading models/datasets.")
+    args = parser.parse_args()
+
+    report = run(args)
+    Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"✅ Results written to {args.output}")
+
+    if args.baseline:
+        print(f"📊 Compared with {args.baseline}:")
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        problems = compare(report, baseline, args.max_regression)
+        if problems:
+            raise SystemExit("❌ Regressions:\n" + "\n".join(f" - {p}" for p in problems))
+        print("✅ No regressions beyond the threshold.")
@@ -0,0 +1,177 @@
+# category_router.py
+
+import os
+import json
+import random
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from config import (
+    VECTOR_BACKEND,
+    VECTORSTORE_DIR,
+    EMBEDDING_MODEL_NAME,
+    CATEGORY_ROUTE_MIN_SCORE,
+    CATEGORY_ROUTE_MIN_MARGIN,
+    CATEGORY_SAMPLES,
+)
+
+
+def _unit(vectors) -> np.ndarray:
+    m = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+
+
+# ------------------ SAMPLING (INGESTION) ------------------
+
+class QuestionSampler:
+    """
+    Uniform sample of up to `per_category` distinct questions per category
+    (reservoir sampling), collected while ingestion streams the chunks.
+    """
+
+    def __init__(self, per_category: int = CATEGORY_SAMPLES, seed: int = 13):
+        self.per_category = per_category
+        self._rng = random.Random(seed)
+        self.samples: Dict[str, List[str]] = {}
+        self._seen: Dict[str, set] = {}
+
+    def add(self, categories, questions) -> None:
+        for category, question in zip(categories, questions):
+            if not category or not question:
+                continue
+            seen = self._seen.setdefault(category, set())
+            if question in seen:  # one row per chunk repeats its question
+                continue
+            seen.add(question)
+            sample = self.samples.setdefault(category, [])
+            if len(sample) < self.per_category:
+                sample.append(question)
+            else:
+                j = self._rng.randrange(len(seen))
+                if j < self.per_category:
+                    sample[j] = question
+
+
+# ------------------ ROUTER ------------------
+
+class CategoryRouter:
+    """
+    Nearest-centroid question classifier: one normalized centroid of
+    question embeddings per category, so routing is a single matrix-vector
+    product on the already computed query embedding.
+
+    `route` returns a category only when the best centroid is close enough
+    (`min_score`) and clearly ahead of the runner-up (`min_margin`);
+    ambiguous questions return None and search the whole index.
+    """
+
+    def __init__(
+        self,
+        names: List[str],
+        centroids,
+        model_name: str = EMBEDDING_MODEL_NAME,
+        min_score: float = CATEGORY_ROUTE_MIN_SCORE,
+        min_margin: float = CATEGORY_ROUTE_MIN_MARGIN,
+    ):
+        self.names = list(names)
+        self.centroids = _unit(centroids) if self.names else np.zeros((0, 0), dtype=np.float32)
+        self.model_name = model_name
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.routed = 0
+        self.unrouted = 0
+
+    @classmethod
+    def from_samples(
+        cls,
+        embedder,
+        samples: Dict[str, List[str]],
+        previous: Optional["CategoryRouter"] = None,
+        model_name: str = EMBEDDING_MODEL_NAME,
+    ) -> "CategoryRouter":
+        """
+        Centroids of the sampled questions; categories without samples this
+        time (e.g. a resumed run) keep their `previous` centroid.
+        """
+        centroids: Dict[str, np.ndarray] = {}
+        if previous is not None and previous.model_name == model_name:
+            centroids.update(zip(previous.names, previous.centroids))
+        for category, questions in samples.items():
+            if questions:
+                vectors = embedder.encode(questions, batch_size=64, convert_to_numpy=True)
+                centroids[category] = _unit(vectors).mean(axis=0)
+        names = sorted(centroids)
+        return cls(names, [centroids[n] for n in names], model_name=model_name)
+
+    @property
+    def categories(self) -> List[str]:
+        return list(self.names)
+
+    def classify(self, q_vecs) -> List[Tuple[Optional[str], float, float]]:
+        """(best category, its cosine similarity, margin over the runner-up) per query."""
+        if not self.names:
+            return [(None, 0.0, 0.0) for _ in range(len(q_vecs))]
+        sims = _unit(q_vecs) @ self.centroids.T
+        order = np.argsort(-sims, axis=1)
+        out = []
+        for row, idx in zip(sims, order):
+            best = float(row[idx[0]])
+            second = float(row[idx[1]]) if len(idx) > 1 else -1.0
+            out.append((self.names[idx[0]], best, best - second))
+        return out
+
+    def route(self, q_vecs) -> List[Optional[str]]:
+        routes = []
+        for name, score, margin in self.classify(q_vecs):
+            ok = name is not None and score >= self.min_score and margin >= self.min_margin
+            routes.append(name if ok else None)
+            if ok:
+                self.routed += 1
+            else:
+                self.unrouted += 1
+        return routes
+
+    def stats(self) -> Dict:
+        total = self.routed + self.unrouted
+        return {
+            "categories": len(self.names),
+            "routed": self.routed,
+            "unrouted": self.unrouted,
+            "route_rate": self.routed / total if total else 0.0,
+        }
+
+    # --------- PERSISTENCE ---------
+    def save(self, path) -> None:
+        os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        meta = {"names": self.names, "embedding_model": self.model_name}
+        np.savez(tmp_path, centroids=self.centroids, meta=np.array(json.dumps(meta, ensure_ascii=False)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path) -> "CategoryRouter":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            centroids = data["centroids"].astype(np.float32)
+        return cls(meta["names"], centroids, model_name=meta.get("embedding_model"))
+
+
+def category_router_path(backend: str = VECTOR_BACKEND):
+    """Category centroids built alongside one vector backend."""
+    return VECTORSTORE_DIR / f"categories_{backend}.npz"
+
+
+def load_category_router(path, model_name: str = EMBEDDING_MODEL_NAME) -> Optional[CategoryRouter]:
+    """The router at `path`, or None if ingestion has not built one for this embedding model."""
+    if not os.path.exists(str(path)):
+        return None
+    try:
+        router = CategoryRouter.load(path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Ignoring unreadable category router {path}: {e}")
+        return None
+    if router.model_name != model_name:
+        print(f"⚠️ Category router was built with {router.model_name}; re-run ingestion to route questions.")
+        return None
+    return router if router.names else None
@@ -0,0 +1,362 @@
+# chunk_store.py
+
+import os
+import copy
+import json
+import mmap
+import time
+import shutil
+import threading
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from config import VECTOR_BACKEND, VECTORSTORE_DIR, CHUNK_STORE_DTYPE, CHUNK_STORE_REFRESH_S
+
+DTYPES = ("float16", "int8")
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    m = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.maximum(norms, 1e-12)
+
+
+# ------------------ SEGMENT ------------------
+
+class _Segment:
+    """
+    One immutable batch of chunks:
+    - vectors.npy  (n, dim) float16, or int8 with a float32 scale per row in scales.npy
+    - texts.bin    UTF-8 question and answer texts back to back
+    - offsets.npy  (2n + 1,) int64: question i is [2i, 2i+1), answer i is [2i+1, 2i+2)
+    - ids.json     [[id, row_id, chunk_id, category], ...] in row order (older segments lack category)
+    Arrays and the text blob are memory-mapped when loaded from disk.
+    """
+
+    def __init__(self, ids: List[List], vectors, scales, offsets, texts):
+        self.ids = ids
+        self.vectors = vectors
+        self.scales = scales
+        self.offsets = offsets
+        self.texts = texts  # bytes-like (bytes in memory, memoryview over an mmap on disk)
+        self.deleted = np.zeros(len(ids), dtype=bool)
+
+    @classmethod
+    def build(cls, records: List[Dict], dtype: str) -> "_Segment":
+        """Segment from Pinecone-style records ({"id", "values", "metadata"})."""
+        vectors = _unit_rows([r["values"] for r in records])
+        scales = None
+        if dtype == "int8":
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            vectors = np.round(vectors / scales[:, None]).astype(np.int8)
+            scales = scales.astype(np.float32)
+        else:
+            vectors = vectors.astype(np.float16)
+
+        parts: List[bytes] = []
+        offsets = np.zeros(2 * len(records) + 1, dtype=np.int64)
+        pos = 0
+        for i, r in enumerate(records):
+            m = r.get("metadata") or {}
+            for j, text in enumerate((m.get("question", ""), m.get("answer", ""))):
+                data = (text or "").encode("utf-8")
+                parts.append(data)
+                pos += len(data)
+                offsets[2 * i + j + 1] = pos
+        ids = [
+            [r["id"], *((r.get("metadata") or {}).get(k) for k in ("row_id", "chunk_id", "category"))]
+            for r in records
+        ]
+        return cls(ids, vectors, scales, offsets, b"".join(parts))
+
+    @classmethod
+    def load(cls, path: str) -> "_Segment":
+        with open(os.path.join(path, "ids.json"), "r", encoding="utf-8") as f:
+            ids = json.load(f)
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        scales_file = os.path.join(path, "scales.npy")
+        scales = np.load(scales_file, mmap_mode="r") if os.path.exists(scales_file) else None
+        offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        texts: object = b""
+        with open(os.path.join(path, "texts.bin"), "rb") as f:
+            if os.fstat(f.fileno()).st_size:  # empty files cannot be mapped
+                texts = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return cls(ids, vectors, scales, offsets, texts)
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        if self.scales is not None:
+            np.save(os.path.join(path, "scales.npy"), self.scales)
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        with open(os.path.join(path, "texts.bin"), "wb") as f:
+            f.write(self.texts)
+        with open(os.path.join(path, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.ids, f, ensure_ascii=False)
+
+    def text(self, i: int, field: int) -> str:
+        """field 0 = question, 1 = answer; decoded straight from the mapped blob."""
+        start, end = int(self.offsets[2 * i + field]), int(self.offsets[2 * i + field + 1])
+        return str(self.texts[start:end], "utf-8")
+
+    def vector_rows(self, rows: List[int]) -> np.ndarray:
+        v = np.asarray(self.vectors[rows], dtype=np.float32)
+        return v * self.scales[rows][:, None] if self.scales is not None else v
+
+    def category(self, i: int) -> Optional[str]:
+        return self.ids[i][3] if len(self.ids[i]) > 3 else None
+
+    def record(self, i: int) -> Dict:
+        """Pinecone-style record (dequantized vector), used when compacting."""
+        rec_id, row_id, chunk_id = self.ids[i][:3]
+        metadata = {"question": self.text(i, 0), "answer": self.text(i, 1), "row_id": row_id, "chunk_id": chunk_id}
+        if self.category(i):
+            metadata["category"] = self.category(i)
+        return {"id": rec_id, "values": self.vector_rows([i])[0], "metadata": metadata}
+
+
+# ------------------ STORE ------------------
+
+class ChunkStore:
+    """
+    Local copy of the ingested chunks: texts plus normalized vectors.
+
+    Vector queries only need to return ids and scores; `hydrate` turns them
+    into doc dicts from the memory-mapped segments, and `vectors_for` gives
+    the chunk embeddings without re-encoding. Like BM25Index, writes go to
+    append-only segments (`flush`), re-upserted ids shadow older copies,
+    `delete` records tombstones and `compact` merges everything into one segment.
+
+    A reader (the app) checks the manifest every `refresh_s` seconds and
+    reloads when ingestion has written a new one, so re-ingested chunks are
+    not served with their old texts. Reads use one `_view` snapshot, which a
+    reload replaces in a single assignment. `compact` keeps the segments it
+    replaced for one more generation (listed as "retired" in the manifest), so
+    a reader still loading the previous manifest finds them; a reload that
+    misses a segment anyway keeps the current view and retries at the next check.
+    """
+
+    def __init__(
+        self,
+        path=None,
+        dtype: str = CHUNK_STORE_DTYPE,
+        max_buffer_chunks: int = 50_000,
+        refresh_s: float = CHUNK_STORE_REFRESH_S,
+    ):
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown CHUNK_STORE_DTYPE: {dtype!r} (expected one of {DTYPES})")
+        self.path = str(path) if path is not None else None
+        self.dtype = dtype
+        self.max_buffer_chunks = max_buffer_chunks
+
+        self._segments: List[_Segment] = []
+        self._segment_names: List[str] = []
+        self._live: Dict[str, Tuple[int, int]] = {}  # chunk id -> (segment, local index)
+        self._buffer: Dict[str, Dict] = {}
+        self._next_segment = 0
+        self._retired: List[str] = []  # segments replaced by the last compaction, deleted by the next
+        self._view = (self._segments, self._live)
+
+        self.refresh_s = refresh_s
+        self._manifest_stat: Optional[Tuple[int, int]] = None
+        self._checked = time.monotonic()
+        self._refresh_lock = threading.Lock()
+
+        if self.path and os.path.exists(os.path.join(self.path, "manifest.json")):
+            self._load()
+
+    # --------- PERSISTENCE ---------
+    def _stat_manifest(self) -> Optional[Tuple[int, int]]:
+        """(inode, mtime) of the manifest; every write replaces the file, so both change."""
+        try:
+            st = os.stat(os.path.join(self.path, "manifest.json"))
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def _load(self, loaded: Optional[Dict[str, _Segment]] = None) -> None:
+        """
+        Read the manifest; segments in `loaded` (immutable on disk) are reused, not re-read.
+        Nothing changes if a segment is missing (FileNotFoundError).
+        """
+        stat = self._stat_manifest()
+        with open(os.path.join(self.path, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        segments = []
+        for name in manifest["segments"]:
+            if loaded and name in loaded:
+                seg = copy.copy(loaded[name])
+                seg.deleted = np.zeros(len(seg.ids), dtype=bool)
+            else:
+                seg = _Segment.load(os.path.join(self.path, name))
+            for local in manifest.get("deleted", {}).get(name, []):
+                seg.deleted[local] = True
+            segments.append((name, seg))
+
+        self._segments, self._segment_names, self._live = [], [], {}
+        self._next_segment = manifest.get("next_segment", len(manifest["segments"]))
+        self._retired = manifest.get("retired", [])
+        for name, seg in segments:
+            self._attach(name, seg)
+        self._view = (self._segments, self._live)
+        self._manifest_stat = stat
+
+    def refresh(self) -> bool:
+        """Reload if the manifest changed since it was read (e.g. ingestion ran); True if it did."""
+        if not self.path or self._buffer:
+            return False
+        with self._refresh_lock:
+            stat = self._stat_manifest()
+            if stat is None or stat == self._manifest_stat:
+                return False
+            try:
+                self._load(loaded=dict(zip(self._segment_names, self._segments)))
+            except FileNotFoundError as e:  # compacted again while loading: retry at the next check
+                print(f"⚠️ Chunk store changed while reloading ({e}); keeping the current chunks.")
+                return False
+        print(f"🔄 Chunk store changed on disk; reloaded {self.num_chunks} chunks.")
+        return True
+
+    def _maybe_refresh(self) -> None:
+        if self.refresh_s and time.monotonic() - self._checked >= self.refresh_s:
+            self._checked = time.monotonic()
+            self.refresh()
+
+    def _attach(self, name: str, seg: _Segment) -> None:
+        seg_idx = len(self._segments)
+        self._segments.append(seg)
+        self._segment_names.append(name)
+        for local, entry in enumerate(seg.ids):
+            if seg.deleted[local]:
+                continue
+            rec_id = entry[0]
+            prev = self._live.get(rec_id)
+            if prev is not None:  # newer copy shadows the older one
+                self._segments[prev[0]].deleted[prev[1]] = True
+            self._live[rec_id] = (seg_idx, local)
+
+    def _write_manifest(self) -> None:
+        manifest = {
+            "next_segment": self._next_segment,
+            "dtype": self.dtype,
+            "segments": self._segment_names,
+            "retired": self._retired,
+            "deleted": {
+                name: np.flatnonzero(seg.deleted).tolist()
+                for name, seg in zip(self._segment_names, self._segments)
+                if seg.deleted.any()
+            },
+        }
+        tmp_path = os.path.join(self.path, "manifest.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(self.path, "manifest.json"))
+
+    # --------- WRITE ---------
+    @property
+    def num_chunks(self) -> int:
+        return len(self._live) + len(self._buffer)
+
+    @property
+    def num_segments(self) -> int:
+        return len(self._segments)
+
+    def upsert(self, records: List[Dict]) -> None:
+        """Add or replace chunks given as upsert records ({"id", "values", "metadata"})."""
+        for r in records:
+            self._buffer[r["id"]] = r
+        if len(self._buffer) >= self.max_buffer_chunks:
+            self.flush()
+
+    def delete(self, ids: List[str]) -> None:
+        for rec_id in ids:
+            self._buffer.pop(rec_id, None)
+            loc = self._live.pop(rec_id, None)
+            if loc is not None:
+                self._segments[loc[0]].deleted[loc[1]] = True
+
+    def flush(self) -> None:
+        """Write buffered chunks as a new segment and persist tombstones."""
+        if self._buffer:
+            seg = _Segment.build(list(self._buffer.values()), self.dtype)
+            self._buffer = {}
+            name = f"seg-{self._next_segment:05d}"
+            self._next_segment += 1
+            if self.path:
+                seg.save(os.path.join(self.path, name))
+                seg = _Segment.load(os.path.join(self.path, name))
+            self._attach(name, seg)
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            self._write_manifest()
+
+    def compact(self) -> None:
+        """
+        Merge all live chunks into one segment. The replaced segments are deleted
+        by the next compaction, once no reader can still be loading them.
+        """
+        self.flush()
+        records = [self._segments[s].record(l) for s, l in self._live.values()]
+        expired, self._retired = self._retired, list(self._segment_names)
+        self._segments, self._segment_names, self._live = [], [], {}
+        self._view = (self._segments, self._live)
+        self._buffer = {r["id"]: r for r in records}
+        self.flush()
+        if self.path:
+            for name in expired:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    # --------- READ ---------
+    def __contains__(self, rec_id: str) -> bool:
+        return rec_id in self._view[1]
+
+    def hydrate(self, matches: List[Tuple[str, float]]) -> Optional[List[Dict]]:
+        """Doc dicts for (id, score) matches, or None if any id is not in the store."""
+        self._maybe_refresh()
+        segments, live = self._view
+        docs = []
+        for rec_id, score in matches:
+            loc = live.get(rec_id)
+            if loc is None:
+                return None
+            seg, i = segments[loc[0]], loc[1]
+            _, row_id, chunk_id = seg.ids[i][:3]
+            docs.append({
+                "question": seg.text(i, 0),
+                "answer": seg.text(i, 1),
+                "row_id": row_id,
+                "chunk_id": chunk_id,
+                "category": seg.category(i) or None,
+                "score": float(score),
+            })
+        return docs
+
+    def vectors_for(self, docs: List[Dict]) -> Optional[np.ndarray]:
+        """Stored (unit) vectors of docs, matched on row_id/chunk_id; None if any is missing."""
+        segments, live = self._view
+        locs = [live.get(f"{d.get('row_id')}-{d.get('chunk_id')}") for d in docs]
+        if not locs or any(loc is None for loc in locs):
+            return None
+        out = None
+        for seg_idx in {s for s, _ in locs}:
+            positions = [p for p, (s, _) in enumerate(locs) if s == seg_idx]
+            rows = segments[seg_idx].vector_rows([locs[p][1] for p in positions])
+            if out is None:
+                out = np.empty((len(locs), rows.shape[1]), dtype=np.float32)
+            out[positions] = rows
+        return out
+
+
+def chunk_store_path(backend: str = VECTOR_BACKEND):
+    """Chunk store mirroring the chunks of one vector backend."""
+    return VECTORSTORE_DIR / f"chunks_{backend}"
+
+
+def load_chunk_store(path) -> Optional[ChunkStore]:
+    """The chunk store at `path`, or None if ingestion has not written one."""
+    if not os.path.exists(os.path.join(str(path), "manifest.json")):
+        return None
+    with open(os.path.join(str(path), "manifest.json"), "r", encoding="utf-8") as f:
+        dtype = json.load(f).get("dtype", CHUNK_STORE_DTYPE)
+    return ChunkStore(path, dtype=dtype)
@@ -0,0 +1,186 @@
+# chunking.py
+
+import re
+import json
+import time
+import argparse
+from typing import List, Tuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import (
+    FAQS_FILE,
+    EMBEDDING_MODEL_NAME,
+    CHUNK_TOKENIZER,
+    CHUNK_MAX_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+)
+
+WORD_RE = re.compile(r"\S+")
+LABEL_COLUMNS = ("category", "intent")  # carried from source rows to their chunks
+
+
+class TokenChunker:
+    """
+    Splits texts into windows of at most `max_tokens` tokens, consecutive
+    windows sharing `overlap` tokens.
+
+    With a tokenizer name, the whole batch goes through the model's fast
+    (Rust) tokenizer in one call (`return_overflowing_tokens` + `stride`),
+    and chunks are cut from the original text by character offsets, so no
+    decode round-trip changes the wording. `"words"` uses whitespace words.
+    Every text yields at least one chunk (an empty text yields "").
+    """
+
+    def __init__(
+        self,
+        tokenizer_name: str = CHUNK_TOKENIZER or EMBEDDING_MODEL_NAME,
+        max_tokens: int = CHUNK_MAX_TOKENS,
+        overlap: int = CHUNK_OVERLAP_TOKENS,
+    ):
+        if max_tokens <= 0 or not 0 <= overlap < max_tokens:
+            raise ValueError(
+                f"Chunking needs 0 <= CHUNK_OVERLAP_TOKENS < CHUNK_MAX_TOKENS (got {overlap} and {max_tokens})."
+            )
+        self.tokenizer_name = tokenizer_name
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.tokenizer = None
+        if tokenizer_name != "words":
+            from transformers import AutoTokenizer
+
+            self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, use_fast=True)
+            if not self.tokenizer.is_fast:
+                raise ValueError(f"{tokenizer_name} has no fast tokenizer; set CHUNK_TOKENIZER=words.")
+
+    def split(self, texts: List[str]) -> Tuple[np.ndarray, List[str]]:
+        """(source index per chunk, chunk texts), in source order."""
+        if self.tokenizer is None:
+            return self._split_words(texts)
+        if not texts:
+            return np.zeros(0, dtype=np.int64), []
+        enc = self.tokenizer(
+            texts,
+            add_special_tokens=False,
+            truncation=True,
+            max_length=self.max_tokens,
+            stride=self.overlap,
+            return_overflowing_tokens=True,
+            return_offsets_mapping=True,
+        )
+        sources = np.asarray(enc["overflow_to_sample_mapping"], dtype=np.int64)
+        chunks = [
+            texts[s][offsets[0][0]:offsets[-1][1]] if offsets else ""
+            for s, offsets in zip(sources.tolist(), enc["offset_mapping"])
+        ]
+        return sources, chunks
+
+    def _split_words(self, texts: List[str]) -> Tuple[np.ndarray, List[str]]:
+        step = self.max_tokens - self.overlap
+        sources: List[int] = []
+        chunks: List[str] = []
+        for i, text in enumerate(texts):
+            spans = [m.span() for m in WORD_RE.finditer(text)]
+            if not spans:
+                sources.append(i)
+                chunks.append("")
+                continue
+            for start in range(0, max(len(spans) - self.overlap, 1), step):
+                window = spans[start:start + self.max_tokens]
+                sources.append(i)
+                chunks.append(text[window[0][0]:window[-1][1]])
+        return np.asarray(sources, dtype=np.int64), chunks
+
+
+_default_chunker: Optional[TokenChunker] = None
+
+
+def default_chunker() -> TokenChunker:
+    """Shared chunker built from the CHUNK_* settings (the tokenizer loads once)."""
+    global _default_chunker
+    if _default_chunker is None:
+        _default_chunker = TokenChunker()
+    return _default_chunker
+
+
+def build_chunks(df: pd.DataFrame, chunker: Optional[TokenChunker] = None) -> pd.DataFrame:
+    """
+    Columnar chunk table for a batch of rows (index = row id): one row per chunk
+    with row_id, chunk_id, question and answer_chunk (plus the row's category and
+    intent, when present), ready for batched embedding.
+    """
+    chunker = chunker or default_chunker()
+    answers = df["answer"].fillna("").astype(str).tolist()
+    sources, chunks = chunker.split(answers)
+    # chunk_id restarts at 0 for every source row (sources are sorted)
+    first = np.searchsorted(sources, sources, side="left")
+    out = pd.DataFrame({
+        "row_id": df.index.to_numpy()[sources],
+        "chunk_id": np.arange(len(sources)) - first,
+        "question": df["question"].to_numpy()[sources],
+        "answer_chunk": chunks,
+    })
+    for col in LABEL_COLUMNS:
+        if col in df:
+            out[col] = df[col].fillna("").astype(str).to_numpy()[sources]
+    return out
+
+
+# ------------------ BENCHMARK ------------------
+
+def legacy_build_chunks(df: pd.DataFrame) -> pd.DataFrame:
+    """The previous row-by-row chunker (80-word pieces, no overlap), kept for comparison."""
+    rows = []
+    for i, row in df.iterrows():
+        a = row["answer"]
+        if len(a) <= 80:  # characters, while pieces are counted in words
+            pieces = [a]
+        else:
+            words = a.split()
+            pieces = [" ".join(words[j:j + 80]) for j in range(0, len(words), 80)]
+        for idx, ch in enumerate(pieces):
+            rows.append({"row_id": i, "chunk_id": idx, "question": row["question"], "answer_chunk": ch})
+    return pd.DataFrame(rows)
+
+
+def _corpus(rows: int, bitext: bool) -> pd.DataFrame:
+    if bitext:
+        from ingest_to_pinecone import load_bitext_dataset
+
+        df = load_bitext_dataset()
+    else:
+        with open(FAQS_FILE, "r", encoding="utf-8") as f:
+            faqs = json.load(f)
+        df = pd.DataFrame({"question": [x["question"] for x in faqs], "answer": [x["answer"] for x in faqs]})
+    reps = -(-rows // max(len(df), 1))
+    df = pd.concat([df] * reps, ignore_index=True).iloc[:rows]
+    return df
+
+
+def compare(rows: int = 100_000, bitext: bool = False, batch_rows: int = 512, chunker: Optional[TokenChunker] = None):
+    """Rows/sec of the legacy and columnar chunkers over the same rows, in ingestion-sized batches."""
+    df = _corpus(rows, bitext)
+    chunker = chunker or default_chunker()
+    report = {"rows": len(df), "batch_rows": batch_rows, "tokenizer": chunker.tokenizer_name,
+              "max_tokens": chunker.max_tokens, "overlap": chunker.overlap}
+    for name, fn in (("legacy", legacy_build_chunks), ("columnar", lambda b: build_chunks(b, chunker))):
+        start = time.perf_counter()
+        n_chunks = 0
+        for s in range(0, len(df), batch_rows):
+            n_chunks += len(fn(df.iloc[s:s + batch_rows]))
+        elapsed = time.perf_counter() - start
+        report[name] = {"seconds": round(elapsed, 3), "rows_per_s": round(len(df) / elapsed, 1), "chunks": n_chunks}
+    report["speedup"] = round(report["legacy"]["seconds"] / max(report["columnar"]["seconds"], 1e-9), 2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the columnar chunker against the legacy one.")
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows to chunk (the corpus is repeated).")
+    parser.add_argument("--bitext", action="store_true", help="Use the Bitext dataset instead of data/faqs.json.")
+    parser.add_argument("--batch-rows", type=int, default=512)
+    parser.add_argument("--tokenizer", default=CHUNK_TOKENIZER or EMBEDDING_MODEL_NAME, help='Or "words".')
+    args = parser.parse_args()
+
+    print(json.dumps(compare(args.rows, args.bitext, args.batch_rows, TokenChunker(args.tokenizer)), indent=2))
@@ -3,6 +3,11 @@
 import os
 from pathlib import Path
 
+from dotenv import load_dotenv
+
+# Load .env before any setting below reads the environment
+load_dotenv()
+
 # --------- PATHS ---------
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"
@@ -12,19 +17,206 @@ LOGS_DIR = BASE_DIR / "logs"
 FAQS_FILE = DATA_DIR / "faqs.json"
 FAISS_INDEX_FILE = VECTORSTORE_DIR / "faiss_index.bin"
 METADATA_FILE = VECTORSTORE_DIR / "metadata.json"
-ESCALATION_LOG = LOGS_DIR / "escalations.csv"
+ESCALATION_DB = LOGS_DIR / "escalations.db"
+ESCALATION_LOG = LOGS_DIR / "escalations.csv"  # legacy CSV log, imported into ESCALATION_DB once
 
 # Create directories if not exist
 for p in [DATA_DIR, VECTORSTORE_DIR, LOGS_DIR]:
     p.mkdir(parents=True, exist_ok=True)
 
 # --------- MODEL NAMES (all free) ---------
-EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
-GENERATIVE_MODEL_NAME = "google/flan-t5-base"
+# Override per deployment via the environment. The embedding model must match the one
+# the index was built with; SupportRAGPipeline checks the index fingerprint at startup.
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+GENERATIVE_MODEL_NAME = os.getenv("GENERATIVE_MODEL_NAME", "google/flan-t5-large")
+
+# Generator inference backend:
+# "fp32" (PyTorch default), "int8" (dynamic quantization), "bf16" (where the CPU/GPU supports it)
+# or "onnx" (ONNX Runtime export with KV-cache reuse, needs optimum[onnxruntime])
+GENERATOR_BACKEND = os.getenv("GENERATOR_BACKEND", "fp32")
+ONNX_MODEL_DIR = BASE_DIR / "models" / "onnx"
+
+# Startup: load the generator on a background thread so the UI and retriever come up first,
+# and optionally run one dummy generation so the first real request is not the slow one.
+GENERATOR_BACKGROUND_LOAD = os.getenv("GENERATOR_BACKGROUND_LOAD", "1") == "1"
+GENERATOR_WARMUP = os.getenv("GENERATOR_WARMUP", "1") == "1"
+
+# Worker-pool mode: N generator processes (0 = generate in-process). The weights are
+# loaded once and shared copy-on-write by the forked workers; each worker gets its own
+# slice of CPU threads (0 = cpu_count // GENERATOR_WORKERS).
+GENERATOR_WORKERS = int(os.getenv("GENERATOR_WORKERS", "0"))
+GENERATOR_THREADS_PER_WORKER = int(os.getenv("GENERATOR_THREADS_PER_WORKER", "0"))
+# "" = fork where available and safe (no torch or other threads yet), else fork the
+# workers from a forkserver-started bootstrap process
+GENERATOR_POOL_START_METHOD = os.getenv("GENERATOR_POOL_START_METHOD", "")
+# Seconds a pool caller waits beyond its job's time caps (queueing, IPC) before a
+# TimeoutError (0 = wait indefinitely)
+GENERATOR_POOL_TIMEOUT_S = float(os.getenv("GENERATOR_POOL_TIMEOUT_S", "30"))
+
+# Generation limits (tokens)
+GENERATOR_MAX_INPUT_TOKENS = int(os.getenv("GENERATOR_MAX_INPUT_TOKENS", "768"))
+GENERATOR_MAX_LENGTH = int(os.getenv("GENERATOR_MAX_LENGTH", "512"))  # max new tokens (full beam)
+GENERATOR_NUM_BEAMS = int(os.getenv("GENERATOR_NUM_BEAMS", "4"))
+
+# Decoding policy: "adaptive" picks greedy / short beam / full beam per request from the
+# question and context; "greedy", "short_beam" or "full_beam" pins one policy.
+DECODING_POLICY = os.getenv("DECODING_POLICY", "adaptive")
+GENERATOR_MAX_TIME_S = float(os.getenv("GENERATOR_MAX_TIME_S", "10"))  # wall-clock cap per generate call
+# Under load (this many generations in flight, or batches this large) step down one policy
+DECODING_SHED_LOAD = int(os.getenv("DECODING_SHED_LOAD", "2"))
 
 # Retrieval settings
-TOP_K = 5
-MAX_CONTEXT_CHARS = 2500  # to keep prompt size reasonable
+TOP_K = int(os.getenv("TOP_K", "5"))
+
+# Context assembly: chunks are deduplicated and picked by maximal marginal relevance
+# until the prompt reaches GENERATOR_MAX_INPUT_TOKENS (real T5 tokens).
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "10"))  # retrieved chunks to choose from
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "0"))  # extra cap on context tokens (0 = none)
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))  # 1.0 = relevance only
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.95"))  # cosine similarity
+
+# --------- EMBEDDING SERVICE ---------
+# Shared by the pipeline and ingestion: an LRU cache keyed by normalized text, concurrent
+# small encode calls coalesced into one batch, and a float16 disk cache (SQLite) so the
+# same corpus text is never encoded twice across runs. Only ingestion writes to the disk
+# cache; the app reads it, and user questions stay in memory.
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))  # texts kept in memory
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "2"))  # 0 = no coalescing
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+EMBEDDING_DISK_CACHE = os.getenv("EMBEDDING_DISK_CACHE", "1") == "1"
+EMBEDDING_DISK_CACHE_FILE = VECTORSTORE_DIR / "embedding_cache.db"
+
+# --------- INGESTION CHUNKING ---------
+# Answers are split into windows of CHUNK_MAX_TOKENS tokens of the embedding model's
+# tokenizer (so no chunk is truncated by the embedder), consecutive windows sharing
+# CHUNK_OVERLAP_TOKENS tokens. CHUNK_TOKENIZER="words" splits on whitespace instead.
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "")  # "" = EMBEDDING_MODEL_NAME
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "128"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "16"))
+
+# --------- VECTOR STORE ---------
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "supportsphere-better")
+PINECONE_NAMESPACE = os.getenv("PINECONE_NAMESPACE", "support")
+PINECONE_REGION = os.getenv("PINECONE_REGION", "us-east-1")
+
+# "pinecone" (managed) or "faiss" (local index memory-mapped from FAISS_INDEX_FILE)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+
+# FAISS variant written by ingestion: "flat" (exact), "ivf" or "hnsw" (approximate)
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "1024"))
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+
+# Local chunk store written by ingestion (VECTORSTORE_DIR/chunks_<target>): memory-mapped
+# vectors plus an offset-indexed text blob. Pinecone queries then return only ids and
+# scores, and texts are read locally. Vectors are kept as "float16" or "int8".
+CHUNK_STORE_ENABLED = os.getenv("CHUNK_STORE_ENABLED", "1") == "1"
+CHUNK_STORE_DTYPE = os.getenv("CHUNK_STORE_DTYPE", "float16")
+# How often (seconds) the app checks whether ingestion has rewritten the store or the
+# BM25 index (0 = never)
+CHUNK_STORE_REFRESH_S = float(os.getenv("CHUNK_STORE_REFRESH_S", "5"))
+
+# --------- VECTOR CLIENT ---------
+# Every Pinecone call goes through one VectorClient: a pooled HTTP connection
+# (PINECONE_POOL_THREADS connections), at most VECTOR_MAX_CONCURRENCY calls in
+# flight, a deadline per call (queries / writes, seconds, covering retries) and
+# up to VECTOR_MAX_RETRIES retries of transient errors (429, 5xx, connection
+# resets) with full-jitter exponential backoff starting at VECTOR_BACKOFF_S.
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "8"))
+VECTOR_MAX_CONCURRENCY = int(os.getenv("VECTOR_MAX_CONCURRENCY", "8"))
+VECTOR_QUERY_TIMEOUT_S = float(os.getenv("VECTOR_QUERY_TIMEOUT_S", "5"))
+VECTOR_WRITE_TIMEOUT_S = float(os.getenv("VECTOR_WRITE_TIMEOUT_S", "60"))
+VECTOR_MAX_RETRIES = int(os.getenv("VECTOR_MAX_RETRIES", "3"))
+VECTOR_BACKOFF_S = float(os.getenv("VECTOR_BACKOFF_S", "0.1"))
+# How long ensure_index waits for a newly created index to report ready
+PINECONE_READY_TIMEOUT_S = float(os.getenv("PINECONE_READY_TIMEOUT_S", "300"))
+
+# --------- CATEGORY ROUTING ---------
+# Chunks carry "category" (and Bitext "intent") metadata. A nearest-centroid
+# classifier over question embeddings (built by ingestion) routes a question to
+# one category when its best centroid scores at least CATEGORY_ROUTE_MIN_SCORE
+# and beats the runner-up by CATEGORY_ROUTE_MIN_MARGIN; otherwise (and when the
+# category has no chunks) the whole index is searched. A category picked in
+# the UI always applies. With CATEGORY_NAMESPACES=1, Pinecone ingestion writes
+# each category to its own namespace ("<PINECONE_NAMESPACE>__<category>")
+# instead of filtering on metadata; unrouted queries then fan out to all of them.
+# Switching it on or off moves the existing chunks at the next ingestion.
+CATEGORY_ROUTING = os.getenv("CATEGORY_ROUTING", "1") == "1"
+CATEGORY_ROUTE_MIN_SCORE = float(os.getenv("CATEGORY_ROUTE_MIN_SCORE", "0.45"))
+CATEGORY_ROUTE_MIN_MARGIN = float(os.getenv("CATEGORY_ROUTE_MIN_MARGIN", "0.05"))
+CATEGORY_SAMPLES = int(os.getenv("CATEGORY_SAMPLES", "256"))  # questions per category centroid
+CATEGORY_NAMESPACES = os.getenv("CATEGORY_NAMESPACES", "0") == "1"
+
+# --------- HYBRID RETRIEVAL ---------
+# BM25 over the same chunks (built by ingestion), fused with dense results by
+# reciprocal-rank fusion. Ignored when no sparse index has been built.
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # per retriever, before fusion
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# --------- RERANKING ---------
+# Optional cross-encoder pass over a larger candidate pool. If even the best candidate
+# scores below RERANKER_ESCALATE_BELOW, generation is skipped and the question is escalated.
+RERANKER_ENABLED = os.getenv("RERANKER_ENABLED", "0") == "1"
+RERANKER_MODEL_NAME = os.getenv("RERANKER_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANKER_CANDIDATES = int(os.getenv("RERANKER_CANDIDATES", "20"))
+RERANKER_BATCH_SIZE = int(os.getenv("RERANKER_BATCH_SIZE", "16"))
+RERANKER_BUDGET_MS = float(os.getenv("RERANKER_BUDGET_MS", "150"))  # per question
+RERANKER_ESCALATE_BELOW = float(os.getenv("RERANKER_ESCALATE_BELOW", "0.05"))  # sigmoid score, 0 = never
+
+# --------- FAQ FAST PATH ---------
+# Questions that closely match a curated FAQ in data/faqs.json get its answer
+# directly, without retrieval or generation.
+FAQ_FAST_PATH = os.getenv("FAQ_FAST_PATH", "1") == "1"
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.9"))  # cosine similarity
+FAQ_EMBEDDINGS_FILE = VECTORSTORE_DIR / "faq_embeddings.npz"
+
+# --------- ANSWER CACHE ---------
+# Semantic cache in front of generation: a question whose embedding is close enough
+# to a previously answered one (same tone) reuses the stored answer.
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # cosine similarity
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+ANSWER_CACHE_MAX_MB = float(os.getenv("ANSWER_CACHE_MAX_MB", "64"))
+ANSWER_CACHE_PERSIST = os.getenv("ANSWER_CACHE_PERSIST", "0") == "1"
+ANSWER_CACHE_FILE = VECTORSTORE_DIR / "answer_cache.npz"
+
+# --------- CONVERSATION SESSIONS ---------
+# Per-conversation retrieval state: a rolling embedding of the recent questions and
+# the last retrieved candidates. A question close to the rolling embedding reuses the
+# candidates; a follow-up ("what about that?") re-queries with the blended embedding;
+# anything else is a topic shift and starts over.
+SESSION_ENABLED = os.getenv("SESSION_ENABLED", "1") == "1"
+SESSION_REUSE_THRESHOLD = float(os.getenv("SESSION_REUSE_THRESHOLD", "0.8"))  # cosine similarity
+SESSION_FOLLOWUP_THRESHOLD = float(os.getenv("SESSION_FOLLOWUP_THRESHOLD", "0.2"))
+SESSION_ROLLING_WEIGHT = float(os.getenv("SESSION_ROLLING_WEIGHT", "0.5"))  # weight of the past per turn
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "3"))  # questions kept / read from history
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_IDLE_SECONDS = int(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+
+# --------- ESCALATIONS ---------
+# Queue escalation writes to a background thread that inserts them in batches
+ESCALATION_ASYNC_WRITES = os.getenv("ESCALATION_ASYNC_WRITES", "0") == "1"
+
+# --------- METRICS / TRACING ---------
+# Per-stage latency histograms (exported by server.py at /metrics) and, optionally,
+# one JSON line per answered request in TRACE_LOG_FILE.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_JSON_LOG = os.getenv("METRICS_JSON_LOG", "0") == "1"
+TRACE_LOG_FILE = LOGS_DIR / "traces.jsonl"
+
+# --------- HTTP API (server.py) ---------
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+# Micro-batching: concurrent requests are coalesced into one model call
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "15"))
+# Largest `top_k` a /retrieve request may ask for (larger values are clamped)
+SERVER_MAX_TOP_K = int(os.getenv("SERVER_MAX_TOP_K", "50"))
 
 # App
 APP_TITLE = "SupportSphere – AI Support Assistant"
@@ -0,0 +1,179 @@
+# context_builder.py
+
+from typing import Callable, List, Dict, Optional
+
+import numpy as np
+
+from config import (
+    GENERATIVE_MODEL_NAME,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_MMR_LAMBDA,
+    CONTEXT_DEDUP_THRESHOLD,
+)
+
+MIN_TRUNCATED_TOKENS = 32  # below this, a truncated chunk is not worth including
+MIN_OVERLAP_CHARS = 8  # shorter shared text between adjacent chunks is treated as coincidence
+
+
+def _join_overlapping(left: str, right: str) -> str:
+    """Join consecutive chunks, dropping the overlap ingestion left between them."""
+    for k in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:k]):
+            return left + right[k:]
+    return f"{left} {right}"
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    m = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.maximum(norms, 1e-12)
+
+
+class ContextBuilder:
+    """
+    Assembles the prompt context from retrieved chunks within a token budget.
+
+    1. Drops near-duplicate chunks (cosine similarity of their embeddings).
+    2. Orders the rest by maximal marginal relevance to the question.
+    3. Takes chunks in that order while they fit the budget (real T5 tokens).
+    4. Merges consecutive `chunk_id`s of the same `row_id` back into one passage
+       (without repeating the text that overlapping chunks share).
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[List[str]], np.ndarray],
+        tokenizer=None,
+        tokenizer_name: str = GENERATIVE_MODEL_NAME,
+        mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+        dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+        max_tokens: int = CONTEXT_MAX_TOKENS,
+        doc_vectors: Optional[Callable[[List[Dict]], Optional[np.ndarray]]] = None,
+    ):
+        self.embed = embed
+        self.doc_vectors = doc_vectors  # stored chunk vectors (None if unknown -> embed the texts)
+        self._tokenizer = tokenizer
+        self.tokenizer_name = tokenizer_name
+        self.mmr_lambda = mmr_lambda
+        self.dedup_threshold = dedup_threshold
+        self.max_tokens = max_tokens
+
+    @property
+    def tokenizer(self):
+        """Fast tokenizer of the generator, loaded on first use (same vocabulary as T5Tokenizer)."""
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+        return self._tokenizer
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        return [len(ids) for ids in self.tokenizer(texts, add_special_tokens=False)["input_ids"]]
+
+    # --------- SELECTION ---------
+    def _dedup(self, vecs: np.ndarray, texts: List[str]) -> List[int]:
+        """Indexes to keep, in retrieval order, skipping near-duplicates of earlier chunks."""
+        keep: List[int] = []
+        seen = set()
+        for i, text in enumerate(texts):
+            if text in seen:
+                continue
+            if keep and float(np.max(vecs[keep] @ vecs[i])) >= self.dedup_threshold:
+                continue
+            seen.add(text)
+            keep.append(i)
+        return keep
+
+    def _mmr_order(self, q: np.ndarray, vecs: np.ndarray, candidates: List[int]) -> List[int]:
+        relevance = vecs @ q
+        order: List[int] = []
+        max_sim = np.full(len(vecs), -np.inf, dtype=np.float32)
+        remaining = list(candidates)
+        while remaining:
+            if order:
+                scores = [
+                    self.mmr_lambda * relevance[i] - (1 - self.mmr_lambda) * max_sim[i]
+                    for i in remaining
+                ]
+            else:
+                scores = [relevance[i] for i in remaining]
+            best = remaining.pop(int(np.argmax(scores)))
+            order.append(best)
+            max_sim = np.maximum(max_sim, vecs @ vecs[best])
+        return order
+
+    def _truncate(self, text: str, n_tokens: int) -> str:
+        ids = self.tokenizer(text, add_special_tokens=False)["input_ids"][:n_tokens]
+        return self.tokenizer.decode(ids, skip_special_tokens=True).strip()
+
+    # --------- ASSEMBLY ---------
+    def build(self, q_vec, docs: List[Dict], budget_tokens: int) -> str:
+        """Context string for `docs` that fits in `budget_tokens`."""
+        if self.max_tokens:
+            budget_tokens = min(budget_tokens, self.max_tokens)
+        docs = [d for d in docs if (d.get("answer") or "").strip()]
+        if not docs or budget_tokens <= 0:
+            return ""
+
+        texts = [d["answer"].strip() for d in docs]
+        stored = self.doc_vectors(docs) if self.doc_vectors is not None else None
+        vecs = _unit_rows(stored if stored is not None else self.embed(texts))
+        q = _unit_rows([np.asarray(q_vec).ravel()])[0]
+
+        order = self._mmr_order(q, vecs, self._dedup(vecs, texts))
+        lengths = self.count_tokens([texts[i] for i in order])
+
+        selected: List[int] = []
+        pieces: Dict[int, str] = {}
+        used = 0
+        for i, n in zip(order, lengths):
+            cost = n + 1  # separator
+            if used + cost <= budget_tokens:
+                selected.append(i)
+                pieces[i] = texts[i]
+                used += cost
+            elif not selected and budget_tokens - 1 >= MIN_TRUNCATED_TOKENS:
+                # Nothing fits whole: keep the most relevant chunk, cut to the budget
+                selected.append(i)
+                pieces[i] = self._truncate(texts[i], budget_tokens - 1)
+                break
+        return "\n\n".join(self._merge_adjacent(docs, selected, pieces))
+
+    @staticmethod
+    def _merge_adjacent(docs: List[Dict], selected: List[int], pieces: Dict[int, str]) -> List[str]:
+        """
+        Join consecutive chunks of the same source row (in chunk order) into one
+        passage; passages keep the rank of their best chunk.
+        """
+        groups: Dict = {}
+        for i in selected:
+            key = docs[i].get("row_id")
+            if key is None:
+                key = ("__doc__", i)
+            groups.setdefault(key, []).append(i)
+
+        passages = []
+        for members in groups.values():
+            members.sort(key=lambda i: (docs[i].get("chunk_id") or 0))
+            run = [members[0]]
+            for i in members[1:]:
+                prev = docs[run[-1]].get("chunk_id")
+                cur = docs[i].get("chunk_id")
+                if prev is not None and cur is not None and int(cur) == int(prev) + 1:
+                    run.append(i)
+                else:
+                    passages.append((min(selected.index(j) for j in run), ContextBuilder._join_run(run, pieces)))
+                    run = [i]
+            passages.append((min(selected.index(j) for j in run), ContextBuilder._join_run(run, pieces)))
+
+        passages.sort(key=lambda p: p[0])
+        return [text for _, text in passages]
+
+    @staticmethod
+    def _join_run(run: List[int], pieces: Dict[int, str]) -> str:
+        text = pieces[run[0]]
+        for j in run[1:]:
+            text = _join_overlapping(text, pieces[j])
+        return text
@@ -0,0 +1,95 @@
+# decoding_policy.py
+
+import re
+from typing import Dict
+
+from config import (
+    DECODING_POLICY,
+    GENERATOR_MAX_LENGTH,
+    GENERATOR_NUM_BEAMS,
+    GENERATOR_MAX_TIME_S,
+    DECODING_SHED_LOAD,
+)
+
+# Cheapest first; shedding load steps towards index 0
+POLICIES = ("greedy", "short_beam", "full_beam")
+
+# Wording that usually calls for a longer, multi-part answer
+COMPLEX_RE = re.compile(
+    r"\b(why|explain|difference|compare|versus|vs|troubleshoot|not working|error|failed|"
+    r"several|multiple|both|also|still|again)\b",
+    re.IGNORECASE,
+)
+
+
+def make_plan(policy: str, max_time_s: float = GENERATOR_MAX_TIME_S) -> Dict:
+    """
+    Generation settings for one policy (deterministic decoding; no sampling knobs).
+    `max_time_s=0` means no wall-clock cap. Generators set "time_capped" on the plan
+    once it has run: True when the `max_time` cap stopped generation, so the answer
+    may be cut off. Each prompt therefore needs a plan dict of its own.
+    """
+    if policy == "greedy":
+        num_beams, max_new_tokens = 1, min(256, GENERATOR_MAX_LENGTH)
+    elif policy == "short_beam":
+        num_beams, max_new_tokens = min(2, GENERATOR_NUM_BEAMS), min(384, GENERATOR_MAX_LENGTH)
+    elif policy == "full_beam":
+        num_beams, max_new_tokens = GENERATOR_NUM_BEAMS, GENERATOR_MAX_LENGTH
+    else:
+        raise ValueError(f"Unknown decoding policy: {policy!r} (expected one of {POLICIES})")
+    return {
+        "policy": policy,
+        "num_beams": num_beams,
+        "max_new_tokens": max_new_tokens,
+        "max_time": max_time_s,
+    }
+
+
+class DecodingPolicy:
+    """
+    Chooses how to decode each request.
+
+    Short, single-issue questions decode greedily; longer ones, or
+    multi-part ones with little context, get a 2-beam search; only long
+    questions, or multi-part ones over plenty of context, pay for the
+    full beam. The context is the one built for the prompt, which the
+    token budget usually fills, so its size alone never rules out
+    greedy decoding. Every plan
+    carries a wall-clock cap (`max_time`), and under load the adaptive
+    choice steps down one policy (two when the load is double the threshold).
+    """
+
+    def __init__(
+        self,
+        mode: str = DECODING_POLICY,
+        max_time_s: float = GENERATOR_MAX_TIME_S,
+        shed_load: int = DECODING_SHED_LOAD,
+    ):
+        if mode != "adaptive" and mode not in POLICIES:
+            raise ValueError(f"Unknown DECODING_POLICY: {mode!r} (expected 'adaptive' or one of {POLICIES})")
+        self.mode = mode
+        self.max_time_s = max_time_s
+        self.shed_load = shed_load
+
+    @staticmethod
+    def complexity(question: str, context: str = "") -> int:
+        """0 (simple), 1 (moderate) or 2 (complex) from question and context features."""
+        q_words = len(question.split())
+        ctx_words = len(context.split())
+        multi_part = bool(COMPLEX_RE.search(question)) or question.count("?") > 1
+
+        if q_words <= 12 and not multi_part:
+            return 0
+        if q_words <= 30 and not (multi_part and ctx_words > 150):
+            return 1
+        return 2
+
+    def plan(self, question: str, context: str = "", load: int = 0) -> Dict:
+        """Plan for one request; `load` counts generate calls in flight (a padded batch counts once)."""
+        if self.mode != "adaptive":
+            return make_plan(self.mode, self.max_time_s)
+
+        level = self.complexity(question, context)
+        if self.shed_load and load >= self.shed_load:
+            level -= 2 if load >= 2 * self.shed_load else 1
+        return make_plan(POLICIES[max(level, 0)], self.max_time_s)
@@ -0,0 +1,258 @@
+# embedding_service.py
+
+import os
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from config import (
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_BATCH_WINDOW_MS,
+    EMBEDDING_MAX_BATCH,
+    EMBEDDING_DISK_CACHE,
+    EMBEDDING_DISK_CACHE_FILE,
+)
+from metrics import metrics
+
+_SQL_VARS = 500  # keys per SELECT ... IN (...) (SQLite allows 999 parameters)
+
+
+def normalize_text(text: str) -> str:
+    """Cache key text: Unicode NFC with whitespace collapsed (what gets encoded, too)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingDiskCache:
+    """
+    Persistent float16 vectors in SQLite (WAL mode), keyed by a hash of
+    (model name, normalized text) so several models can share one file.
+    """
+
+    def __init__(self, path=EMBEDDING_DISK_CACHE_FILE, model_name: str = EMBEDDING_MODEL_NAME):
+        self.path = str(path)
+        self.model_name = model_name
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB) WITHOUT ROWID")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not shareable by default)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def key(self, text: str) -> str:
+        return hashlib.blake2b(f"{self.model_name}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+    def get_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        by_key = {self.key(t): t for t in texts}
+        keys = list(by_key)
+        found: Dict[str, np.ndarray] = {}
+        conn = self._conn()
+        for start in range(0, len(keys), _SQL_VARS):
+            part = keys[start:start + _SQL_VARS]
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({', '.join('?' for _ in part)})", part
+            )
+            for key, blob in rows:
+                found[by_key[key]] = np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+        return found
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        rows = [
+            (self.key(t), np.asarray(v, dtype=np.float16).tobytes())
+            for t, v in zip(texts, vectors)
+        ]
+        conn = self._conn()
+        with conn:  # one transaction for the whole batch
+            conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class EmbeddingService:
+    """
+    Sentence embeddings with caching and request coalescing, used wherever a
+    SentenceTransformer would be (`encode`, `get_sentence_embedding_dimension`).
+
+    - Texts are normalized (NFC, collapsed whitespace) before lookup and encoding.
+    - Lookups go to an in-memory LRU first, then the float16 disk cache; only the
+      remaining texts reach the model, and each distinct text is encoded once.
+      Newly encoded texts are written to disk only with `persist=True`
+      (ingestion), so user questions are never stored there.
+    - Small encode calls (e.g. one question per request) from concurrent threads
+      are collected for up to `batch_window_ms` and run as one forward pass;
+      larger calls (ingestion) are encoded directly in `batch_size` batches.
+
+    Vectors read from disk went through float16, so they can differ from freshly
+    encoded ones in the 4th decimal; cosine scores are unaffected in practice.
+    """
+
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL_NAME,
+        model=None,
+        cache_size: int = EMBEDDING_CACHE_SIZE,
+        batch_window_ms: float = EMBEDDING_BATCH_WINDOW_MS,
+        max_batch: int = EMBEDDING_MAX_BATCH,
+        disk_cache_path=EMBEDDING_DISK_CACHE_FILE if EMBEDDING_DISK_CACHE else None,
+        persist: bool = False,
+    ):
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+
+            model = SentenceTransformer(model_name)
+        self.model = model
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self.batch_window_s = batch_window_ms / 1000.0
+        self.max_batch = max_batch
+        self.disk = EmbeddingDiskCache(disk_cache_path, model_name) if disk_cache_path else None
+        self.persist = persist
+
+        self._lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lru_lock = threading.Lock()
+        self._requests: "queue.Queue" = queue.Queue()
+        self._batcher: Optional[threading.Thread] = None
+        self._batcher_lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.encoded = 0
+        self.batches = 0
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    # --------- ENCODE ---------
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True) -> np.ndarray:
+        """float32 array of shape (n, dim) (or (dim,) for a single string); always numpy."""
+        single = isinstance(sentences, str)
+        keys = [normalize_text(t) for t in ([sentences] if single else sentences)]
+        if not keys:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        found = self._from_memory(keys)
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        if missing and self.disk is not None:
+            from_disk = self.disk.get_many(missing)
+            if from_disk:
+                self.disk_hits += len(from_disk)
+                metrics.inc("embedding_texts_total", len(from_disk), source="disk")
+                self._remember(list(from_disk), list(from_disk.values()))
+                found.update(from_disk)
+                missing = [k for k in missing if k not in from_disk]
+
+        if missing:
+            if self.batch_window_s > 0 and len(missing) < self.max_batch:
+                vectors = self._encode_coalesced(missing)
+            else:
+                vectors = self._encode_model(missing, batch_size)
+            self._remember(missing, vectors)
+            if self.disk is not None and self.persist:
+                self.disk.put_many(missing, vectors)
+            found.update(zip(missing, vectors))
+
+        out = np.stack([found[k] for k in keys])
+        return out[0] if single else out
+
+    def _encode_model(self, texts: List[str], batch_size: int) -> np.ndarray:
+        with metrics.span("embed_model"):
+            vectors = np.asarray(
+                self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True), dtype=np.float32
+            )
+        self.encoded += len(texts)
+        self.batches += 1
+        metrics.inc("embedding_texts_total", len(texts), source="model")
+        return vectors
+
+    # --------- COALESCING ---------
+    def _encode_coalesced(self, texts: List[str]) -> np.ndarray:
+        if self._batcher is None:
+            with self._batcher_lock:
+                if self._batcher is None:
+                    self._batcher = threading.Thread(target=self._run_batches, name="embedding-batcher", daemon=True)
+                    self._batcher.start()
+        fut: Future = Future()
+        self._requests.put((texts, fut))
+        return fut.result()
+
+    def _run_batches(self) -> None:
+        while True:
+            batch = [self._requests.get()]
+            n = len(batch[0][0])
+            deadline = time.monotonic() + self.batch_window_s
+            while n < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                n += len(batch[-1][0])
+
+            texts = list(dict.fromkeys(t for req, _ in batch for t in req))
+            try:
+                vectors = self._encode_model(texts, batch_size=max(len(texts), 1))
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            row = {t: i for i, t in enumerate(texts)}
+            metrics.observe("embedding_batch_size", len(batch), buckets=(1, 2, 4, 8, 16, 32, 64))
+            for req, fut in batch:
+                fut.set_result(vectors[[row[t] for t in req]])
+
+    # --------- MEMORY CACHE ---------
+    def _from_memory(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        if not self.cache_size:
+            return found
+        with self._lru_lock:
+            for k in keys:
+                v = self._lru.get(k)
+                if v is not None:
+                    self._lru.move_to_end(k)
+                    found[k] = v
+        if found:
+            self.memory_hits += len(found)
+            metrics.inc("embedding_texts_total", len(found), source="memory")
+        return found
+
+    def _remember(self, keys: List[str], vectors) -> None:
+        if not self.cache_size:
+            return
+        with self._lru_lock:
+            for k, v in zip(keys, vectors):
+                self._lru[k] = v
+                self._lru.move_to_end(k)
+            while len(self._lru) > self.cache_size:
+                self._lru.popitem(last=False)
+
+    def stats(self) -> Dict:
+        lookups = self.memory_hits + self.disk_hits + self.encoded
+        return {
+            "memory_entries": len(self._lru),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "encoded": self.encoded,
+            "model_batches": self.batches,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,184 @@
+# escalation_store.py
+
+import os
+import csv
+import queue
+import atexit
+import sqlite3
+import threading
+from typing import List, Dict, Optional
+
+from config import ESCALATION_DB, ESCALATION_LOG, ESCALATION_ASYNC_WRITES
+
+COLUMNS = ("timestamp", "user_email", "user_question", "model_answer", "reason", "top_docs")
+_INSERT_SQL = (
+    f"INSERT INTO escalations ({', '.join(COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in COLUMNS)})"
+)
+
+
+class EscalationStore:
+    """
+    Append-only escalation log in SQLite (WAL mode).
+
+    Each write is a single INSERT, so it costs the same however long the
+    log gets, and concurrent Streamlit sessions (threads or processes)
+    never lose rows. Readers only fetch the rows they display.
+    """
+
+    def __init__(self, path=ESCALATION_DB, legacy_csv=ESCALATION_LOG):
+        self.path = str(path)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS escalations ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            + ", ".join(f"{c} TEXT" for c in COLUMNS)
+            + ")"
+        )
+        conn.commit()
+
+        if legacy_csv is not None:
+            self._import_csv(legacy_csv)
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections are not shareable by default)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # --------- WRITE ---------
+    def append(self, row: Dict) -> None:
+        self.append_many([row])
+
+    def append_many(self, rows: List[Dict]) -> None:
+        if not rows:
+            return
+        conn = self._conn()
+        with conn:  # one transaction for the whole batch
+            conn.executemany(_INSERT_SQL, [tuple(r.get(c, "") for c in COLUMNS) for r in rows])
+
+    def _import_csv(self, csv_path) -> None:
+        """One-time import of the CSV log written by earlier versions (only into an empty table)."""
+        if not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")  # serialize with other processes starting up
+        try:
+            if conn.execute("SELECT COUNT(*) FROM escalations").fetchone()[0] > 0:
+                conn.rollback()
+                return
+            with open(csv_path, "r", encoding="utf-8", newline="") as f:
+                rows = [tuple(r.get(c, "") for c in COLUMNS) for r in csv.DictReader(f)]
+            conn.executemany(_INSERT_SQL, rows)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        print(f"📥 Imported {len(rows)} escalations from {csv_path}.")
+
+    # --------- READ ---------
+    def tail(self, n: int = 10) -> List[Dict]:
+        """Most recent `n` escalations, oldest first."""
+        cur = self._conn().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM escalations ORDER BY id DESC LIMIT ?", (n,)
+        )
+        return [dict(r) for r in reversed(cur.fetchall())]
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM escalations").fetchone()[0]
+
+    def export_csv(self, csv_path) -> int:
+        """Write the full log to CSV (for spreadsheets / offline review)."""
+        cur = self._conn().execute(f"SELECT {', '.join(COLUMNS)} FROM escalations ORDER BY id")
+        n = 0
+        with open(csv_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            for r in cur:
+                writer.writerow(tuple(r))
+                n += 1
+        return n
+
+
+class BatchedEscalationWriter:
+    """
+    Background writer: `submit` returns immediately and a daemon thread
+    inserts queued rows in batches (one transaction per batch).
+    """
+
+    def __init__(self, store: EscalationStore, max_batch: int = 100, max_wait_s: float = 0.5):
+        self.store = store
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_s
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="escalation-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, row: Dict) -> None:
+        self._queue.put(row)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=self.max_wait_s)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self.store.append_many(batch)
+            except sqlite3.Error as e:
+                print(f"❌ Failed to write {len(batch)} escalations: {e}")
+            if stop:
+                return
+
+    def close(self) -> None:
+        """Flush queued rows and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+
+
+# ------------------ SHARED INSTANCE ------------------
+
+_store: Optional[EscalationStore] = None
+_writer: Optional[BatchedEscalationWriter] = None
+_init_lock = threading.Lock()
+
+
+def get_store() -> EscalationStore:
+    global _store
+    with _init_lock:
+        if _store is None:
+            _store = EscalationStore()
+        return _store
+
+
+def write_escalation(row: Dict) -> None:
+    """Append one escalation, in the background when ESCALATION_ASYNC_WRITES is on."""
+    global _writer
+    store = get_store()
+    if not ESCALATION_ASYNC_WRITES:
+        store.append(row)
+        return
+    with _init_lock:
+        if _writer is None:
+            _writer = BatchedEscalationWriter(store)
+    _writer.submit(row)
@@ -0,0 +1,127 @@
+# faq_matcher.py
+
+import os
+import json
+import hashlib
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+
+from config import (
+    FAQS_FILE,
+    FAQ_MATCH_THRESHOLD,
+    FAQ_EMBEDDINGS_FILE,
+    EMBEDDING_MODEL_NAME,
+)
+
+TONE_TEMPLATES = {
+    "Friendly": "Happy to help! 😊\n\n{answer}\n\nIf anything is still unclear, just let me know.",
+    "Formal": "{answer}\n\nPlease let us know if you need any further assistance.",
+}
+
+
+def format_faq_answer(answer: str, tone: str = "Friendly") -> str:
+    """Wrap a curated answer in a light, tone-specific opening and closing."""
+    return TONE_TEMPLATES.get(tone, "{answer}").format(answer=answer.strip())
+
+
+class FaqMatcher:
+    """
+    Exact-match fast path over the curated FAQs.
+
+    The FAQ questions are embedded once into a normalized matrix (cached in
+    FAQ_EMBEDDINGS_FILE and rebuilt only when the FAQs or the embedding model
+    change). A match is one matrix-vector product on the already computed
+    question embedding, so no retrieval or generation is needed.
+    """
+
+    def __init__(
+        self,
+        embedder,
+        faqs_file=FAQS_FILE,
+        threshold: float = FAQ_MATCH_THRESHOLD,
+        embeddings_file=FAQ_EMBEDDINGS_FILE,
+        model_name: str = EMBEDDING_MODEL_NAME,
+    ):
+        self.threshold = threshold
+        with open(faqs_file, "r", encoding="utf-8") as f:
+            self.faqs: List[Dict] = json.load(f)
+
+        questions = [x["question"] for x in self.faqs]
+        digest = hashlib.blake2b(
+            json.dumps([model_name, questions], ensure_ascii=False).encode("utf-8"), digest_size=8
+        ).hexdigest()
+
+        self.matrix = self._load(embeddings_file, digest)
+        if self.matrix is None:
+            vectors = np.asarray(embedder.encode(questions), dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            self.matrix = vectors / np.maximum(norms, 1e-12)
+            self._save(embeddings_file, digest)
+
+        self.hits = 0
+        self.misses = 0
+
+    # --------- PERSISTENCE ---------
+    @staticmethod
+    def _load(path, digest: str) -> Optional[np.ndarray]:
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["digest"]) != digest:
+                    return None
+                return data["matrix"].astype(np.float32)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save(self, path, digest: str) -> None:
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, matrix=self.matrix, digest=np.array(digest))
+        os.replace(tmp_path, path)
+
+    # --------- MATCH ---------
+    def match(self, vector) -> Optional[Tuple[Dict, float]]:
+        """Best FAQ and its cosine similarity, if it reaches the threshold."""
+        if len(self.faqs) == 0:
+            return None
+        q = np.asarray(vector, dtype=np.float32).ravel()
+        n = np.linalg.norm(q)
+        if n == 0:
+            return None
+        sims = self.matrix @ (q / n)
+        best = int(np.argmax(sims))
+        score = float(sims[best])
+        if score < self.threshold:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.faqs[best], score
+
+    def answer(self, vector, tone: str = "Friendly") -> Optional[Tuple[str, List[Dict]]]:
+        """(answer, docs) for a matching FAQ, in the same shape as the RAG answer."""
+        hit = self.match(vector)
+        if hit is None:
+            return None
+        faq, score = hit
+        doc = {
+            "question": faq["question"],
+            "answer": faq["answer"],
+            "category": faq.get("category", "FAQ"),
+            "row_id": f"faq-{faq['id']}",
+            "chunk_id": 0,
+            "score": score,
+        }
+        return format_faq_answer(faq["answer"], tone), [doc]
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "faqs": len(self.faqs),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
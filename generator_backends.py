@@ -0,0 +1,168 @@
+# generator_backends.py
+
+import json
+import time
+import argparse
+import difflib
+from typing import List, Dict
+
+import torch
+from transformers import T5ForConditionalGeneration
+
+from config import GENERATOR_BACKEND, ONNX_MODEL_DIR, FAQS_FILE
+from decoding_policy import make_plan
+
+BACKENDS = ("fp32", "int8", "bf16", "onnx")
+# CPU flags for native bf16 matmuls; plain AVX-512 only emulates bf16, which is slower than fp32
+BF16_CPU_FLAGS = ("avx512_bf16", "amx_bf16")
+
+
+# ------------------ LOADERS ------------------
+
+def _cpu_flags() -> set:
+    """Feature flags from /proc/cpuinfo (empty where it does not exist, e.g. macOS / Windows)."""
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+def bf16_supported() -> bool:
+    """True when bf16 matmuls are natively accelerated on this machine."""
+    if torch.cuda.is_available():
+        return torch.cuda.is_bf16_supported()
+    return any(flag in _cpu_flags() for flag in BF16_CPU_FLAGS)
+
+
+def _load_onnx(model_name: str):
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as e:
+        raise ImportError(
+            "The 'onnx' backend needs optimum with ONNX Runtime (pip install optimum[onnxruntime])."
+        ) from e
+
+    export_dir = ONNX_MODEL_DIR / model_name.replace("/", "__")
+    if export_dir.exists():
+        return ORTModelForSeq2SeqLM.from_pretrained(export_dir, use_cache=True)
+
+    # First run: export encoder, decoder and decoder-with-past (KV cache) once and keep them.
+    print(f"📦 Exporting {model_name} to ONNX (one-time)...")
+    model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True, use_cache=True)
+    model.save_pretrained(export_dir)
+    return model
+
+
+def load_generator_model(model_name: str, backend: str = GENERATOR_BACKEND):
+    """Load the seq2seq generator for the requested inference backend."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown generator backend: {backend!r} (expected one of {BACKENDS})")
+
+    if backend == "onnx":
+        return _load_onnx(model_name)
+
+    if backend == "bf16":
+        if bf16_supported():
+            return T5ForConditionalGeneration.from_pretrained(
+                model_name, torch_dtype=torch.bfloat16
+            ).eval()
+        print("⚠️ bf16 is not accelerated on this machine; falling back to fp32.")
+
+    model = T5ForConditionalGeneration.from_pretrained(model_name).eval()
+
+    if backend == "int8":
+        # Weights of every Linear layer stored as int8, activations quantized on the fly.
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    return model
+
+
+def model_size_mb(model) -> float:
+    """Approximate in-memory size of a PyTorch model's weights (0 for ONNX sessions)."""
+    if not isinstance(model, torch.nn.Module):
+        return 0.0
+    total = sum(t.numel() * t.element_size() for t in model.state_dict().values() if torch.is_tensor(t))
+    return total / (1024 * 1024)
+
+
+# ------------------ PARITY CHECK ------------------
+
+def _parity_prompts(n: int) -> List[str]:
+    """Realistic prompts built from the curated FAQs."""
+    from rag_pipeline import SupportRAGPipeline
+
+    with open(FAQS_FILE, "r", encoding="utf-8") as f:
+        faqs = json.load(f)
+    return [
+        SupportRAGPipeline._build_prompt(x["question"], x["answer"], "Formal")
+        for x in faqs[:n]
+    ]
+
+
+def _run(generator, prompts: List[str]) -> Dict:
+    answers, latencies = [], []
+    for p in prompts:
+        start = time.perf_counter()
+        # Uncapped: the slower backend must not be compared on answers the time cap cut short
+        answers.append(generator.generate(p, plan=make_plan("full_beam", max_time_s=0)))
+        latencies.append(time.perf_counter() - start)
+    return {"answers": answers, "latencies": latencies}
+
+
+def check_parity(backend: str, model_name: str = None, n_prompts: int = 8) -> Dict:
+    """
+    Compare a backend against the fp32 reference on the same prompts and
+    decoding settings (full beam, no time cap). Reports exact matches, mean
+    text similarity and speedup.
+    """
+    from rag_pipeline import GeneratorModel
+
+    prompts = _parity_prompts(n_prompts)
+
+    reference = GeneratorModel(model_name=model_name, backend="fp32")
+    ref = _run(reference, prompts)
+    ref_mb = model_size_mb(reference.model)
+    del reference
+
+    candidate = GeneratorModel(model_name=model_name, backend=backend)
+    cand = _run(candidate, prompts)
+    cand_mb = model_size_mb(candidate.model)
+
+    similarities = [
+        difflib.SequenceMatcher(None, a, b).ratio()
+        for a, b in zip(ref["answers"], cand["answers"])
+    ]
+    ref_time = sum(ref["latencies"])
+    cand_time = sum(cand["latencies"])
+    return {
+        "backend": backend,
+        "prompts": len(prompts),
+        "exact_match": sum(a == b for a, b in zip(ref["answers"], cand["answers"])) / len(prompts),
+        "mean_similarity": sum(similarities) / len(similarities),
+        "min_similarity": min(similarities),
+        "fp32_mean_latency_s": ref_time / len(prompts),
+        "backend_mean_latency_s": cand_time / len(prompts),
+        "speedup": ref_time / cand_time if cand_time else 0.0,
+        "fp32_weights_mb": ref_mb,
+        "backend_weights_mb": cand_mb,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check a generator backend against fp32 outputs.")
+    parser.add_argument("--backend", choices=BACKENDS, default=GENERATOR_BACKEND)
+    parser.add_argument("--model", default=None, help="Model name (defaults to the pipeline's generator).")
+    parser.add_argument("--prompts", type=int, default=8)
+    parser.add_argument("--min-similarity", type=float, default=0.9,
+                        help="Exit non-zero if mean similarity falls below this.")
+    args = parser.parse_args()
+
+    report = check_parity(args.backend, model_name=args.model, n_prompts=args.prompts)
+    print(json.dumps(report, indent=2))
+    if report["mean_similarity"] < args.min_similarity:
+        raise SystemExit(f"❌ {args.backend} drifted from fp32 (mean similarity {report['mean_similarity']:.3f}).")
+    print(f"✅ {args.backend} matches fp32 within tolerance.")
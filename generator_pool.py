@@ -0,0 +1,458 @@
+# generator_pool.py
+
+import os
+import gc
+import sys
+import time
+import queue
+import atexit
+import signal
+import itertools
+import threading
+import multiprocessing as mp
+from collections import defaultdict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing.connection import wait as wait_for_exit
+from typing import List, Dict, Iterator, Optional, Tuple
+
+from config import (
+    GENERATOR_BACKEND,
+    GENERATOR_WORKERS,
+    GENERATOR_THREADS_PER_WORKER,
+    GENERATOR_POOL_START_METHOD,
+    GENERATOR_POOL_TIMEOUT_S,
+    GENERATOR_MAX_TIME_S,
+)
+from decoding_policy import make_plan
+from metrics import metrics
+
+_STREAM_END = object()
+_POLL_S = 0.5  # how often the collector checks that the workers are alive
+# Trace fields that belong to the worker's own trace, not the request's
+_WORKER_TRACE_KEYS = ("trace", "ts", "duration_ms", "spans", "path")
+
+
+def _job_plans(kind: str, args: tuple) -> List[Dict]:
+    """Decoding plans in a job's arguments (generators mark them "time_capped")."""
+    plans = args[2] if kind == "batch" else [args[1]]
+    return [p for p in plans or [] if p is not None]
+
+
+def _job_budget_s(kind: str, args: tuple) -> Optional[float]:
+    """Longest a job can take to decode: one time cap per generate call it makes (None = uncapped)."""
+    if kind == "batch":
+        prompts, batch_size, plans = args
+        plans = plans or [{}] * len(prompts)
+    else:
+        batch_size, plans = 1, [args[1] or {}]
+    caps = defaultdict(list)  # the worker batches each decoding policy separately
+    for plan in plans:
+        caps[plan.get("policy")].append(plan.get("max_time", GENERATOR_MAX_TIME_S))  # 0 = uncapped
+    if not all(all(group) for group in caps.values()):
+        return None
+    return sum(-(-len(group) // batch_size) * max(group) for group in caps.values())
+
+
+def _set_torch_threads(n: int) -> int:
+    """Set torch's intra-op thread count; returns the previous one (no-op without torch)."""
+    try:
+        import torch
+    except ImportError:
+        return n
+
+    previous = torch.get_num_threads()
+    torch.set_num_threads(n)
+    return previous
+
+
+class BrokenGeneratorPool(RuntimeError):
+    """A generator worker died; pending and new jobs fail instead of waiting forever."""
+
+
+def _load_generator(generator_cls, model_name: Optional[str], backend: str):
+    if generator_cls is None:
+        from rag_pipeline import GeneratorModel as generator_cls
+    return generator_cls(model_name=model_name, backend=backend)
+
+
+# ------------------ WORKER PROCESSES ------------------
+
+def _start_workers(
+    ctx, n_workers: int, generator, generator_cls, model_name, backend, threads, warm_up, tasks, results
+) -> List:
+    procs = [
+        ctx.Process(
+            target=_worker_main,
+            args=(i, generator, generator_cls, model_name, backend, threads, warm_up, tasks, results),
+            name=f"generator-worker-{i}",
+            daemon=True,
+        )
+        for i in range(n_workers)
+    ]
+    for p in procs:
+        p.start()
+    return procs
+
+
+def _bootstrap_main(n_workers, generator_cls, model_name, backend, threads, warm_up, tasks, results) -> None:
+    """
+    Clean process the workers are forked from when the pool's own process is not
+    safe to fork: the model is loaded once here and shared copy-on-write.
+    A worker crash takes this process down too, so the pool sees it.
+    """
+    # One thread while loading, so no OpenMP thread team exists at the fork
+    _set_torch_threads(1)
+    try:
+        generator = _load_generator(generator_cls, model_name, backend)
+    except BaseException as e:
+        results.put((None, "failed", f"bootstrap: {e!r}", None))
+        return
+    gc.collect()
+    gc.freeze()
+    procs = _start_workers(
+        mp.get_context("fork"), n_workers, generator, None, model_name, backend, threads, warm_up, tasks, results
+    )
+
+    def stop(signum=signal.SIGTERM, frame=None):
+        for p in procs:
+            p.terminate()
+        os._exit(128 + signum)
+
+    signal.signal(signal.SIGTERM, stop)  # the pool terminates this process when it breaks
+    running = list(procs)
+    while running:
+        wait_for_exit([p.sentinel for p in running])
+        for p in [p for p in running if p.exitcode is not None]:
+            running.remove(p)
+            if p.exitcode != 0:
+                results.put((None, "died", f"{p.name} exited unexpectedly (exit code {p.exitcode}).", None))
+                results.close()
+                results.join_thread()
+                stop()
+
+
+def _worker_main(worker_id, generator, generator_cls, model_name, backend, threads, warm_up, tasks, results) -> None:
+    _set_torch_threads(threads)
+    metrics.reset_for_worker()
+    try:
+        if generator is None:  # spawn without fork: no shared memory, load from disk
+            generator = _load_generator(generator_cls, model_name, backend)
+        if warm_up:
+            generator.generate(
+                "Answer briefly: how do I reset my password?", plan=make_plan("full_beam", max_time_s=0)
+            )
+    except BaseException as e:
+        results.put((None, "failed", f"worker {worker_id}: {e!r}", None))
+        return
+    results.put((None, "ready", worker_id, None))
+
+    records: List[Dict] = []
+    metrics.add_trace_listener(records.append)
+    while True:
+        job = tasks.get()
+        if job is None:
+            return
+        job_id, kind, args, enqueued, deadline = job
+        if deadline is not None and time.time() > deadline:  # the caller has stopped waiting
+            results.put((job_id, "error", "deadline passed while queued", None))
+            continue
+        records.clear()
+        try:
+            with metrics.trace("pool_job"):
+                metrics.record_span("pool_queue_wait", max(0.0, time.time() - enqueued))
+                if kind == "generate":
+                    value = generator.generate(*args)
+                elif kind == "batch":
+                    value = generator.generate_batch(*args)
+                else:  # stream
+                    for text in generator.stream(*args):
+                        results.put((job_id, "chunk", text, None))
+                    value = None
+            capped = [bool(p.get("time_capped")) for p in _job_plans(kind, args)]
+            results.put((job_id, "done", (value, capped), records[-1] if records else None))
+        except Exception as e:
+            results.put((job_id, "error", repr(e), None))
+
+
+# ------------------ POOL ------------------
+
+class GeneratorPool:
+    """
+    N generator processes behind a queue, with the same generate / stream /
+    generate_batch interface as GeneratorModel.
+
+    The model is loaded once and the workers are forked from the process
+    holding it, so the weights are shared copy-on-write (gc.freeze keeps the
+    collector from touching those pages). Forking is only safe from a clean
+    process: with "fork" (the default if nothing has imported torch or
+    started a thread yet) the model is loaded here; with "forkserver" or
+    "spawn" a clean bootstrap process is started that way, loads the model
+    and forks the workers. Only where fork is unavailable does every worker
+    load its own copy. Each worker limits torch to `threads_per_worker`
+    intra-op threads so workers do not fight over cores.
+
+    Callers wait at most their job's generation time caps plus `timeout_s`
+    (TimeoutError). If a worker dies, every pending and later job fails with
+    BrokenGeneratorPool, like concurrent.futures' BrokenProcessPool.
+
+    Stage timings and token counts from the workers are replayed into the
+    caller's trace; other worker-side counters are not aggregated.
+    """
+
+    def __init__(
+        self,
+        n_workers: int = GENERATOR_WORKERS,
+        threads_per_worker: int = GENERATOR_THREADS_PER_WORKER,
+        model_name: Optional[str] = None,
+        backend: str = GENERATOR_BACKEND,
+        start_method: str = GENERATOR_POOL_START_METHOD,
+        warm_up: bool = True,
+        timeout_s: float = GENERATOR_POOL_TIMEOUT_S,
+        wait: bool = True,
+        generator_cls=None,
+    ):
+        """`generator_cls` defaults to rag_pipeline.GeneratorModel (it must be importable by name)."""
+        self.n_workers = max(1, n_workers)
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.n_workers)
+        self.timeout_s = timeout_s
+        self.start_method = start_method or self._default_start_method()
+        ctx = mp.get_context(self.start_method)
+
+        bootstrap = self.start_method != "fork" and "fork" in mp.get_all_start_methods()
+        how = f"forked from a {self.start_method} bootstrap process" if bootstrap else self.start_method
+        print(f"🧵 Starting {self.n_workers} generator workers ({self.threads_per_worker} threads each, {how})...")
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        worker_args = (model_name, backend, self.threads_per_worker, warm_up, self._tasks, self._results)
+        if self.start_method == "fork":
+            # One thread while loading, so no OpenMP thread team exists at the fork
+            parent_threads = _set_torch_threads(1)
+            generator = _load_generator(generator_cls, model_name, backend)
+            gc.collect()
+            gc.freeze()
+            self._procs = _start_workers(ctx, self.n_workers, generator, None, *worker_args)
+            gc.unfreeze()
+            _set_torch_threads(parent_threads)
+        elif bootstrap:
+            # Not daemonic: a daemonic process may not start the workers
+            self._procs = [
+                ctx.Process(
+                    target=_bootstrap_main,
+                    args=(self.n_workers, generator_cls, *worker_args),
+                    name="generator-bootstrap",
+                )
+            ]
+            self._procs[0].start()
+        else:
+            self._procs = _start_workers(ctx, self.n_workers, None, generator_cls, *worker_args)
+
+        self._jobs: Dict[int, object] = {}  # job id -> Future or stream queue
+        self._jobs_lock = threading.Lock()
+        self._ids = itertools.count()
+        self._n_ready = 0
+        self._ready = threading.Event()
+        self._closing = False
+        self.broken: Optional[BaseException] = None
+
+        self._collector = threading.Thread(target=self._collect, name="generator-pool-results", daemon=True)
+        self._collector.start()
+        atexit.register(self.close)
+        if wait:
+            self.wait_until_ready()
+
+    @staticmethod
+    def _default_start_method() -> str:
+        """fork from a clean process; once torch or other threads run here, a forkserver bootstrap."""
+        methods = mp.get_all_start_methods()
+        # Threads (or torch's OpenMP pool) may hold locks the children would inherit locked
+        if "fork" in methods and threading.active_count() == 1 and "torch" not in sys.modules:
+            return "fork"
+        return "forkserver" if "forkserver" in methods else "spawn"
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until every worker has loaded (and warmed up); raises if one failed."""
+        self._ready.wait(timeout)
+        if self.broken is not None:
+            self.close()
+            raise RuntimeError(f"Generator workers failed to start: {self.broken}") from self.broken
+        return self._ready.is_set()
+
+    # --------- DISPATCH ---------
+    def _submit(self, kind: str, args: tuple, sink) -> Tuple[int, Optional[float]]:
+        """Queue a job; returns its id and the time (time.time()) its caller stops waiting."""
+        budget = _job_budget_s(kind, args)
+        deadline = time.time() + budget + self.timeout_s if budget is not None and self.timeout_s > 0 else None
+        job_id = next(self._ids)
+        with self._jobs_lock:
+            if self.broken is not None:
+                raise BrokenGeneratorPool(str(self.broken))
+            self._jobs[job_id] = sink
+        self._tasks.put((job_id, kind, args, time.time(), deadline))
+        return job_id, deadline
+
+    def _abandon(self, job_id: int) -> TimeoutError:
+        """Stop waiting for a job that missed its deadline (a late result is dropped)."""
+        with self._jobs_lock:
+            self._jobs.pop(job_id, None)
+        metrics.inc("generator_pool_timeouts_total")
+        return TimeoutError(
+            f"Generator pool job {job_id} took longer than its time caps plus {self.timeout_s:.0f}s."
+        )
+
+    def _collect(self) -> None:
+        while self.broken is None:
+            try:
+                job_id, kind, payload, record = self._results.get(timeout=_POLL_S)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            except (EOFError, OSError):  # queue closed on shutdown
+                return
+            self._check_workers()
+            if job_id is None:  # worker start-up
+                if kind == "failed":
+                    self._break(RuntimeError(payload))
+                elif kind == "died":  # reported by the bootstrap process
+                    self._break(BrokenGeneratorPool(payload))
+                else:
+                    self._n_ready += 1
+                    if self._n_ready == self.n_workers:
+                        self._ready.set()
+                continue
+            with self._jobs_lock:
+                sink = self._jobs.get(job_id) if kind == "chunk" else self._jobs.pop(job_id, None)
+            if sink is None:
+                continue
+            if isinstance(sink, Future):
+                if kind == "done":
+                    sink.set_result((payload, record))
+                else:
+                    sink.set_exception(RuntimeError(f"Generator worker error: {payload}"))
+            elif kind == "chunk":
+                sink.put(payload)
+            elif kind == "done":
+                sink.put((_STREAM_END, payload))
+            else:
+                sink.put(RuntimeError(f"Generator worker error: {payload}"))
+
+    def _check_workers(self) -> None:
+        if self._closing:
+            return
+        for p in self._procs:
+            if p.exitcode is not None:
+                self._break(BrokenGeneratorPool(f"{p.name} exited unexpectedly (exit code {p.exitcode})."))
+                return
+
+    def _break(self, error: BaseException) -> None:
+        """Fail every pending job and refuse new ones; the remaining workers are stopped."""
+        with self._jobs_lock:
+            if self.broken is not None:
+                return
+            self.broken = error
+            sinks = list(self._jobs.values())
+            self._jobs.clear()
+        print(f"❌ Generator pool broken: {error}")
+        metrics.inc("generator_pool_broken_total")
+        for sink in sinks:
+            if isinstance(sink, Future):
+                sink.set_exception(error)
+            else:
+                sink.put(error)
+        self._ready.set()
+        self._closing = True
+        for p in self._procs:
+            if p.is_alive():
+                p.terminate()
+
+    @staticmethod
+    def _replay(record: Optional[Dict]) -> None:
+        """Fold a worker's trace (spans, tokens, decoding policy) into the caller's trace."""
+        if not record:
+            return
+        for span in record.get("spans", []):
+            metrics.record_span(span["stage"], span["ms"] / 1000.0)
+        attrs = {k: v for k, v in record.items() if k not in _WORKER_TRACE_KEYS}
+        if "tokens_in" in attrs:
+            metrics.observe("generator_input_tokens", attrs["tokens_in"])
+            metrics.observe("generator_output_tokens", attrs["tokens_out"])
+        if "decoding" in attrs:
+            metrics.inc("decoding_policy_total", policy=attrs["decoding"])
+        metrics.annotate(**attrs)
+
+    @staticmethod
+    def _mark_capped(kind: str, args: tuple, capped: List[bool]) -> None:
+        """Copy the workers' "time_capped" flags onto the caller's plans (see generate_batch)."""
+        for plan, flag in zip(_job_plans(kind, args), capped):
+            plan["time_capped"] = (plan.get("time_capped", False) or flag) if kind == "batch" else flag
+
+    def _result(self, kind: str, args: tuple, job_id: int, fut: Future, deadline: Optional[float]):
+        try:
+            (value, capped), record = fut.result(
+                timeout=max(0.0, deadline - time.time()) if deadline is not None else None
+            )
+        except FutureTimeout:
+            raise self._abandon(job_id) from None
+        self._mark_capped(kind, args, capped)
+        self._replay(record)
+        return value
+
+    def _run(self, kind: str, args: tuple):
+        fut: Future = Future()
+        job_id, deadline = self._submit(kind, args, fut)
+        return self._result(kind, args, job_id, fut, deadline)
+
+    # --------- GENERATOR INTERFACE ---------
+    def generate(self, prompt: str, plan: Optional[Dict] = None) -> str:
+        return self._run("generate", (prompt, plan))
+
+    def generate_batch(
+        self, prompts: List[str], batch_size: int = 8, plans: Optional[List[Dict]] = None
+    ) -> List[str]:
+        """Split the prompts into one shard per worker; each shard is batched inside its worker."""
+        if not prompts:
+            return []
+        # Like GeneratorModel.generate_batch: a plan shared by several prompts (maybe in
+        # different shards) ends up "time_capped" if any of them was
+        for plan in plans or []:
+            plan["time_capped"] = False
+        shard = min(batch_size, -(-len(prompts) // self.n_workers))
+        jobs = []
+        for start in range(0, len(prompts), shard):
+            fut: Future = Future()
+            shard_plans = plans[start:start + shard] if plans else None
+            args = (prompts[start:start + shard], batch_size, shard_plans)
+            jobs.append((args, *self._submit("batch", args, fut), fut))
+
+        answers: List[str] = []
+        for args, job_id, deadline, fut in jobs:
+            answers.extend(self._result("batch", args, job_id, fut, deadline))
+        return answers
+
+    def stream(self, prompt: str, plan: Optional[Dict] = None) -> Iterator[str]:
+        chunks: "queue.Queue" = queue.Queue()
+        args = (prompt, plan)
+        job_id, deadline = self._submit("stream", args, chunks)
+        while True:
+            try:
+                item = chunks.get(timeout=max(0.0, deadline - time.time()) if deadline is not None else None)
+            except queue.Empty:
+                raise self._abandon(job_id) from None
+            if isinstance(item, tuple) and item[0] is _STREAM_END:
+                _, capped = item[1]
+                self._mark_capped("stream", args, capped)
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self) -> None:
+        """Stop the workers (queued jobs are finished first)."""
+        self._closing = True
+        if not any(p.is_alive() for p in self._procs):
+            return
+        for _ in range(self.n_workers):
+            self._tasks.put(None)
+        for p in self._procs:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
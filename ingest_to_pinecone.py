@@ -1,137 +1,629 @@
 import os
 import json
 import time
-import pandas as pd
-from datasets import load_dataset
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, ServerlessSpec
-from dotenv import load_dotenv
-
-load_dotenv()
+import queue
+import hashlib
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator, Optional, Tuple
 
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "supportsphere-better")
-NAMESPACE = os.getenv("PINECONE_NAMESPACE", "support")
+import pandas as pd
 
-EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# The datasets and pinecone clients are imported where they are used, so local
+# sources and targets (data/faqs.json, FAISS) work without them.
+from config import (
+    VECTOR_BACKEND,
+    FAISS_INDEX_TYPE,
+    VECTORSTORE_DIR,
+    FAQS_FILE,
+    EMBEDDING_MODEL_NAME,
+    PINECONE_API_KEY,
+    PINECONE_INDEX_NAME,
+    PINECONE_NAMESPACE,
+    PINECONE_REGION,
+    PINECONE_POOL_THREADS,
+    CHUNK_STORE_ENABLED,
+)
+from category_router import CategoryRouter, QuestionSampler, category_router_path, load_category_router
+from chunk_store import ChunkStore, chunk_store_path
+from chunking import build_chunks, LABEL_COLUMNS
+from embedding_service import EmbeddingService
+from retrievers import PineconeRetriever, FaissRetriever, embedding_fingerprint
+from vector_client import wait_until_ready
+from sparse_index import BM25Index, sparse_index_path
+
+BITEXT_DATASET = "bitext/Bitext-customer-support-llm-chatbot-training-dataset"
+
+# Bitext categories folded into the categories of data/faqs.json (plus two of their
+# own), so one category filter covers both sources. The Bitext intent is kept as is.
+BITEXT_CATEGORIES = {
+    "ACCOUNT": "Account & Login",
+    "PAYMENT": "Billing",
+    "INVOICE": "Billing",
+    "REFUND": "Billing",
+    "ORDER": "Orders & Delivery",
+    "CANCEL": "Orders & Delivery",
+    "DELIVERY": "Orders & Delivery",
+    "SHIPPING": "Orders & Delivery",
+    "CONTACT": "General",
+    "FEEDBACK": "General",
+    "NEWSLETTER": "General",
+    "SUBSCRIPTION": "General",
+}
+
+UPSERT_BATCH_SIZE = 200
+DELETE_BATCH_SIZE = 1000
+CHECKPOINT_EVERY_SECONDS = 5
 
 
 # ------------------ LOAD DATASET ------------------
 def load_bitext_dataset():
+    from datasets import load_dataset
+
     print("📚 Downloading Bitext Customer Support dataset...")
-    ds = load_dataset("bitext/Bitext-customer-support-llm-chatbot-training-dataset")
+    ds = load_dataset(BITEXT_DATASET)
     df = ds["train"].to_pandas()
 
     df = df.rename(columns={"instruction": "question", "response": "answer"})
-    df = df[["question", "answer"]]
+    df["category"] = bitext_categories(df["category"])
+    df = df[["question", "answer", "category", "intent"]]
     print(f"Loaded {len(df)} customer-support rows.")
     return df
 
 
-# ------------------ CLEAN + CHUNK ------------------
-def chunk_text(text, chunk_size=500):
-    if len(text) <= chunk_size:
-        return [text]
-    chunks = []
-    words = text.split()
-    for i in range(0, len(words), chunk_size):
-        chunks.append(" ".join(words[i:i + chunk_size]))
-    return chunks
-
-
-def build_chunks(df):
-    rows = []
-
-    for i, row in df.iterrows():
-        q = row["question"]
-        a = row["answer"]
+def bitext_categories(raw) -> pd.Series:
+    """App categories for Bitext category labels (unknown labels are title-cased)."""
+    raw = pd.Series(raw, dtype=object).fillna("").astype(str)
+    return raw.str.upper().map(BITEXT_CATEGORIES).fillna(raw.str.title())
 
-        # chunk long answers
-        chunks = chunk_text(a, chunk_size=80)
 
-        for idx, ch in enumerate(chunks):
-            rows.append({
-                "row_id": i,
-                "chunk_id": idx,
-                "question": q,
-                "answer_chunk": ch
-            })
+def iter_bitext_batches(batch_rows: int = 512, start_row: int = 0) -> Iterator[pd.DataFrame]:
+    """
+    Stream the Bitext dataset in DataFrames of `batch_rows` rows without
+    materializing the whole corpus. The index carries the global row id.
+    """
+    from datasets import load_dataset
 
-    return pd.DataFrame(rows)
+    ds = load_dataset(BITEXT_DATASET, split="train", streaming=True)
+    if start_row:
+        ds = ds.skip(start_row)
 
-
-# ------------------ EMBEDDINGS ------------------
-def build_embeddings(chunk_df):
-    print("🔵 Loading embedding model...")
-    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-
-    print("⚙️ Encoding chunks...")
-    embeddings = model.encode(
-        chunk_df["answer_chunk"].tolist(),
-        batch_size=32,
-        convert_to_numpy=True
+    row = start_row
+    for batch in ds.iter(batch_size=batch_rows):
+        df = pd.DataFrame({
+            "question": batch["instruction"],
+            "answer": batch["response"],
+            "category": bitext_categories(batch["category"]).tolist(),
+            "intent": batch["intent"],
+        })
+        df.index = pd.RangeIndex(row, row + len(df))
+        row += len(df)
+        yield df
+
+
+def iter_faq_batches(batch_rows: int = 512, start_row: int = 0) -> Iterator[pd.DataFrame]:
+    """
+    Curated FAQs from data/faqs.json in the same shape as the Bitext batches.
+    Row ids are prefixed ("faq-<id>") so they never collide with Bitext rows.
+    """
+    with open(FAQS_FILE, "r", encoding="utf-8") as f:
+        faqs = json.load(f)
+
+    df = pd.DataFrame(
+        {
+            "question": [x["question"] for x in faqs],
+            "answer": [x["answer"] for x in faqs],
+            "category": [x.get("category", "") for x in faqs],
+        },
+        index=[f"faq-{x['id']}" for x in faqs],
     )
+    for start in range(start_row, len(df), batch_rows):
+        yield df.iloc[start:start + batch_rows]
+
 
-    return embeddings
+SOURCES = {
+    "bitext": iter_bitext_batches,
+    "faqs": iter_faq_batches,
+}
 
 
 # ------------------ PINECONE ------------------
-def ensure_index():
+def ensure_index(dimension: int = 384):
+    from pinecone import Pinecone, ServerlessSpec
+
     pc = Pinecone(api_key=PINECONE_API_KEY)
 
     print("🟡 Checking Pinecone index...")
 
-    if INDEX_NAME not in pc.list_indexes().names():
+    if PINECONE_INDEX_NAME not in pc.list_indexes().names():
         print("🧱 Creating Pinecone index...")
         pc.create_index(
-            name=INDEX_NAME,
-            dimension=384,
+            name=PINECONE_INDEX_NAME,
+            dimension=dimension,
             metric="cosine",
             spec=ServerlessSpec(
                 cloud="aws",
-                region=os.getenv("PINECONE_REGION", "us-east-1")
+                region=PINECONE_REGION
             )
         )
-        time.sleep(10)
 
+    # A new (or still initializing) index rejects writes until it reports ready
+    wait_until_ready(pc, PINECONE_INDEX_NAME)
     print("✅ Pinecone index ready.")
-    return pc.Index(INDEX_NAME)
-
-
-def ingest_to_pinecone():
-    df = load_bitext_dataset()
-    chunk_df = build_chunks(df)
-    embeddings = build_embeddings(chunk_df)
-
-    index = ensure_index()
-
-    print("📤 Uploading to Pinecone...")
-    vectors = []
-    for i, row in chunk_df.iterrows():
-        meta = {
-            "question": row["question"],
-            "answer": row["answer_chunk"],
-            "row_id": int(row["row_id"]),
-            "chunk_id": int(row["chunk_id"])
+    return pc.Index(PINECONE_INDEX_NAME, pool_threads=PINECONE_POOL_THREADS)
+
+
+def get_target(target: str = VECTOR_BACKEND, faiss_index_type: str = FAISS_INDEX_TYPE, dimension: int = 384):
+    """Return the retriever that ingestion writes into."""
+    if target == "pinecone":
+        return PineconeRetriever(index=ensure_index(dimension), namespace=PINECONE_NAMESPACE)
+    if target == "faiss":
+        print(f"🗂️ Writing local FAISS index ({faiss_index_type})...")
+        return FaissRetriever(index_type=faiss_index_type, mmap=False)
+    raise ValueError(f"Unknown ingestion target: {target!r}")
+
+
+# ------------------ CHECKPOINTS + MANIFEST ------------------
+def checkpoint_path(target: str, source: str):
+    return VECTORSTORE_DIR / f"ingest_checkpoint_{target}_{source}.jsonl"
+
+
+def manifest_path(target: str):
+    return VECTORSTORE_DIR / f"ingest_manifest_{target}.json"
+
+
+def _read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path, data) -> None:
+    """Atomically replace a JSON file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _empty_checkpoint() -> dict:
+    return {"rows_done": 0, "chunks_done": 0, "hashes": {}, "namespaces": {}}
+
+
+def _read_checkpoint(path) -> dict:
+    """
+    Replay a checkpoint journal: each line holds the rows, chunk count, chunk
+    hashes and namespaces committed since the previous line. A torn last line
+    (crash mid-write) is ignored.
+    """
+    state = _empty_checkpoint()
+    if not os.path.exists(path):
+        return state
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break
+            state["rows_done"] += entry["rows_done"]
+            state["chunks_done"] += entry["chunks_done"]
+            state["hashes"].update(entry["hashes"])
+            state["namespaces"].update(entry.get("namespaces", {}))  # older journals have none
+    return state
+
+
+def _start_checkpoint(path, state: dict) -> None:
+    """Atomically restart the journal from one line holding `state` (this also drops a torn line)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(state) + "\n")
+    os.replace(tmp_path, path)
+
+
+def _append_checkpoint(path, entry: dict) -> None:
+    """Append one journal line, so each save costs O(batches since the last save)."""
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def content_hash(question: str, answer_chunk: str, *labels: str) -> str:
+    """
+    Short, stable fingerprint of what gets embedded and stored for a chunk
+    (labels such as the category are metadata, so a change re-upserts the chunk).
+    """
+    h = hashlib.blake2b(digest_size=8)
+    h.update(question.encode("utf-8"))
+    h.update(b"\x00")
+    h.update(answer_chunk.encode("utf-8"))
+    for label in labels:
+        if label:
+            h.update(b"\x00")
+            h.update(label.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _labels(chunk_df: pd.DataFrame) -> dict:
+    """Category / intent columns of a chunk table that are present."""
+    return {col: chunk_df[col].tolist() for col in LABEL_COLUMNS if col in chunk_df}
+
+
+# ------------------ STREAMING PIPELINE ------------------
+def _to_vectors(chunk_df: pd.DataFrame, embeddings) -> list:
+    """Build Pinecone-style upsert records column-wise."""
+    records = [
+        {
+            "id": rec_id,
+            "values": values,
+            "metadata": {"question": q, "answer": a, "row_id": r, "chunk_id": c},
         }
-
-        vectors.append({
-            "id": f"{row['row_id']}-{row['chunk_id']}",
-            "values": embeddings[i].tolist(),
-            "metadata": meta,
-        })
-
-        # batch upload every 200 vectors
-        if len(vectors) == 200:
-            index.upsert(vectors=vectors, namespace=NAMESPACE)
+        for rec_id, r, c, q, a, values in zip(
+            chunk_df["id"].tolist(),
+            chunk_df["row_id"].tolist(),
+            chunk_df["chunk_id"].astype(int).tolist(),
+            chunk_df["question"].tolist(),
+            chunk_df["answer_chunk"].tolist(),
+            embeddings.tolist(),
+        )
+    ]
+    for col, values in _labels(chunk_df).items():
+        for r, v in zip(records, values):
+            if v:  # Pinecone rejects null metadata values
+                r["metadata"][col] = v
+    return records
+
+
+def _chunk_producer(batches: Iterator[pd.DataFrame], out: queue.Queue) -> None:
+    """Read, chunk and hash source batches on a background thread (bounded by the queue size)."""
+    try:
+        for df in batches:
+            chunk_df = build_chunks(df)
+            if len(chunk_df):
+                chunk_df["id"] = [f"{r}-{c}" for r, c in zip(chunk_df["row_id"], chunk_df["chunk_id"])]
+                labels = _labels(chunk_df).values()
+                chunk_df["hash"] = [
+                    content_hash(q, a, *row_labels)
+                    for q, a, *row_labels in zip(chunk_df["question"], chunk_df["answer_chunk"], *labels)
+                ]
+            out.put((len(df), chunk_df))
+    except Exception as e:  # surfaced to the main thread
+        out.put(e)
+        return
+    out.put(None)
+
+
+def _ingest_source(
+    store,
+    sparse: BM25Index,
+    chunks: Optional[ChunkStore],
+    model,
+    target: str,
+    source: str,
+    old_hashes: dict,
+    batch_rows: int,
+    workers: int,
+    max_inflight: int,
+    resume: bool,
+    sampler: Optional[QuestionSampler] = None,
+    sparse_all: bool = False,
+    chunks_all: bool = False,
+    old_namespaces: Optional[dict] = None,
+) -> Tuple[dict, dict]:
+    """
+    Stream one source into `store` and return its new {id: hash} and
+    {id: namespace} manifests (the latter empty for stores without namespaces).
+
+    Only chunks whose content hash differs from `old_hashes`, or that now go
+    to another namespace than the one recorded in `old_namespaces`, are embedded
+    and upserted (and re-indexed in the BM25 index, unless `sparse_all`:
+    the index is being built from scratch and every chunk is added; likewise
+    `chunks_all` for the local chunk store). Each source batch is committed to a checkpoint once all
+    of its upserts (and those of every earlier batch) have finished, so a
+    crashed run resumes from the last committed batch.
+    `sampler` collects questions per category for the category router.
+    """
+    # Local targets only persist on flush, so a partial run cannot be resumed.
+    ckpt_file = checkpoint_path(target, source) if store.durable_upserts else None
+    state = _read_checkpoint(ckpt_file) if (ckpt_file and resume) else _empty_checkpoint()
+    if state["rows_done"]:
+        print(f"⏩ [{source}] resuming after row {state['rows_done']} ({state['chunks_done']} chunks already stored).")
+    if ckpt_file:
+        _start_checkpoint(ckpt_file, state)
+    # Committed since the last checkpoint save
+    pending = _empty_checkpoint()
+    # Only stores with namespaces (Pinecone) track them
+    base_namespace = store.namespace_for(None)
+    old_namespaces = old_namespaces or {}
+
+    chunk_queue: queue.Queue = queue.Queue(maxsize=4)
+    producer = threading.Thread(
+        target=_chunk_producer,
+        args=(SOURCES[source](batch_rows, start_row=state["rows_done"]), chunk_queue),
+        daemon=True,
+    )
+    producer.start()
+
+    # Per source batch: upserts still outstanding, and what it adds once committed
+    remaining = {}
+    batch_info = {}
+    next_commit = 0
+    seq = 0
+    inflight = {}
+    last_saved = time.perf_counter()
+
+    rows_seen = chunks_seen = chunks_embedded = 0
+    started = last_report = time.perf_counter()
+
+    def drain(block_until: int, final: bool = False) -> None:
+        nonlocal next_commit, last_saved
+        while len(inflight) > block_until:
+            done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+            for fut in done:
+                fut.result()  # re-raise upsert errors; the checkpoint stays at the last commit
+                remaining[inflight.pop(fut)] -= 1
+
+        # Commit the longest prefix of fully-upserted batches
+        while remaining.get(next_commit) == 0:
+            n_rows, n_chunks, hashes, namespaces = batch_info.pop(next_commit)
+            del remaining[next_commit]
+            for committed in (state, pending):
+                committed["rows_done"] += n_rows
+                committed["chunks_done"] += n_chunks
+                committed["hashes"].update(hashes)
+                committed["namespaces"].update(namespaces)
+            next_commit += 1
+
+        now = time.perf_counter()
+        if ckpt_file and (final or now - last_saved >= CHECKPOINT_EVERY_SECONDS):
+            sparse.flush()  # never checkpoint rows the local indexes have not persisted
+            if chunks is not None:
+                chunks.flush()
+            if pending["rows_done"]:
+                _append_checkpoint(ckpt_file, pending)
+                pending.update(_empty_checkpoint())
+            last_saved = now
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            item = chunk_queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            n_rows, chunk_df = item
+
+            hashes = {}
+            namespaces = {}
             vectors = []
+            if sampler is not None and "category" in chunk_df:
+                sampler.add(chunk_df["category"].tolist(), chunk_df["question"].tolist())
+            if len(chunk_df):
+                hashes = dict(zip(chunk_df["id"], chunk_df["hash"]))
+                if base_namespace is not None:
+                    categories = chunk_df["category"].tolist() if "category" in chunk_df else [""] * len(chunk_df)
+                    namespaces = dict(zip(chunk_df["id"], (store.namespace_for(c or None) for c in categories)))
+                # A chunk that moves namespace is re-upserted even if its content is unchanged
+                is_changed = [
+                    old_hashes.get(i) != h or namespaces.get(i) != old_namespaces.get(i, base_namespace)
+                    for i, h in zip(chunk_df["id"], chunk_df["hash"])
+                ]
+                changed = chunk_df[is_changed]
+                # A new chunk store needs every chunk (unchanged ones come from the embedding cache)
+                to_embed = chunk_df if chunks_all else changed
+                if len(to_embed):
+                    embeddings = model.encode(
+                        to_embed["answer_chunk"].tolist(),
+                        batch_size=64,
+                        convert_to_numpy=True,
+                    )
+                    records = _to_vectors(to_embed, embeddings)
+                    if chunks is not None:
+                        chunks.upsert(records)
+                    vectors = [r for r, c in zip(records, is_changed) if c] if chunks_all else records
+                sparse.add_documents(_sparse_docs(chunk_df if sparse_all else changed))
+
+            remaining[seq] = 0
+            batch_info[seq] = (n_rows, len(hashes), hashes, namespaces)
+            for start in range(0, len(vectors), UPSERT_BATCH_SIZE):
+                fut = pool.submit(store.upsert, vectors[start:start + UPSERT_BATCH_SIZE])
+                inflight[fut] = seq
+                remaining[seq] += 1
+            seq += 1
+
+            drain(block_until=max_inflight)
+
+            rows_seen += n_rows
+            chunks_seen += len(hashes)
+            chunks_embedded += len(vectors)
+            now = time.perf_counter()
+            if now - last_report >= 10:
+                elapsed = now - started
+                print(
+                    f"   … [{source}] {rows_seen} rows / {chunks_seen} chunks, {chunks_embedded} re-embedded "
+                    f"({rows_seen / elapsed:.1f} rows/sec)"
+                )
+                last_report = now
+
+        drain(block_until=0, final=True)
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(
+        f"✅ [{source}] {rows_seen} rows / {chunks_seen} chunks in {elapsed:.1f}s "
+        f"({rows_seen / elapsed:.1f} rows/sec); {chunks_embedded} new or changed."
+    )
+    return state["hashes"], state["namespaces"]
+
+
+def _delete_from_store(store, ids: list, namespaces: dict) -> None:
+    """Delete ids from the namespace recorded for each (where they may be, if none is)."""
+    by_namespace = defaultdict(list)
+    for i in ids:
+        by_namespace[namespaces.get(i)].append(i)
+    for ns, group in by_namespace.items():
+        for start in range(0, len(group), DELETE_BATCH_SIZE):
+            batch = group[start:start + DELETE_BATCH_SIZE]
+            if ns is None:
+                store.delete(batch)
+            else:
+                store.delete(batch, namespace=ns)
+
+
+def _sparse_docs(chunk_df: pd.DataFrame) -> list:
+    categories = chunk_df["category"].tolist() if "category" in chunk_df else [""] * len(chunk_df)
+    return [
+        {"id": i, "question": q, "answer": a, "row_id": r, "chunk_id": c, "category": cat}
+        for i, q, a, r, c, cat in zip(
+            chunk_df["id"].tolist(),
+            chunk_df["question"].tolist(),
+            chunk_df["answer_chunk"].tolist(),
+            chunk_df["row_id"].tolist(),
+            chunk_df["chunk_id"].astype(int).tolist(),
+            categories,
+        )
+    ]
+
+
+def ingest_to_pinecone(
+    target: str = VECTOR_BACKEND,
+    faiss_index_type: str = FAISS_INDEX_TYPE,
+    sources=("bitext",),
+    batch_rows: int = 512,
+    workers: int = 4,
+    max_inflight: int = 16,
+    resume: bool = True,
+    full: bool = False,
+):
+    """
+    Streaming, incremental ingestion with bounded memory:
+    source iterator -> chunker thread -> batched embedder -> concurrent upsert workers.
+
+    A manifest of content hashes per chunk id (per target and source) lets
+    re-runs embed and upsert only new or changed chunks and delete ids that
+    disappeared from the source. `full=True` ignores the manifest. For Pinecone
+    it also records each chunk's namespace, so chunks that move (a category
+    change, or CATEGORY_NAMESPACES switched) are deleted from the old one.
+    """
+    print(f"🔵 Loading embedding model {EMBEDDING_MODEL_NAME}...")
+    # Single caller, so no in-memory cache or coalescing; the disk cache skips texts
+    # already encoded by an earlier run (e.g. after --full or for another target)
+    model = EmbeddingService(EMBEDDING_MODEL_NAME, cache_size=0, batch_window_ms=0, persist=True)
+    dimension = model.get_sentence_embedding_dimension()
+
+    store = get_target(target, faiss_index_type, dimension)
+
+    # The manifest only tracks content, so a different embedding model means re-embedding everything.
+    fingerprint = embedding_fingerprint(EMBEDDING_MODEL_NAME, dimension)
+    found = store.read_fingerprint()
+    if found is not None and found["dimension"] != dimension:
+        raise ValueError(
+            f"{target} index has dimension {found['dimension']} but {EMBEDDING_MODEL_NAME} "
+            f"produces {dimension}. Use a new index (or delete the local one) for this model."
+        )
+    if found is not None and found["embedding_model"] not in (None, EMBEDDING_MODEL_NAME) and not full:
+        print(f"♻️ Index was built with {found['embedding_model']}; re-embedding everything.")
+        full = True
+
+    manifest_file = manifest_path(target)
+    manifest = _read_json(manifest_file, {})
+
+    # Sparse (BM25) index over the same chunks, for hybrid retrieval
+    sparse = BM25Index(sparse_index_path(target))
+    # Local texts + vectors, so queries can return ids only
+    chunks = ChunkStore(chunk_store_path(target)) if CHUNK_STORE_ENABLED else None
+    # Questions per category, for the nearest-centroid query router
+    sampler = QuestionSampler()
+    # Decided once per run: after the first source the index (and chunk store) is no
+    # longer empty, but the later sources' unchanged chunks are still missing from it
+    sparse_all = sparse.num_docs == 0
+    chunks_all = chunks is not None and chunks.num_chunks == 0
+
+    base_namespace = store.namespace_for(None)
+    recorded_namespaces = manifest.setdefault("namespaces", {}) if base_namespace is not None else {}
+
+    for source in sources:
+        old_hashes = {} if full else manifest.get(source, {})
+        print(f"📤 Streaming {source} into {target} ({len(old_hashes)} chunks in manifest)...")
+        # Where the manifest's chunks are (even with `full`, their old copies must go); chunks
+        # from before namespaces were recorded are taken to be in the base namespace
+        recorded = recorded_namespaces.get(source, {})
+        old_namespaces = {}
+        if base_namespace is not None:
+            old_namespaces = {i: recorded.get(i, base_namespace) for i in manifest.get(source, {})}
+
+        new_hashes, new_namespaces = _ingest_source(
+            store, sparse, chunks, model, target, source, old_hashes,
+            batch_rows=batch_rows, workers=workers, max_inflight=max_inflight, resume=resume,
+            sampler=sampler, sparse_all=sparse_all, chunks_all=chunks_all, old_namespaces=old_namespaces,
+        )
 
-    # final upload
-    if len(vectors) > 0:
-        index.upsert(vectors=vectors, namespace=NAMESPACE)
-
-    print("🎉 Done! Pinecone database updated with improved dataset.")
+        # Chunks now stored in another namespace leave their old copy behind
+        moved = [i for i, ns in new_namespaces.items() if old_namespaces.get(i, ns) != ns]
+        _delete_from_store(store, moved, old_namespaces)
+        if moved:
+            print(f"🔀 [{source}] moved {len(moved)} chunks to another namespace.")
+
+        stale = [i for i in manifest.get(source, {}) if i not in new_hashes]
+        _delete_from_store(store, stale, recorded)
+        sparse.delete(stale)
+        if chunks is not None:
+            chunks.delete(stale)
+        if stale:
+            print(f"🧹 [{source}] deleted {len(stale)} stale chunks.")
+
+        store.flush()
+        sparse.flush()
+        if chunks is not None:
+            chunks.flush()
+        manifest[source] = new_hashes
+        if base_namespace is not None:
+            recorded_namespaces[source] = new_namespaces
+        _write_json(manifest_file, manifest)
+
+        ckpt_file = checkpoint_path(target, source)
+        if os.path.exists(ckpt_file):
+            os.remove(ckpt_file)
+
+    if sparse.num_segments > 8:
+        print("🗜️ Compacting BM25 index...")
+        sparse.compact()
+    if chunks is not None and chunks.num_segments > 8:
+        print("🗜️ Compacting chunk store...")
+        chunks.compact()
+
+    if sampler.samples:
+        router_file = category_router_path(target)
+        previous = None if full else load_category_router(router_file)
+        router = CategoryRouter.from_samples(model, sampler.samples, previous=previous)
+        router.save(router_file)
+        print(f"🧭 Category router: {', '.join(router.categories)}.")
+
+    store.write_fingerprint(fingerprint)
+    print(f"🎉 Done! {target} vector store is up to date.")
 
 
 if __name__ == "__main__":
-    ingest_to_pinecone()
+    parser = argparse.ArgumentParser(description="Ingest support content into a vector store.")
+    parser.add_argument("--target", choices=["pinecone", "faiss"], default=VECTOR_BACKEND)
+    parser.add_argument("--faiss-index-type", choices=["flat", "ivf", "hnsw"], default=FAISS_INDEX_TYPE)
+    parser.add_argument("--source", choices=["bitext", "faqs", "all"], default="bitext")
+    parser.add_argument("--batch-rows", type=int, default=512, help="Source rows per pipeline batch.")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent upsert workers.")
+    parser.add_argument("--max-inflight", type=int, default=16, help="Max outstanding upsert requests.")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start over.")
+    parser.add_argument("--full", action="store_true", help="Re-embed everything, ignoring the manifest.")
+    args = parser.parse_args()
+
+    ingest_to_pinecone(
+        target=args.target,
+        faiss_index_type=args.faiss_index_type,
+        sources=list(SOURCES) if args.source == "all" else [args.source],
+        batch_rows=args.batch_rows,
+        workers=args.workers,
+        max_inflight=args.max_inflight,
+        resume=not args.restart,
+        full=args.full,
+    )
@@ -0,0 +1,274 @@
+# metrics.py
+
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager, ExitStack
+from contextvars import ContextVar
+from typing import Callable, ContextManager, Dict, List, Optional, Tuple
+
+from config import METRICS_ENABLED, METRICS_JSON_LOG, TRACE_LOG_FILE
+
+PREFIX = "supportsphere_"
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 384, 512, 768, 1024)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Trace:
+    """Spans and attributes of one request (e.g. one answer_question call)."""
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs: Dict = dict(attrs)
+        self.spans: List[Dict] = []
+        self.started = time.time()
+        self.duration_s = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace": self.name,
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "duration_ms": round(self.duration_s * 1000, 2),
+            **self.attrs,
+            "spans": self.spans,
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+class Metrics:
+    """
+    Process-wide latency histograms, counters and gauges with per-request traces.
+
+    - `trace(name)` opens a request trace; `span(stage)` times one stage into
+      `supportsphere_stage_duration_seconds{stage=...}` and the current trace.
+    - `annotate(**attrs)` adds fields (token counts, beams, cache hit...) to the trace.
+    - `to_prometheus()` renders the text exposition format; `snapshot()` is JSON-ready.
+    - `add_profiler(factory)`: `factory(stage)` returns a context manager (or None)
+      entered around every span, e.g. to run cProfile or torch.profiler on "generate".
+    - `add_trace_listener(fn)`: `fn(trace_dict)` is called for every finished trace.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._profilers: List[Callable[[str], Optional[ContextManager]]] = []
+        self._listeners: List[Callable[[Dict], None]] = []
+
+    # --------- RECORDING ---------
+    def observe(self, name: str, value: float, buckets=None, **labels) -> None:
+        if not self.enabled:
+            return
+        if buckets is None:
+            buckets = TOKEN_BUCKETS if name.endswith("_tokens") else SECONDS_BUCKETS
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(PREFIX + name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = _Histogram(buckets)
+            hist.observe(value)
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(PREFIX + name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges.setdefault(PREFIX + name, {})[_label_key(labels)] = float(value)
+
+    def annotate(self, **attrs) -> None:
+        """Add attributes to the current request trace (no-op outside a trace)."""
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.attrs.update(attrs)
+
+    @contextmanager
+    def span(self, stage: str):
+        if not self.enabled:
+            yield
+            return
+        with ExitStack() as stack:
+            for factory in self._profilers:
+                cm = factory(stage)
+                if cm is not None:
+                    stack.enter_context(cm)
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.record_span(stage, time.perf_counter() - start)
+
+    def record_span(self, stage: str, seconds: float) -> None:
+        """Record a stage timed elsewhere (e.g. in a worker process)."""
+        if not self.enabled:
+            return
+        self.observe("stage_duration_seconds", seconds, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append({"stage": stage, "ms": round(seconds * 1000, 3)})
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        if not self.enabled:
+            yield None
+            return
+        trace = Trace(name, **attrs)
+        token = _current_trace.set(trace)
+        start = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            trace.duration_s = time.perf_counter() - start
+            _current_trace.reset(token)
+            path = trace.attrs.get("path", "unknown")
+            self.observe("request_duration_seconds", trace.duration_s, trace=name, path=path)
+            self.inc("requests_total", trace=name, path=path)
+            self._finish(trace)
+
+    def _finish(self, trace: Trace) -> None:
+        record = trace.to_dict()
+        for listener in list(self._listeners):
+            try:
+                listener(record)
+            except Exception as e:  # a broken listener must not fail the request
+                print(f"⚠️ Trace listener failed: {e}")
+
+    # --------- HOOKS ---------
+    def add_profiler(self, factory: Callable[[str], Optional[ContextManager]]) -> None:
+        self._profilers.append(factory)
+
+    def add_trace_listener(self, listener: Callable[[Dict], None]) -> None:
+        self._listeners.append(listener)
+
+    def remove_trace_listener(self, listener: Callable[[Dict], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    # --------- EXPORT ---------
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', repr(float(bound))))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {hist.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {hist.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {hist.count}")
+            for kind, metrics_by_name in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(metrics_by_name.items()):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in sorted(series.items()):
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict:
+        """Histograms (with mean), counters and gauges as plain dicts."""
+        with self._lock:
+            return {
+                "histograms": {
+                    name: [
+                        {
+                            "labels": dict(key),
+                            "count": h.count,
+                            "sum": h.sum,
+                            "mean": h.sum / h.count if h.count else 0.0,
+                            "buckets": dict(zip([str(b) for b in h.buckets] + ["+Inf"], h.counts)),
+                        }
+                        for key, h in series.items()
+                    ]
+                    for name, series in self._histograms.items()
+                },
+                "counters": {
+                    name: [{"labels": dict(key), "value": v} for key, v in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "gauges": {
+                    name: [{"labels": dict(key), "value": v} for key, v in series.items()]
+                    for name, series in self._gauges.items()
+                },
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def reset_for_worker(self) -> None:
+        """
+        Start clean in a worker process: a fresh lock (another thread may have
+        held the parent's at fork time), no inherited data and no trace listeners.
+        """
+        self._lock = threading.Lock()
+        self._histograms, self._counters, self._gauges = {}, {}, {}
+        self._listeners = []
+
+
+def json_log_listener(path=TRACE_LOG_FILE) -> Callable[[Dict], None]:
+    """Trace listener that writes one JSON object per request to `path` (JSON lines)."""
+    logger = logging.getLogger("supportsphere.trace")
+    if not logger.handlers:
+        handler = logging.FileHandler(path, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    def listener(record: Dict) -> None:
+        logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+    return listener
+
+
+# Shared registry used by the pipeline, generator and server
+metrics = Metrics()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=metrics.reset_for_worker)
+if METRICS_ENABLED and METRICS_JSON_LOG:
+    metrics.add_trace_listener(json_log_listener())
@@ -1,57 +1,246 @@
 # rag_pipeline.py
 
-import os
 import json
 import time
-from typing import List, Dict, Tuple
+import queue
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Tuple, Optional, Iterator
+
+# Heavy libraries (torch, transformers, sentence-transformers, pandas) are imported
+# where they are first needed so that importing this module stays cheap.
+from config import (
+    VECTOR_BACKEND,
+    ANSWER_CACHE_ENABLED,
+    FAQ_FAST_PATH,
+    EMBEDDING_MODEL_NAME,
+    GENERATIVE_MODEL_NAME,
+    GENERATOR_BACKEND,
+    GENERATOR_BACKGROUND_LOAD,
+    GENERATOR_WARMUP,
+    GENERATOR_WORKERS,
+    GENERATOR_MAX_INPUT_TOKENS,
+    GENERATOR_MAX_TIME_S,
+    TOP_K,
+    CONTEXT_CANDIDATES,
+    RERANKER_ENABLED,
+    RERANKER_CANDIDATES,
+    RERANKER_ESCALATE_BELOW,
+    CHUNK_STORE_ENABLED,
+    CHUNK_STORE_REFRESH_S,
+    HYBRID_RETRIEVAL,
+    HYBRID_CANDIDATES,
+    RRF_K,
+    SESSION_ENABLED,
+    CATEGORY_ROUTING,
+)
+from retrievers import BaseRetriever, PineconeRetriever, get_retriever, embedding_fingerprint, verify_fingerprint
+from answer_cache import SemanticAnswerCache
+from embedding_service import EmbeddingService
+from faq_matcher import FaqMatcher
+from context_builder import ContextBuilder
+from reranker import CrossEncoderReranker
+from decoding_policy import DecodingPolicy, make_plan
+from category_router import load_category_router, category_router_path
+from chunk_store import load_chunk_store, chunk_store_path
+from sparse_index import BM25Index, load_sparse_index, sparse_index_path, reciprocal_rank_fusion
+from session_state import SessionStore, user_turns
+from escalation_store import get_store, write_escalation
+from metrics import metrics
+
+# Reply used when reranking finds nothing relevant enough to answer from
+LOW_CONFIDENCE_REPLIES = {
+    "Friendly": (
+        "I couldn't find a confident answer to this in our help articles, so I've passed "
+        "your question to our support team 🙏 A human agent will get back to you shortly."
+    ),
+    "Formal": (
+        "We could not find a reliable answer to your question in our knowledge base. "
+        "It has been forwarded to our support team, and an agent will contact you shortly."
+    ),
+}
+
+# Extra seconds a stream waits for the next token beyond the generation time cap
+STREAM_STALL_MARGIN_S = 5.0
 
-import pandas as pd
-from pandas.errors import EmptyDataError
-from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from transformers import T5ForConditionalGeneration, T5Tokenizer
-from pinecone import Pinecone
 
-from config import ESCALATION_LOG
+# ------------------ GENERATOR (FLAN-T5-Large) ------------------
 
-# ------------------ ENV ------------------
-load_dotenv()
+class GeneratorModel:
+    """FLAN-T5-Large for long, friendly, step-by-step answers."""
 
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "supportsphere-better")
-NAMESPACE = os.getenv("PINECONE_NAMESPACE", "support")
-PINECONE_REGION = os.getenv("PINECONE_REGION", "us-east-1")
+    def __init__(self, model_name: Optional[str] = None, backend: str = GENERATOR_BACKEND):
+        from transformers import T5Tokenizer
+        from generator_backends import load_generator_model
 
-if not PINECONE_API_KEY:
-    raise ValueError("PINECONE_API_KEY is not set. Add it to your .env file.")
+        model_name = model_name or GENERATIVE_MODEL_NAME
+        print(f"🔵 Loading {model_name} ({backend})...")
+        self.backend = backend
+        self.tokenizer = T5Tokenizer.from_pretrained(model_name)
+        self.model = load_generator_model(model_name, backend)
 
+    @staticmethod
+    def _generate_kwargs(plan: Dict) -> Dict:
+        """model.generate settings for a decoding plan (see decoding_policy.py)."""
+        kwargs = dict(
+            max_new_tokens=plan["max_new_tokens"],
+            num_beams=plan["num_beams"],
+            do_sample=False,
+        )
+        if plan["num_beams"] > 1:
+            kwargs["early_stopping"] = True
+        if plan.get("max_time"):
+            kwargs["max_time"] = plan["max_time"]  # stopping criterion on wall-clock time
+        return kwargs
 
-# ------------------ GENERATOR (FLAN-T5-Large) ------------------
+    @staticmethod
+    def _record_plan(plan: Dict, elapsed_s: float, batch: int = 1) -> bool:
+        """Record the decoding policy; returns whether the time cap stopped generation."""
+        metrics.inc("decoding_policy_total", batch, policy=plan["policy"])
+        capped = bool(plan.get("max_time")) and elapsed_s >= plan["max_time"]
+        if capped:
+            metrics.inc("decoding_time_capped_total", batch, policy=plan["policy"])
+        metrics.annotate(decoding=plan["policy"], max_new_tokens=plan["max_new_tokens"], time_capped=capped)
+        return capped
+
+    def generate(self, prompt: str, plan: Optional[Dict] = None) -> str:
+        """Generate one answer; without a plan, decodes with a (time-capped) full beam search."""
+        plan = plan or make_plan("full_beam")
+        with metrics.span("tokenize"):
+            inputs = self.tokenizer(
+                prompt,
+                return_tensors="pt",
+                truncation=True,
+                max_length=GENERATOR_MAX_INPUT_TOKENS,  # limit input length
+            )
+        start = time.perf_counter()
+        with metrics.span("generate"):
+            outputs = self.model.generate(**inputs, **self._generate_kwargs(plan))
+        plan["time_capped"] = self._record_plan(plan, time.perf_counter() - start)
+        self._record_tokens(inputs["input_ids"].shape[1], outputs.shape[1], plan["num_beams"])
+        with metrics.span("decode"):
+            return self.tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
 
-class GeneratorModel:
-    """FLAN-T5-Large for long, friendly, step-by-step answers."""
+    @staticmethod
+    def _record_tokens(tokens_in: int, tokens_out: int, num_beams: int, batch: int = 1) -> None:
+        metrics.observe("generator_input_tokens", tokens_in)
+        metrics.observe("generator_output_tokens", tokens_out)
+        metrics.inc("generations_total", batch, num_beams=num_beams)
+        metrics.annotate(tokens_in=tokens_in, tokens_out=tokens_out, num_beams=num_beams)
 
-    def __init__(self):
-        print("🔵 Loading FLAN-T5-Large...")
-        self.tokenizer = T5Tokenizer.from_pretrained("google/flan-t5-large")
-        self.model = T5ForConditionalGeneration.from_pretrained("google/flan-t5-large")
-
-    def generate(self, prompt: str) -> str:
-        inputs = self.tokenizer(
-            prompt,
-            return_tensors="pt",
-            truncation=True,
-            max_length=768,  # limit input length
-        )
-        outputs = self.model.generate(
-            **inputs,
-            max_length=512,     # how long the answer can be
-            temperature=0.4,
-            top_p=0.9,
-            num_beams=4,
-            early_stopping=True,
+    def stream(self, prompt: str, plan: Optional[Dict] = None) -> Iterator[str]:
+        """
+        Yield answer text as tokens are decoded.
+        Transformers streamers do not support beam search, so streaming always decodes
+        greedily; the plan still sets max new tokens and the time cap.
+        """
+        requested = plan
+        plan = dict(plan or make_plan("greedy"), num_beams=1)
+        from transformers import TextIteratorStreamer
+
+        with metrics.span("tokenize"):
+            inputs = self.tokenizer(
+                prompt,
+                return_tensors="pt",
+                truncation=True,
+                max_length=GENERATOR_MAX_INPUT_TOKENS,
+            )
+        # The time cap bounds the whole generation, so waiting longer than that
+        # for a single token means generate is stuck
+        max_time = plan.get("max_time") or GENERATOR_MAX_TIME_S
+        streamer = TextIteratorStreamer(
+            self.tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True,
+            timeout=max_time + STREAM_STALL_MARGIN_S if max_time else None,
         )
-        return self.tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
+        errors: List[BaseException] = []
+
+        def run() -> None:
+            try:
+                self.model.generate(**inputs, streamer=streamer, **self._generate_kwargs(plan))
+            except BaseException as e:  # re-raised by the consumer below
+                errors.append(e)
+            finally:
+                streamer.end()  # unblocks the consumer (a second end() after a normal finish is harmless)
+
+        worker = threading.Thread(target=run, name="generator-stream", daemon=True)
+        start = time.perf_counter()
+        first_token_s = None
+        worker.start()
+        try:
+            for text in streamer:
+                if text:
+                    if first_token_s is None:
+                        first_token_s = time.perf_counter() - start
+                        metrics.observe("stage_duration_seconds", first_token_s, stage="stream_first_token")
+                    yield text
+        except queue.Empty:
+            raise TimeoutError(f"Generator produced no tokens for {streamer.timeout:.0f}s.") from None
+        worker.join()
+        if errors:
+            raise errors[0]
+        elapsed = time.perf_counter() - start
+        metrics.observe("stage_duration_seconds", elapsed, stage="stream_generate")
+        metrics.observe("generator_input_tokens", inputs["input_ids"].shape[1])
+        metrics.inc("generations_total", num_beams=1)
+        capped = self._record_plan(plan, elapsed)
+        if requested is not None:
+            requested["time_capped"] = capped
+
+    def generate_batch(
+        self, prompts: List[str], batch_size: int = 8, plans: Optional[List[Dict]] = None
+    ) -> List[str]:
+        """
+        Generate answers for many prompts with padded batches.
+        Prompts are grouped by decoding policy, then bucketed by token length so each
+        batch pads as little as possible; results come back in the original order.
+        A plan shared by several prompts ends up "time_capped" if any of them was.
+        """
+        if not prompts:
+            return []
+        plans = plans or [make_plan("full_beam") for _ in prompts]
+        for plan in plans:
+            plan["time_capped"] = False
+
+        lengths = [
+            len(ids)
+            for ids in self.tokenizer(
+                prompts, truncation=True, max_length=GENERATOR_MAX_INPUT_TOKENS
+            )["input_ids"]
+        ]
+        order = sorted(range(len(prompts)), key=lambda i: (plans[i]["policy"], lengths[i]))
+        batches = []
+        for i in order:
+            if batches and len(batches[-1]) < batch_size and plans[batches[-1][0]]["policy"] == plans[i]["policy"]:
+                batches[-1].append(i)
+            else:
+                batches.append([i])
+
+        answers: List[str] = [""] * len(prompts)
+        for bucket in batches:
+            plan = plans[bucket[0]]
+            with metrics.span("tokenize"):
+                inputs = self.tokenizer(
+                    [prompts[i] for i in bucket],
+                    return_tensors="pt",
+                    padding="longest",
+                    truncation=True,
+                    max_length=GENERATOR_MAX_INPUT_TOKENS,
+                )
+            start = time.perf_counter()
+            with metrics.span("generate_batch"):
+                outputs = self.model.generate(**inputs, **self._generate_kwargs(plan))
+            capped = self._record_plan(plan, time.perf_counter() - start, len(bucket))
+            for i in bucket:
+                plans[i]["time_capped"] = plans[i]["time_capped"] or capped
+            metrics.observe("generator_batch_size", len(bucket), buckets=(1, 2, 4, 8, 16, 32))
+            self._record_tokens(inputs["input_ids"].shape[1], outputs.shape[1], plan["num_beams"], len(bucket))
+            with metrics.span("decode"):
+                decoded = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            for i, text in zip(bucket, decoded):
+                answers[i] = text.strip()
+        return answers
 
 
 # ------------------ RAG PIPELINE ------------------
@@ -59,82 +248,411 @@ class GeneratorModel:
 class SupportRAGPipeline:
     """
     Retrieval-augmented generation:
-    - Use Pinecone + MiniLM to retrieve relevant support snippets
+    - Use MiniLM + a vector backend (Pinecone or local FAISS) to retrieve relevant support snippets
     - Use FLAN-T5-Large to write a detailed, friendly answer
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        retriever: Optional[BaseRetriever] = None,
+        cache: Optional[SemanticAnswerCache] = None,
+        background_load: bool = GENERATOR_BACKGROUND_LOAD,
+        warm_up: bool = GENERATOR_WARMUP,
+        generator_model: Optional[str] = None,
+        embedder: Optional[EmbeddingService] = None,
+    ):
         print("💠 Initializing SupportRAGPipeline...")
+        self.startup_timings: Dict[str, float] = {}
+        self._started = time.perf_counter()
+        self.generator_model = generator_model or GENERATIVE_MODEL_NAME
+
+        # Generator worker processes are forked first, while no model has run and no
+        # thread has started here; they load and warm up alongside the rest of startup
+        self._pool = None
+        if GENERATOR_WORKERS > 0:
+            from generator_pool import GeneratorPool
+
+            t0 = time.perf_counter()
+            self._pool = GeneratorPool(model_name=self.generator_model, warm_up=warm_up, wait=False)
+            self.startup_timings["generator_pool_s"] = time.perf_counter() - t0
 
         # Embedding model for retrieval (fast + light)
         print("🟢 Loading embedding model for retrieval...")
-        self.embedder = SentenceTransformer(
-            "sentence-transformers/paraphrase-MiniLM-L3-v2"
+        t0 = time.perf_counter()
+        # (must be the same model the index was built with; cached and batched across sessions)
+        self.embedder = embedder or EmbeddingService(EMBEDDING_MODEL_NAME)
+        self.startup_timings["embedder_s"] = time.perf_counter() - t0
+
+        # Vector backend (Pinecone by default, FAISS for local / air-gapped runs)
+        print(f"🟣 Connecting to {VECTOR_BACKEND} vector store...")
+        t0 = time.perf_counter()
+        # Local chunk texts/vectors from ingestion, if any (Pinecone then returns ids only);
+        # an injected retriever brings its own texts
+        self.chunk_store = (
+            load_chunk_store(chunk_store_path()) if CHUNK_STORE_ENABLED and retriever is None else None
+        )
+        self.retriever = retriever or get_retriever(chunk_store=self.chunk_store)
+        verify_fingerprint(
+            self.retriever,
+            embedding_fingerprint(
+                EMBEDDING_MODEL_NAME, self.embedder.get_sentence_embedding_dimension()
+            ),
         )
 
-        # Pinecone client
-        print("🟣 Connecting to Pinecone index...")
-        pc = Pinecone(api_key=PINECONE_API_KEY)
-        self.index = pc.Index(INDEX_NAME)
+        # Sparse (BM25) index for hybrid retrieval, if ingestion built one
+        # (for the configured backend only: an injected retriever holds other chunks)
+        self.sparse_index = (
+            load_sparse_index(sparse_index_path()) if HYBRID_RETRIEVAL and retriever is None else None
+        )
+        if self.sparse_index is not None:
+            print(f"🟤 Hybrid retrieval on (BM25 over {self.sparse_index.num_docs} chunks).")
+        self._sparse_checked = time.monotonic()
 
-        # Generator model
-        self.generator = GeneratorModel()
+        # Nearest-centroid category router, if ingestion built one (same caveat)
+        self.router = (
+            load_category_router(category_router_path()) if CATEGORY_ROUTING and retriever is None else None
+        )
+        if self.router is not None:
+            print(f"🧭 Category routing on ({len(self.router.categories)} categories).")
+        self.startup_timings["retriever_s"] = time.perf_counter() - t0
+
+        # Optional cross-encoder reranker between retrieval and context building
+        self.reranker: Optional[CrossEncoderReranker] = None
+        if RERANKER_ENABLED:
+            t0 = time.perf_counter()
+            self.reranker = CrossEncoderReranker()
+            self.startup_timings["reranker_s"] = time.perf_counter() - t0
+
+        # Token-budgeted context assembly (dedup + MMR over retrieved chunks)
+        self.context_builder = ContextBuilder(
+            self.embedder.encode,
+            tokenizer_name=self.generator_model,
+            doc_vectors=self.chunk_store.vectors_for if self.chunk_store is not None else None,
+        )
 
-        print("✅ SupportRAGPipeline ready.")
+        # Decoding policy (greedy / short beam / full beam per request, with a time cap)
+        self.decoding = DecodingPolicy()
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
 
-    # --------- RETRIEVAL ---------
-    def _retrieve(self, question: str, top_k: int = 5) -> List[Dict]:
-        """Retrieve top FAQ chunks from Pinecone."""
-        q_vec = self.embedder.encode([question])[0].tolist()
-
-        res = self.index.query(
-            namespace=NAMESPACE,
-            vector=q_vec,
-            top_k=top_k,
-            include_metadata=True,
+        # Curated FAQ fast path (answers without retrieval or generation)
+        self.faq_matcher = FaqMatcher(self.embedder) if FAQ_FAST_PATH else None
+
+        # Semantic answer cache in front of generation
+        if cache is None and ANSWER_CACHE_ENABLED:
+            cache = SemanticAnswerCache()
+        self.cache = cache
+
+        # Per-conversation retrieval state (rolling query embedding + last candidates)
+        self.sessions = SessionStore()
+
+        self.startup_timings["retrieval_ready_s"] = time.perf_counter() - self._started
+        print(f"⏱️ Retrieval ready in {self.startup_timings['retrieval_ready_s']:.1f}s.")
+
+        # Generator model (the slow part) — optionally warmed on a background thread
+        self._generator: Optional[GeneratorModel] = None
+        self._generator_error: Optional[BaseException] = None
+        self._generator_ready = threading.Event()
+        self._warm_up_on_load = warm_up
+
+        if background_load:
+            threading.Thread(target=self._load_generator, name="generator-loader", daemon=True).start()
+            print("⏳ Generator is loading in the background...")
+        else:
+            self._load_generator()
+            if self._generator_error is not None:
+                raise self._generator_error
+
+    # --------- LAZY GENERATOR / READINESS ---------
+    def _load_generator(self) -> None:
+        try:
+            t0 = time.perf_counter()
+            if self._pool is not None:
+                # Worker processes share the weights and warm themselves up
+                self._pool.wait_until_ready()
+                self._generator = self._pool
+            else:
+                self._generator = GeneratorModel(model_name=self.generator_model)
+            self.startup_timings["generator_s"] = time.perf_counter() - t0
+            if self._warm_up_on_load and self._pool is None:
+                self.warm_up()
+            self.startup_timings["ready_s"] = time.perf_counter() - self._started
+            print(
+                "✅ SupportRAGPipeline ready in {:.1f}s ({}).".format(
+                    self.startup_timings["ready_s"],
+                    ", ".join(f"{k}={v:.2f}" for k, v in self.startup_timings.items()),
+                )
+            )
+        except BaseException as e:  # surfaced to callers through `generator`
+            self._generator_error = e
+            print(f"❌ Generator failed to load: {e}")
+        finally:
+            self._generator_ready.set()
+
+    def warm_up(self) -> None:
+        """Run one short dummy generation so kernels and caches are initialized."""
+        t0 = time.perf_counter()
+        # Uncapped: a slow first call (cold caches) must not be cut short by the time cap
+        self._generator.generate(
+            "Answer briefly: how do I reset my password?", plan=make_plan("full_beam", max_time_s=0)
         )
+        self.startup_timings["warm_up_s"] = time.perf_counter() - t0
+
+    @property
+    def generator(self):
+        """The generator, blocking until the background load has finished."""
+        self._generator_ready.wait()
+        if self._generator_error is not None:
+            raise RuntimeError("Generator model failed to load.") from self._generator_error
+        return self._generator
+
+    def is_ready(self) -> bool:
+        """True once the generator is loaded (and warmed up, if enabled) and no pool worker has died."""
+        return self._generator_ready.is_set() and self._generator_failure() is None
+
+    def _generator_failure(self) -> Optional[BaseException]:
+        if self._generator_error is not None:
+            return self._generator_error
+        return self._pool.broken if self._pool is not None else None
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        self._generator_ready.wait(timeout)
+        return self.is_ready()
+
+    def status(self) -> Dict:
+        """Readiness signal for UIs and health checks."""
+        return {
+            "retrieval_ready": True,
+            "generator_ready": self.is_ready(),
+            "generator_error": repr(self._generator_failure()) if self._generator_failure() else None,
+            "faq_fast_path": self.faq_matcher.stats() if self.faq_matcher is not None else None,
+            "sessions": self.sessions.stats(),
+            "embeddings": self.embedder.stats(),
+            "category_router": self.router.stats() if self.router is not None else None,
+            "vector_client": (
+                self.retriever.index.stats() if isinstance(self.retriever, PineconeRetriever) else None
+            ),
+            "startup_timings": dict(self.startup_timings),
+        }
 
-        docs: List[Dict] = []
-        for match in res.matches:
-            m = match.metadata or {}
-            docs.append(
-                {
-                    "question": m.get("question", ""),
-                    "answer": m.get("answer", ""),
-                    "row_id": m.get("row_id"),
-                    "chunk_id": m.get("chunk_id"),
-                    "score": float(match.score),
-                }
+    # --------- CATEGORY ROUTING ---------
+    def categories(self) -> List[str]:
+        """Categories the router knows (for category pickers in UIs)."""
+        return self.router.categories if self.router is not None else []
+
+    def _route(self, q_vecs, categories: Optional[List[Optional[str]]] = None) -> List[Optional[str]]:
+        """Category per question: the one asked for, else the router's pick (None = whole index)."""
+        routes = list(categories) if categories else [None] * len(q_vecs)
+        auto = [i for i, c in enumerate(routes) if c is None]
+        if auto and self.router is not None:
+            with metrics.span("route"):
+                for i, c in zip(auto, self.router.route([q_vecs[i] for i in auto])):
+                    routes[i] = c
+        for c in routes:
+            metrics.inc("category_routes_total", category=c or "all")
+        return routes
+
+    def _dense_query(
+        self, vectors: List[List[float]], top_k: int, routes: List[Optional[str]]
+    ) -> List[List[Dict]]:
+        """Vector query per route; routes without matching chunks are searched unfiltered (and reset)."""
+        with metrics.span("vector_query"):
+            results = self.retriever.query_batch(vectors, top_k=top_k, categories=routes)
+            # e.g. an index ingested before chunks carried categories
+            empty = [i for i, (c, docs) in enumerate(zip(routes, results)) if c is not None and not docs]
+            if empty:
+                metrics.inc("category_fallbacks_total", len(empty))
+                for i, docs in zip(empty, self.retriever.query_batch([vectors[i] for i in empty], top_k=top_k)):
+                    results[i] = docs
+                    routes[i] = None
+        return results
+
+    # --------- RETRIEVAL ---------
+    def _retrieve_many(
+        self, questions: List[str], q_vecs, top_k: int = TOP_K, categories: Optional[List[Optional[str]]] = None
+    ) -> List[List[Dict]]:
+        """
+        Dense retrieval for each question, within its category (given, or
+        picked by the router); when a BM25 index is loaded, both candidate
+        lists are fused with reciprocal-rank fusion.
+        """
+        vectors = [v.tolist() for v in q_vecs]
+        routes = self._route(q_vecs, categories)
+        sparse_index = self._current_sparse_index()
+        if sparse_index is None:
+            return self._dense_query(vectors, top_k, routes)
+
+        n = max(top_k, HYBRID_CANDIDATES)
+        dense = self._dense_query(vectors, n, routes)
+        with metrics.span("sparse_query"):
+            sparse = [sparse_index.search(q, top_k=n, category=c) for q, c in zip(questions, routes)]
+        return [
+            reciprocal_rank_fusion([d, s], k=RRF_K, top_k=top_k)
+            for d, s in zip(dense, sparse)
+        ]
+
+    def _current_sparse_index(self) -> Optional[BM25Index]:
+        """
+        The BM25 index; like the chunk store, it is checked every CHUNK_STORE_REFRESH_S
+        seconds and reloaded when ingestion has rewritten it. A reload builds a new
+        index and swaps it in, so searches already running keep the old one.
+        """
+        index = self.sparse_index
+        if index is None or not CHUNK_STORE_REFRESH_S:
+            return index
+        if time.monotonic() - self._sparse_checked < CHUNK_STORE_REFRESH_S:
+            return index
+        self._sparse_checked = time.monotonic()
+        if index.changed_on_disk():
+            try:
+                index = BM25Index(index.path, k1=index.k1, b=index.b)
+            except FileNotFoundError:
+                return self.sparse_index  # compacted while loading; retried on the next check
+            self.sparse_index = index
+            print(f"🔄 BM25 index changed on disk; reloaded {index.num_docs} chunks.")
+        return index
+
+    def _retrieve(
+        self, question: str, top_k: int = TOP_K, q_vec=None, category: Optional[str] = None
+    ) -> List[Dict]:
+        """Retrieve top FAQ chunks from the configured vector backend (+ BM25 when available)."""
+        if q_vec is None:
+            q_vec = self.embedder.encode([question])[0]
+        return self._retrieve_many([question], [q_vec], top_k=top_k, categories=[category])[0]
+
+    def retrieve_batch(
+        self, questions: List[str], top_k: int = TOP_K, categories: Optional[List[Optional[str]]] = None
+    ) -> List[List[Dict]]:
+        """Retrieve for many questions with one embedding call and one batched query."""
+        if not questions:
+            return []
+        with metrics.trace("retrieve_batch", batch=len(questions), path="retrieve"):
+            with metrics.span("embed"):
+                q_vecs = self.embedder.encode(questions, batch_size=len(questions))
+            return self._retrieve_many(questions, q_vecs, top_k=top_k, categories=categories)
+
+    # --------- CONVERSATION STATE ---------
+    def _session_turn(
+        self, question: str, q_vec, session_id: Optional[str], history: Optional[List[Dict]],
+        category: Optional[str] = None,
+    ) -> Tuple[Optional[Dict], Dict]:
+        """
+        (state, turn) for this question (see SessionStore.plan_turn). Without a
+        stored state, one is rebuilt from the last user turns of `history`.
+        """
+        if not SESSION_ENABLED:
+            session_id, history = None, None
+        state = self.sessions.get(session_id)
+        if state is None and history:
+            earlier = user_turns(history)
+            if earlier:
+                with metrics.span("embed_history"):
+                    vectors = self.embedder.encode(earlier, batch_size=len(earlier))
+                state = self.sessions.from_history(earlier, vectors)
+        turn = self.sessions.plan_turn(state, question, q_vec, category)
+        metrics.inc("session_turns_total", mode=turn["mode"])
+        metrics.annotate(session=turn["mode"])
+        return state, turn
+
+    def _conversation_candidates(self, turn: Dict, category: Optional[str] = None) -> List[Dict]:
+        """Reuse the session's candidates, or retrieve (follow-ups are fused with the previous ones)."""
+        if turn["mode"] == "reuse":
+            return turn["candidates"]
+        n = self._candidate_count()
+        candidates = self._retrieve_many([turn["query"]], [turn["vector"]], top_k=n, categories=[category])[0]
+        if turn["mode"] == "followup" and turn["candidates"]:
+            candidates = reciprocal_rank_fusion([candidates, turn["candidates"]], k=RRF_K, top_k=n)
+        return candidates
+
+    def end_session(self, session_id: str) -> None:
+        """Forget a conversation's retrieval state (e.g. when the chat is cleared)."""
+        self.sessions.drop(session_id)
+
+    # --------- RERANKING ---------
+    def _candidate_count(self) -> int:
+        n = max(TOP_K, CONTEXT_CANDIDATES)
+        return max(n, RERANKER_CANDIDATES) if self.reranker is not None else n
+
+    def _rerank_many(
+        self, questions: List[str], candidate_lists: List[List[Dict]]
+    ) -> List[Tuple[List[Dict], bool]]:
+        """
+        (candidates, escalate) per question. With a reranker, candidates are
+        reordered by cross-encoder score and `escalate` is True when even the
+        best one scores below RERANKER_ESCALATE_BELOW.
+        """
+        if self.reranker is None:
+            return [(c, False) for c in candidate_lists]
+
+        with metrics.span("rerank"):
+            reranked = self.reranker.rerank_many(questions, candidate_lists)
+        results = []
+        for docs in reranked:
+            top = docs[0]["rerank_score"] if docs else None
+            escalate = bool(RERANKER_ESCALATE_BELOW) and (
+                not docs or (top is not None and top < RERANKER_ESCALATE_BELOW)
             )
-        return docs
+            results.append((docs[:CONTEXT_CANDIDATES], escalate))
+        return results
 
-    # --------- CONTEXT BUILDING ---------
     @staticmethod
-    def _build_context(docs: List[Dict], max_chars: int = 1200) -> str:
-        """
-        Build a compact context string from retrieved docs,
-        truncated to avoid overflow and truncation in generation.
-        """
-        pieces = []
-        total = 0
-        for d in docs:
-            text = (d.get("answer") or "").strip()
-            if not text:
-                continue
-            if total + len(text) > max_chars:
-                break
-            pieces.append(text)
-            total += len(text)
-        return "\n\n".join(pieces)
+    def _escalate_low_confidence(question: str, tone: str, docs: List[Dict]) -> str:
+        """Log the question for a human agent and return the templated reply."""
+        reply = LOW_CONFIDENCE_REPLIES.get(tone, LOW_CONFIDENCE_REPLIES["Formal"])
+        metrics.inc("auto_escalations_total")
+        top = docs[0].get("rerank_score") if docs else None
+        log_escalation(
+            user_question=question,
+            model_answer=reply,
+            reason=(
+                f"Auto-escalated: low retrieval confidence (top rerank score {top:.3f})."
+                if top is not None
+                else "Auto-escalated: no relevant support articles found."
+            ),
+            top_docs=docs,
+        )
+        return reply
+
+    # --------- DECODING ---------
+    @contextmanager
+    def _generating(self, calls: int = 1):
+        """Count generate calls in flight; the decoding policy sheds beams under load."""
+        with self._inflight_lock:
+            self._inflight += calls
+        try:
+            yield
+        finally:
+            with self._inflight_lock:
+                self._inflight -= calls
+
+    def _load(self, extra: int = 0) -> int:
+        """Generate calls in flight per generator worker."""
+        return (self._inflight + extra) // max(GENERATOR_WORKERS, 1)
+
+    # --------- CONTEXT BUILDING ---------
+    def _build_context(
+        self, question: str, docs: List[Dict], tone: str = "Friendly", q_vec=None, previous: Optional[str] = None
+    ) -> str:
+        """
+        Build the context from retrieved docs so that instructions, context and
+        question together fit in GENERATOR_MAX_INPUT_TOKENS (nothing gets truncated).
+        """
+        with metrics.span("build_context"):
+            overhead = self.context_builder.count_tokens([self._build_prompt(question, "", tone, previous)])[0]
+            budget = GENERATOR_MAX_INPUT_TOKENS - overhead - 1  # </s>
+            if q_vec is None:
+                q_vec = self.embedder.encode([question])[0]
+            return self.context_builder.build(q_vec, docs, budget)
 
     # --------- PROMPT BUILDING (with vertical numbered steps) ---------
     @staticmethod
-    def _build_prompt(question: str, context: str, tone: str = "Friendly") -> str:
+    def _build_prompt(question: str, context: str, tone: str = "Friendly", previous: Optional[str] = None) -> str:
         """
         Build a clean prompt with strict formatting instructions:
         - Each step MUST appear on a new line.
         - No inline numbering.
         - No merged steps.
+        `previous` is the earlier question a follow-up refers to, if any.
         """
 
         if tone == "Friendly":
@@ -148,6 +666,10 @@ class SupportRAGPipeline:
                 "Do NOT use emojis."
             )
 
+        previous_block = (
+            f'Earlier in this conversation the customer asked:\n"""{previous}"""\n\n' if previous else ""
+        )
+
         return f"""
 You are **SupportSphere**, an expert customer-support AI assistant.
 
@@ -178,27 +700,250 @@ Internal support knowledge you can rely on (summarize and rewrite it; do not cop
 
 {context}
 
-Customer question:
+{previous_block}Customer question:
 \"\"\"{question}\"\"\"
 
 Now write the final answer following ALL the formatting rules above,
 making sure each numbered step is on its own line.
 """
 
-    # --------- MAIN ANSWER METHOD ---------
-    def answer_question(self, question: str, tone: str = "Friendly") -> Tuple[str, List[Dict]]:
-        # 1. Retrieve from Pinecone
-        docs = self._retrieve(question, top_k=5)
+    # --------- FAST PATHS (FAQ match, answer cache) ---------
+    def _fast_answer(self, q_vec, tone: str, use_cache: bool = True) -> Optional[Tuple[str, List[Dict]]]:
+        """
+        Curated FAQ answer or cached answer for this question, if any
+        (`use_cache=False` for answers retrieved within a chosen category).
+        """
+        # Curated FAQ match: no vector store or generator involved
+        if self.faq_matcher is not None:
+            with metrics.span("faq_match"):
+                faq_hit = self.faq_matcher.answer(q_vec, tone)
+            if faq_hit is not None:
+                metrics.annotate(path="faq")
+                return faq_hit
+
+        # Semantic cache: near-identical questions in the same tone skip generation
+        if self.cache is not None and use_cache:
+            with metrics.span("cache_lookup"):
+                cached = self.cache.lookup(q_vec, tone)
+            metrics.inc("answer_cache_lookups_total", result="hit" if cached is not None else "miss")
+            metrics.annotate(cache_hit=cached is not None)
+            if cached is not None:
+                metrics.annotate(path="cache")
+                return cached
+        return None
+
+    def _cache_answer(self, q_vec, tone: str, question: str, answer: str, docs: List[Dict], plan: Dict) -> None:
+        """Store a generated answer in the semantic cache, unless the time cap cut it short."""
+        if plan.get("time_capped"):
+            metrics.inc("answer_cache_skipped_total", reason="time_capped")
+            return
+        self.cache.store(q_vec, tone, question, answer, docs)
 
-        # 2. Build compact context string
-        context = self._build_context(docs)
+    # --------- MAIN ANSWER METHOD ---------
+    def answer_question(
+        self,
+        question: str,
+        tone: str = "Friendly",
+        history: Optional[List[Dict]] = None,
+        session_id: Optional[str] = None,
+        category: Optional[str] = None,
+    ) -> Tuple[str, List[Dict]]:
+        """
+        `history` is the chat so far ({"role", "content"} dicts, without this
+        question); `session_id` keeps retrieval state across calls of one conversation.
+        `category` limits retrieval to that category (otherwise the router may pick one).
+        """
+        with metrics.trace("answer_question", tone=tone):
+            return self._answer_question(question, tone, history, session_id, category)
+
+    def _answer_question(
+        self,
+        question: str,
+        tone: str,
+        history: Optional[List[Dict]],
+        session_id: Optional[str],
+        category: Optional[str] = None,
+    ) -> Tuple[str, List[Dict]]:
+        with metrics.span("embed"):
+            q_vec = self.embedder.encode([question])[0]
+        state, turn = self._session_turn(question, q_vec, session_id, history, category)
+        follow_up = turn["previous"] is not None
+
+        # 0. Curated FAQ / semantic cache (not for follow-ups: they depend on the conversation)
+        if not follow_up:
+            fast = self._fast_answer(q_vec, tone, use_cache=category is None)
+            if fast is not None:
+                self.sessions.advance(session_id, state, turn, question, q_vec, [])
+                return fast
+
+        # 1. Retrieve candidates (or reuse the session's) and rerank them, if enabled
+        retrieved = self._conversation_candidates(turn, category)
+        self.sessions.advance(session_id, state, turn, question, q_vec, retrieved, category)
+        candidates, escalate = self._rerank_many([question], [retrieved])[0]
+        docs = candidates[:TOP_K]
+        metrics.annotate(n_candidates=len(candidates))
+
+        # 1b. Nothing relevant enough: hand over to a human instead of generating
+        if escalate:
+            metrics.annotate(path="escalated")
+            return self._escalate_low_confidence(question, tone, docs), docs
+
+        # 2. Build a deduplicated context that fits the token budget
+        context = self._build_context(question, candidates, tone, q_vec=turn["vector"], previous=turn["previous"])
 
         # 3. Build prompt and generate detailed answer
-        prompt = self._build_prompt(question, context, tone)
-        answer = self.generator.generate(prompt)
+        prompt = self._build_prompt(question, context, tone, turn["previous"])
+        with metrics.span("wait_for_generator"):
+            generator = self.generator
+        plan = self.decoding.plan(question, context, load=self._load())
+        with self._generating():
+            answer = generator.generate(prompt, plan=plan)
+        metrics.annotate(path="generated")
+
+        if self.cache is not None and not follow_up and category is None:
+            self._cache_answer(q_vec, tone, question, answer, docs, plan)
 
         return answer, docs
 
+    # --------- STREAMING ANSWER ---------
+    def stream_answer(
+        self,
+        question: str,
+        tone: str = "Friendly",
+        history: Optional[List[Dict]] = None,
+        session_id: Optional[str] = None,
+        category: Optional[str] = None,
+    ) -> Tuple[Iterator[str], List[Dict]]:
+        """
+        Retrieve eagerly, then return (chunks, docs) where `chunks` yields the
+        answer text as it is generated. FAQ matches and cache hits yield the answer at once.
+        `history` / `session_id` / `category` work as in answer_question.
+        The trace covers everything up to the first chunk; streamed generation is
+        recorded under the "stream_first_token" / "stream_generate" stages.
+        """
+        with metrics.trace("stream_answer", tone=tone):
+            with metrics.span("embed"):
+                q_vec = self.embedder.encode([question])[0]
+            state, turn = self._session_turn(question, q_vec, session_id, history, category)
+            follow_up = turn["previous"] is not None
+
+            fast = self._fast_answer(q_vec, tone, use_cache=category is None) if not follow_up else None
+            if fast is not None:
+                self.sessions.advance(session_id, state, turn, question, q_vec, [])
+                answer, docs = fast
+                return iter([answer]), docs
+
+            retrieved = self._conversation_candidates(turn, category)
+            self.sessions.advance(session_id, state, turn, question, q_vec, retrieved, category)
+            candidates, escalate = self._rerank_many([question], [retrieved])[0]
+            docs = candidates[:TOP_K]
+            if escalate:
+                metrics.annotate(path="escalated")
+                return iter([self._escalate_low_confidence(question, tone, docs)]), docs
+
+            context = self._build_context(
+                question, candidates, tone, q_vec=turn["vector"], previous=turn["previous"]
+            )
+            prompt = self._build_prompt(question, context, tone, turn["previous"])
+            plan = self.decoding.plan(question, context, load=self._load())
+
+            with metrics.span("wait_for_generator"):
+                generator = self.generator  # waits here (not mid-stream) if still loading
+            metrics.annotate(path="generated")
+
+        def chunks() -> Iterator[str]:
+            parts = []
+            with self._generating():
+                for text in generator.stream(prompt, plan=plan):
+                    parts.append(text)
+                    yield text
+            if self.cache is not None and not follow_up and category is None:
+                self._cache_answer(q_vec, tone, question, "".join(parts).strip(), docs, plan)
+
+        return chunks(), docs
+
+    # --------- BATCHED ANSWERING ---------
+    def answer_questions(
+        self,
+        questions: List[str],
+        tone: str = "Friendly",
+        batch_size: int = 8,
+        categories: Optional[List[Optional[str]]] = None,
+    ) -> List[Tuple[str, List[Dict]]]:
+        """
+        Answer many questions at once: one embedding call, one batched
+        vector query and padded, length-bucketed generation.
+        `categories` (aligned with `questions`) work as `category` in answer_question.
+        """
+        if not questions:
+            return []
+        with metrics.trace("answer_questions", tone=tone, batch=len(questions)):
+            return self._answer_questions(questions, tone, batch_size, categories or [None] * len(questions))
+
+    def _answer_questions(
+        self, questions: List[str], tone: str, batch_size: int, categories: List[Optional[str]]
+    ) -> List[Tuple[str, List[Dict]]]:
+        # 1. Embed all questions in a single forward pass
+        with metrics.span("embed"):
+            q_vecs = self.embedder.encode(questions, batch_size=max(len(questions), 1))
+
+        results: List[Optional[Tuple[str, List[Dict]]]] = [None] * len(questions)
+        for i, v in enumerate(q_vecs):
+            results[i] = self._fast_answer(v, tone, use_cache=categories[i] is None)
+        pending = [i for i, r in enumerate(results) if r is None]
+        metrics.annotate(fast_path=len(questions) - len(pending))
+        if not pending:
+            metrics.annotate(path="cache")
+            return results
+
+        # 2. One batched retrieval call for the cache misses
+        pending_questions = [questions[i] for i in pending]
+        all_candidates = self._retrieve_many(
+            pending_questions,
+            [q_vecs[i] for i in pending],
+            top_k=self._candidate_count(),
+            categories=[categories[i] for i in pending],
+        )
+
+        # 2b. Rerank; low-confidence questions are escalated instead of generated
+        generate = []
+        for i, (candidates, escalate) in zip(
+            pending, self._rerank_many(pending_questions, all_candidates)
+        ):
+            docs = candidates[:TOP_K]
+            if escalate:
+                results[i] = (self._escalate_low_confidence(questions[i], tone, docs), docs)
+            else:
+                generate.append((i, candidates))
+        metrics.annotate(escalated=len(pending) - len(generate))
+        if not generate:
+            metrics.annotate(path="escalated")
+            return results
+        pending = [i for i, _ in generate]
+        all_candidates = [c for _, c in generate]
+        all_docs = [c[:TOP_K] for c in all_candidates]
+
+        # 3. Build prompts and generate over padded batches
+        contexts = [
+            self._build_context(questions[i], c, tone, q_vec=q_vecs[i])
+            for i, c in zip(pending, all_candidates)
+        ]
+        prompts = [self._build_prompt(questions[i], ctx, tone) for i, ctx in zip(pending, contexts)]
+        n_calls = -(-len(prompts) // batch_size)
+        load = self._load(extra=n_calls - 1)
+        plans = [self.decoding.plan(questions[i], ctx, load=load) for i, ctx in zip(pending, contexts)]
+        with metrics.span("wait_for_generator"):
+            generator = self.generator
+        with self._generating(n_calls):
+            answers = generator.generate_batch(prompts, batch_size=batch_size, plans=plans)
+        metrics.annotate(path="generated")
+
+        for i, answer, docs, plan in zip(pending, answers, all_docs, plans):
+            results[i] = (answer, docs)
+            if self.cache is not None and categories[i] is None:
+                self._cache_answer(q_vecs[i], tone, questions[i], answer, docs, plan)
+        return results
+
 
 # ------------------ ESCALATION LOGGING ------------------
 
@@ -209,9 +954,7 @@ def log_escalation(
     top_docs: List[Dict],
     user_email: str = "",
 ) -> None:
-    """Append escalation info to CSV log in a robust way."""
-    ESCALATION_LOG.parent.mkdir(parents=True, exist_ok=True)
-
+    """Append escalation info to the escalation log (one O(1) insert, safe across sessions)."""
     top_qas = [
         {
             "question": d.get("question", ""),
@@ -229,14 +972,9 @@ def log_escalation(
         "reason": reason,
         "top_docs": json.dumps(top_qas, ensure_ascii=False),
     }
+    write_escalation(row)
 
-    if ESCALATION_LOG.exists() and ESCALATION_LOG.stat().st_size > 0:
-        try:
-            df = pd.read_csv(ESCALATION_LOG)
-        except EmptyDataError:
-            df = pd.DataFrame(columns=row.keys())
-    else:
-        df = pd.DataFrame(columns=row.keys())
-
-    df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-    df.to_csv(ESCALATION_LOG, index=False)
+
+def recent_escalations(n: int = 10) -> List[Dict]:
+    """Latest `n` escalations (oldest first) without loading the whole log."""
+    return get_store().tail(n)
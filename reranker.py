@@ -0,0 +1,115 @@
+# reranker.py
+
+import time
+import inspect
+from typing import List, Dict
+
+import numpy as np
+
+from config import (
+    RERANKER_MODEL_NAME,
+    RERANKER_BATCH_SIZE,
+    RERANKER_BUDGET_MS,
+)
+
+
+def _pair_text(doc: Dict) -> str:
+    question = (doc.get("question") or "").strip()
+    answer = (doc.get("answer") or "").strip()
+    return f"{question}\n{answer}" if question else answer
+
+
+def _identity_activation():
+    import torch
+
+    return torch.nn.Identity()
+
+
+def _logit_kwargs(model) -> Dict:
+    """
+    `predict` arguments that make a CrossEncoder return raw logits. By default it
+    applies the model's own activation (Sigmoid for ms-marco models), which would be
+    squashed a second time here; the argument was renamed in sentence-transformers 4.
+    """
+    params = inspect.signature(model.predict).parameters
+    for name in ("activation_fn", "activation_fct"):
+        if name in params:
+            return {name: _identity_activation()}
+    return {}
+
+
+class CrossEncoderReranker:
+    """
+    Re-scores retrieved chunks with a small cross-encoder (question, chunk) on CPU.
+
+    Pairs are scored in batches, best retrieval ranks first. Once the latency
+    budget is spent, the remaining candidates are not scored and keep their
+    retrieval order behind the scored ones (the first batch is always scored).
+    Raw logits are squashed to 0..1 once, here, so thresholds do not depend on the
+    model's logit scale or on the activation it was saved with.
+    """
+
+    def __init__(
+        self,
+        model_name: str = RERANKER_MODEL_NAME,
+        batch_size: int = RERANKER_BATCH_SIZE,
+        budget_ms: float = RERANKER_BUDGET_MS,
+        model=None,
+    ):
+        if model is None:
+            from sentence_transformers import CrossEncoder
+
+            print(f"🟠 Loading reranker {model_name}...")
+            model = CrossEncoder(model_name, device="cpu")
+        self.model = model
+        self._predict_kwargs = _logit_kwargs(model)
+        self.batch_size = batch_size
+        self.budget_s = budget_ms / 1000.0
+        self.budget_exceeded = 0
+
+    def _score(self, pairs: List[List[str]], budget_s: float) -> np.ndarray:
+        """Sigmoid scores for as many pairs as fit in the budget (NaN for the rest)."""
+        scores = np.full(len(pairs), np.nan, dtype=np.float32)
+        start = time.perf_counter()
+        for b in range(0, len(pairs), self.batch_size):
+            if b > 0 and time.perf_counter() - start > budget_s:
+                self.budget_exceeded += 1
+                break
+            logits = np.asarray(
+                self.model.predict(
+                    pairs[b:b + self.batch_size], batch_size=self.batch_size, **self._predict_kwargs
+                ),
+                dtype=np.float32,
+            )
+            scores[b:b + len(logits)] = 1.0 / (1.0 + np.exp(-logits))
+        return scores
+
+    def rerank_many(self, questions: List[str], candidate_lists: List[List[Dict]]) -> List[List[Dict]]:
+        """
+        Rerank each question's candidates; all pairs go through the model together.
+        Returned docs are copies with a "rerank_score" field (None if not scored).
+        """
+        # Interleave by rank so a spent budget cuts the tail of every list, not whole questions
+        order = [
+            (qi, rank)
+            for rank in range(max((len(c) for c in candidate_lists), default=0))
+            for qi, c in enumerate(candidate_lists)
+            if rank < len(c)
+        ]
+        pairs = [[questions[qi], _pair_text(candidate_lists[qi][rank])] for qi, rank in order]
+        scores = self._score(pairs, self.budget_s * max(len(questions), 1))
+
+        per_question: List[List[Dict]] = [[] for _ in candidate_lists]
+        for (qi, rank), s in zip(order, scores):
+            doc = dict(candidate_lists[qi][rank])
+            doc["rerank_score"] = None if np.isnan(s) else float(s)
+            per_question[qi].append(doc)
+
+        # Scored docs by score, then unscored ones in retrieval order (stable sort)
+        return [
+            sorted(docs, key=lambda d: -d["rerank_score"] if d["rerank_score"] is not None else np.inf)
+            for docs in per_question
+        ]
+
+    def rerank(self, question: str, docs: List[Dict]) -> List[Dict]:
+        return self.rerank_many([question], [docs])[0]
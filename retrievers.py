@@ -0,0 +1,592 @@
+# retrievers.py
+
+import os
+import re
+import json
+import math
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from config import (
+    VECTOR_BACKEND,
+    EMBEDDING_MODEL_NAME,
+    FAQS_FILE,
+    PINECONE_API_KEY,
+    PINECONE_INDEX_NAME,
+    PINECONE_NAMESPACE,
+    PINECONE_POOL_THREADS,
+    FAISS_INDEX_FILE,
+    METADATA_FILE,
+    FAISS_INDEX_TYPE,
+    FAISS_IVF_NLIST,
+    FAISS_IVF_NPROBE,
+    FAISS_HNSW_M,
+    FAISS_HNSW_EF_SEARCH,
+    CATEGORY_NAMESPACES,
+)
+from chunk_store import ChunkStore
+from vector_client import VectorClient
+
+# Pinecone keeps the embedding fingerprint as a single record in a separate namespace
+FINGERPRINT_NAMESPACE = "__meta__"
+FINGERPRINT_ID = "embedding-fingerprint"
+
+
+def _to_doc(metadata: Optional[Dict], score: float) -> Dict:
+    """Convert stored chunk metadata into the doc dict used by the pipeline."""
+    m = metadata or {}
+    return {
+        "question": m.get("question", ""),
+        "answer": m.get("answer", ""),
+        "row_id": m.get("row_id"),
+        "chunk_id": m.get("chunk_id"),
+        "category": m.get("category") or None,
+        "score": float(score),
+    }
+
+
+# ------------------ BASE INTERFACE ------------------
+
+class BaseRetriever:
+    """
+    Vector backend used by SupportRAGPipeline and ingestion.
+    Records are Pinecone-style dicts: {"id", "values", "metadata"}.
+    """
+
+    # True when an upsert is persisted as soon as it returns (used for ingest checkpoints)
+    durable_upserts = True
+
+    def query(self, vector: List[float], top_k: int = 5, category: Optional[str] = None) -> List[Dict]:
+        """Return the top_k closest chunks as doc dicts (only chunks of `category`, if given)."""
+        raise NotImplementedError
+
+    def query_batch(
+        self, vectors: List[List[float]], top_k: int = 5, categories: Optional[List[Optional[str]]] = None
+    ) -> List[List[Dict]]:
+        """Run several queries at once; one doc list per input vector (`categories` aligned with them)."""
+        categories = categories or [None] * len(vectors)
+        return [self.query(v, top_k=top_k, category=c) for v, c in zip(vectors, categories)]
+
+    def upsert(self, vectors: List[Dict]) -> None:
+        """Insert or replace a batch of records."""
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]) -> None:
+        """Remove records by id."""
+        raise NotImplementedError
+
+    def namespace_for(self, category: Optional[str]) -> Optional[str]:
+        """Namespace a chunk of `category` is written to (None: the store has no namespaces)."""
+        return None
+
+    def flush(self) -> None:
+        """Persist buffered writes (no-op for remote backends)."""
+
+    def read_fingerprint(self) -> Optional[Dict]:
+        """Embedding model/dimension the index was built with, if recorded."""
+        return None
+
+    def write_fingerprint(self, fingerprint: Dict) -> None:
+        """Record the embedding model/dimension used to build the index."""
+
+
+# ------------------ PINECONE ------------------
+
+def partition_namespace(namespace: str, category: str) -> str:
+    """Namespace holding one category's chunks when CATEGORY_NAMESPACES is on."""
+    return f"{namespace}__{re.sub(r'[^a-z0-9]+', '-', category.lower()).strip('-')}"
+
+
+class PineconeRetriever(BaseRetriever):
+    """
+    Managed Pinecone index (one network round-trip per query).
+
+    All calls go through a VectorClient (pooled connection, bounded
+    concurrency, deadlines and retries); `index` may be a raw Pinecone
+    `Index`, a FakeVectorIndex or an already configured VectorClient.
+    With a local `chunk_store`, queries ask only for ids and scores and the
+    texts are read from the store; if the store is missing any of the ids
+    (e.g. it is behind the index), that query is repeated with metadata.
+
+    Category queries filter on the "category" metadata field or, with
+    `partitioned` (CATEGORY_NAMESPACES), go to that category's namespace;
+    upserts are then split by category and unfiltered queries fan out to
+    every namespace in use, merged by score. Ingestion records each chunk's
+    namespace, so a chunk that moves (its category changed, or partitioning
+    was switched) is deleted from the namespace it left.
+    """
+
+    def __init__(
+        self,
+        index=None,
+        namespace: str = PINECONE_NAMESPACE,
+        chunk_store: Optional[ChunkStore] = None,
+        partitioned: bool = CATEGORY_NAMESPACES,
+    ):
+        if index is None:
+            if not PINECONE_API_KEY:
+                raise ValueError("PINECONE_API_KEY is not set. Add it to your .env file.")
+            from pinecone import Pinecone
+
+            pc = Pinecone(api_key=PINECONE_API_KEY)
+            index = pc.Index(PINECONE_INDEX_NAME, pool_threads=PINECONE_POOL_THREADS)
+        self.index = index if isinstance(index, VectorClient) else VectorClient(index)
+        self.namespace = namespace
+        self.chunk_store = chunk_store if chunk_store is not None and chunk_store.num_chunks else None
+        self.partitioned = partitioned
+        # Namespaces holding this retriever's chunks (the base one and its category partitions)
+        self._namespaces = set()
+        if partitioned:
+            in_use = getattr(self.index.describe_index_stats(), "namespaces", None) or {}
+            prefix = f"{namespace}__"
+            self._namespaces = {ns for ns in in_use if ns == namespace or ns.startswith(prefix)}
+
+    def _requests(self, vector: List[float], top_k: int, category: Optional[str]) -> List[Dict]:
+        """Query kwargs for one vector: one per namespace it has to search."""
+        base = {"vector": list(map(float, vector)), "top_k": top_k}
+        if category is None:
+            namespaces = sorted(self._namespaces) if self.partitioned and self._namespaces else [self.namespace]
+            return [dict(base, namespace=ns) for ns in namespaces]
+        if self.partitioned:
+            return [dict(base, namespace=partition_namespace(self.namespace, category))]
+        return [dict(base, namespace=self.namespace, filter={"category": {"$eq": category}})]
+
+    def _query_docs(self, **kwargs) -> List[Dict]:
+        if self.chunk_store is not None:
+            res = self.index.query(include_metadata=False, **kwargs)
+            docs = self.chunk_store.hydrate([(match.id, match.score) for match in res.matches])
+            if docs is not None:
+                return docs
+        res = self.index.query(include_metadata=True, **kwargs)
+        return [_to_doc(match.metadata, match.score) for match in res.matches]
+
+    def query(self, vector: List[float], top_k: int = 5, category: Optional[str] = None) -> List[Dict]:
+        return self.query_batch([vector], top_k=top_k, categories=[category])[0]
+
+    def query_batch(
+        self, vectors: List[List[float]], top_k: int = 5, categories: Optional[List[Optional[str]]] = None
+    ) -> List[List[Dict]]:
+        categories = categories or [None] * len(vectors)
+        requests = [
+            (i, kwargs)
+            for i, (v, c) in enumerate(zip(vectors, categories))
+            for kwargs in self._requests(v, top_k, c)
+        ]
+        # Serverless indexes take one vector per request, so overlap the round-trips
+        # (the client caps how many are in flight).
+        if len(requests) == 1:
+            responses = [self._query_docs(**requests[0][1])]
+        else:
+            futures = [self.index.submit(self._query_docs, **kwargs) for _, kwargs in requests]
+            responses = [f.result() for f in futures]
+
+        results: List[List[Dict]] = [[] for _ in vectors]
+        for (i, _), docs in zip(requests, responses):
+            results[i].extend(docs)
+        if self.partitioned:  # merge the per-namespace lists of fanned-out queries
+            results = [sorted(docs, key=lambda d: d["score"], reverse=True)[:top_k] for docs in results]
+        return results
+
+    def namespace_for(self, category: Optional[str]) -> str:
+        return partition_namespace(self.namespace, category) if self.partitioned and category else self.namespace
+
+    def upsert(self, vectors: List[Dict]) -> None:
+        if not self.partitioned:
+            self.index.upsert(vectors=vectors, namespace=self.namespace)
+            return
+        groups: Dict[str, List[Dict]] = {}
+        for v in vectors:
+            groups.setdefault(self.namespace_for((v.get("metadata") or {}).get("category")), []).append(v)
+        for ns, group in groups.items():
+            self.index.upsert(vectors=group, namespace=ns)
+            self._namespaces.add(ns)
+
+    def delete(self, ids: List[str], namespace: Optional[str] = None) -> None:
+        """Delete from `namespace`, or wherever the ids may be (every namespace in use, when partitioned)."""
+        if namespace is not None:
+            namespaces = [namespace]
+        else:
+            namespaces = sorted(self._namespaces) if self.partitioned else [self.namespace]
+        for ns in namespaces:
+            self.index.delete(ids=list(ids), namespace=ns)
+
+    def read_fingerprint(self) -> Optional[Dict]:
+        res = self.index.fetch(ids=[FINGERPRINT_ID], namespace=FINGERPRINT_NAMESPACE)
+        record = res.vectors.get(FINGERPRINT_ID)
+        if record is None:
+            # Older indexes: the dimension is still known from the index itself
+            return {"embedding_model": None, "dimension": int(self.index.describe_index_stats().dimension)}
+        m = record.metadata or {}
+        return {"embedding_model": m.get("embedding_model"), "dimension": int(m.get("dimension", 0))}
+
+    def write_fingerprint(self, fingerprint: Dict) -> None:
+        dim = int(fingerprint["dimension"])
+        self.index.upsert(
+            vectors=[{
+                "id": FINGERPRINT_ID,
+                "values": [1.0] + [0.0] * (dim - 1),  # dense indexes reject all-zero vectors
+                "metadata": fingerprint,
+            }],
+            namespace=FINGERPRINT_NAMESPACE,
+        )
+
+
+# ------------------ FAISS (LOCAL) ------------------
+
+def _import_faiss():
+    try:
+        import faiss
+    except ImportError as e:
+        raise ImportError(
+            "The FAISS backend needs the 'faiss-cpu' package (pip install faiss-cpu)."
+        ) from e
+    return faiss
+
+
+def _normalize(vectors) -> np.ndarray:
+    """Float32, C-contiguous, L2-normalized rows (inner product == cosine)."""
+    arr = np.ascontiguousarray(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+    norms = np.linalg.norm(arr, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return arr / norms
+
+
+class FaissRetriever(BaseRetriever):
+    """
+    Local FAISS index stored in FAISS_INDEX_FILE, with chunk metadata
+    in METADATA_FILE (a JSON list aligned with the index positions).
+
+    Supported index types:
+    - "flat": exact inner-product search
+    - "ivf":  inverted file, nprobe lists scanned per query
+    - "hnsw": graph-based approximate search
+
+    Reads are memory-mapped where the index type allows it, so several
+    processes can share the same pages. Writes are buffered by `upsert`
+    and the index is rebuilt on `flush`. Category queries only visit that
+    category's vectors (an IDSelector over positions from the metadata).
+    """
+
+    durable_upserts = False
+
+    def __init__(
+        self,
+        index_file=FAISS_INDEX_FILE,
+        metadata_file=METADATA_FILE,
+        index_type: str = FAISS_INDEX_TYPE,
+        mmap: bool = True,
+    ):
+        self.faiss = _import_faiss()
+        self.index_file = index_file
+        self.metadata_file = metadata_file
+        self.index_type = index_type
+        self.fingerprint_file = f"{index_file}.fingerprint.json"
+        self.index = None
+        self.metadata: List[Dict] = []
+        self._by_category: Optional[Dict[str, np.ndarray]] = None  # category -> index positions
+        self._pending: Dict[str, Dict] = {}
+        self._deleted = set()
+
+        if os.path.exists(index_file) and os.path.exists(metadata_file):
+            self.index = self._read_index(mmap)
+            with open(metadata_file, "r", encoding="utf-8") as f:
+                self.metadata = json.load(f)
+            self._apply_search_params()
+
+    def _read_index(self, mmap: bool):
+        faiss = self.faiss
+        if mmap:
+            try:
+                return faiss.read_index(
+                    str(self.index_file), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                )
+            except RuntimeError:
+                # Older FAISS builds cannot mmap every index type.
+                pass
+        return faiss.read_index(str(self.index_file))
+
+    def _apply_search_params(self) -> None:
+        faiss = self.faiss
+        try:
+            faiss.extract_index_ivf(self.index).nprobe = FAISS_IVF_NPROBE
+        except RuntimeError:
+            pass
+        if hasattr(self.index, "hnsw"):
+            self.index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+
+    # --------- READ ---------
+    def query(self, vector: List[float], top_k: int = 5, category: Optional[str] = None) -> List[Dict]:
+        return self.query_batch([vector], top_k=top_k, categories=[category])[0]
+
+    def query_batch(
+        self, vectors: List[List[float]], top_k: int = 5, categories: Optional[List[Optional[str]]] = None
+    ) -> List[List[Dict]]:
+        if self.index is None or self.index.ntotal == 0:
+            return [[] for _ in vectors]
+        queries = _normalize(vectors)
+        categories = categories or [None] * len(vectors)
+
+        # One search call per distinct category in the batch
+        results: List[List[Dict]] = [[] for _ in vectors]
+        for category in dict.fromkeys(categories):
+            rows = [i for i, c in enumerate(categories) if c == category]
+            if category is None:
+                scores, ids = self.index.search(queries[rows], top_k)
+            else:
+                positions = self._category_positions(category)
+                if not len(positions):
+                    continue
+                scores, ids = self._search_subset(queries[rows], top_k, positions)
+            for i, row_scores, row_ids in zip(rows, scores, ids):
+                results[i] = [
+                    _to_doc(self.metadata[idx], score) for score, idx in zip(row_scores, row_ids) if idx >= 0
+                ]
+        return results
+
+    def _category_positions(self, category: str) -> np.ndarray:
+        if self._by_category is None:
+            groups: Dict[str, List[int]] = {}
+            for pos, m in enumerate(self.metadata):
+                groups.setdefault(m.get("category"), []).append(pos)
+            self._by_category = {c: np.asarray(p, dtype=np.int64) for c, p in groups.items()}
+        return self._by_category.get(category, np.zeros(0, dtype=np.int64))
+
+    def _search_subset(self, queries: np.ndarray, top_k: int, positions: np.ndarray):
+        """Search only `positions`, keeping the configured nprobe / efSearch."""
+        faiss = self.faiss
+        if not hasattr(faiss, "SearchParameters"):
+            # FAISS < 1.7.3 has no per-search selectors: over-fetch and filter
+            n = min(self.index.ntotal, top_k * 8)
+            scores, ids = self.index.search(queries, n)
+            keep = np.isin(ids, positions)
+            order = np.argsort(~keep, axis=1, kind="stable")[:, :top_k]
+            ids = np.where(np.take_along_axis(keep, order, 1), np.take_along_axis(ids, order, 1), -1)
+            return np.take_along_axis(scores, order, 1), ids
+
+        sel = faiss.IDSelectorBatch(len(positions), faiss.swig_ptr(positions))
+        if hasattr(self.index, "hnsw"):
+            params = faiss.SearchParametersHNSW(sel=sel, efSearch=FAISS_HNSW_EF_SEARCH)
+        else:
+            try:
+                faiss.extract_index_ivf(self.index)
+                params = faiss.SearchParametersIVF(sel=sel, nprobe=FAISS_IVF_NPROBE)
+            except RuntimeError:
+                params = faiss.SearchParameters(sel=sel)
+        return self.index.search(queries, top_k, params=params)
+
+    # --------- WRITE ---------
+    def upsert(self, vectors: List[Dict]) -> None:
+        for v in vectors:
+            self._pending[v["id"]] = v
+            self._deleted.discard(v["id"])
+
+    def delete(self, ids: List[str]) -> None:
+        for rec_id in ids:
+            self._pending.pop(rec_id, None)
+            self._deleted.add(rec_id)
+
+    def _existing_records(self) -> Dict[str, Dict]:
+        """Reconstruct already-indexed records so flush can merge with them."""
+        if self.index is None or self.index.ntotal == 0:
+            return {}
+        try:
+            self.faiss.extract_index_ivf(self.index).make_direct_map()
+        except RuntimeError:
+            pass
+        values = self.index.reconstruct_n(0, self.index.ntotal)
+        records = {}
+        for meta, vec in zip(self.metadata, values):
+            meta = dict(meta)
+            rec_id = meta.pop("id")
+            records[rec_id] = {"id": rec_id, "values": vec, "metadata": meta}
+        return records
+
+    def _build_index(self, vectors: np.ndarray):
+        faiss = self.faiss
+        n, dim = vectors.shape
+        if self.index_type == "flat":
+            factory = "Flat"
+        elif self.index_type == "ivf":
+            # ~4*sqrt(n) lists is the usual rule of thumb; never more lists than points
+            nlist = max(1, min(FAISS_IVF_NLIST, int(4 * math.sqrt(n)), n))
+            factory = f"IVF{nlist},Flat"
+        elif self.index_type == "hnsw":
+            factory = f"HNSW{FAISS_HNSW_M},Flat"
+        else:
+            raise ValueError(f"Unknown FAISS index type: {self.index_type!r}")
+
+        index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+        if not index.is_trained:
+            index.train(vectors)
+        index.add(vectors)
+        return index
+
+    def flush(self) -> None:
+        if not self._pending and not self._deleted:
+            return
+        records = self._existing_records()
+        records.update(self._pending)
+        for rec_id in self._deleted:
+            records.pop(rec_id, None)
+        self._pending = {}
+        self._deleted = set()
+
+        ids = list(records.keys())
+        if not ids:
+            self.index, self.metadata, self._by_category = None, [], None
+            for path in (self.index_file, self.metadata_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            return
+        vectors = _normalize([records[i]["values"] for i in ids])
+
+        self.index = self._build_index(vectors)
+        self.metadata = [{"id": i, **(records[i].get("metadata") or {})} for i in ids]
+        self._by_category = None
+        self._apply_search_params()
+
+        os.makedirs(os.path.dirname(str(self.index_file)), exist_ok=True)
+        self.faiss.write_index(self.index, str(self.index_file))
+        with open(self.metadata_file, "w", encoding="utf-8") as f:
+            json.dump(self.metadata, f, ensure_ascii=False)
+
+    def read_fingerprint(self) -> Optional[Dict]:
+        if os.path.exists(self.fingerprint_file):
+            with open(self.fingerprint_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        if self.index is not None:
+            return {"embedding_model": None, "dimension": int(self.index.d)}
+        return None
+
+    def write_fingerprint(self, fingerprint: Dict) -> None:
+        os.makedirs(os.path.dirname(self.fingerprint_file), exist_ok=True)
+        with open(self.fingerprint_file, "w", encoding="utf-8") as f:
+            json.dump(fingerprint, f)
+
+
+# ------------------ IN-MEMORY (TESTS / LOCAL RUNS) ------------------
+
+class InMemoryRetriever(BaseRetriever):
+    """
+    Exact cosine search over a NumPy matrix held in memory.
+    A stand-in for the real vector stores in local runs and load tests.
+    """
+
+    def __init__(self):
+        self._records: Dict[str, Dict] = {}
+        self._fingerprint: Optional[Dict] = None
+        self._ids: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._categories: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_faqs(cls, embedder, faqs_file=FAQS_FILE, model_name: str = EMBEDDING_MODEL_NAME) -> "InMemoryRetriever":
+        """Seed from data/faqs.json (same ids and metadata shape as ingestion)."""
+        with open(faqs_file, "r", encoding="utf-8") as f:
+            faqs = json.load(f)
+        vectors = embedder.encode([x["answer"] for x in faqs])
+        store = cls()
+        store.upsert([
+            {
+                "id": f"faq-{x['id']}-0",
+                "values": v,
+                "metadata": {
+                    "question": x["question"],
+                    "answer": x["answer"],
+                    "row_id": f"faq-{x['id']}",
+                    "chunk_id": 0,
+                    "category": x.get("category", ""),
+                },
+            }
+            for x, v in zip(faqs, vectors)
+        ])
+        store.write_fingerprint(embedding_fingerprint(model_name, vectors.shape[1]))
+        return store
+
+    def query(self, vector: List[float], top_k: int = 5, category: Optional[str] = None) -> List[Dict]:
+        return self.query_batch([vector], top_k=top_k, categories=[category])[0]
+
+    def query_batch(
+        self, vectors: List[List[float]], top_k: int = 5, categories: Optional[List[Optional[str]]] = None
+    ) -> List[List[Dict]]:
+        if not self._records:
+            return [[] for _ in vectors]
+        if self._matrix is None:
+            self._ids = list(self._records)
+            self._matrix = _normalize([self._records[i]["values"] for i in self._ids])
+            self._categories = np.array(
+                [(self._records[i].get("metadata") or {}).get("category") for i in self._ids], dtype=object
+            )
+
+        scores = _normalize(vectors) @ self._matrix.T
+        results = []
+        for row, category in zip(scores, categories or [None] * len(vectors)):
+            if category is None:
+                candidates = np.arange(len(self._ids))
+            else:
+                candidates = np.flatnonzero(self._categories == category)
+            top = candidates[np.argsort(-row[candidates])[:top_k]]
+            results.append([
+                _to_doc(self._records[self._ids[j]].get("metadata"), row[j]) for j in top
+            ])
+        return results
+
+    def upsert(self, vectors: List[Dict]) -> None:
+        for v in vectors:
+            self._records[v["id"]] = v
+        self._matrix = None
+
+    def delete(self, ids: List[str]) -> None:
+        for rec_id in ids:
+            self._records.pop(rec_id, None)
+        self._matrix = None
+
+    def read_fingerprint(self) -> Optional[Dict]:
+        return self._fingerprint
+
+    def write_fingerprint(self, fingerprint: Dict) -> None:
+        self._fingerprint = dict(fingerprint)
+
+
+# ------------------ FINGERPRINT ------------------
+
+def embedding_fingerprint(model_name: str, dimension: int) -> Dict:
+    return {"embedding_model": model_name, "dimension": int(dimension)}
+
+
+def verify_fingerprint(retriever: BaseRetriever, expected: Dict) -> None:
+    """
+    Fail fast when the index was built with a different embedding model or
+    dimension than the one used for queries (retrieval would silently degrade).
+    """
+    found = retriever.read_fingerprint()
+    if found is None:
+        print("⚠️ Vector index is empty or has no fingerprint yet; run ingestion first.")
+        return
+    if found["dimension"] != expected["dimension"]:
+        raise ValueError(
+            f"Embedding dimension mismatch: index has {found['dimension']}, "
+            f"{expected['embedding_model']} produces {expected['dimension']}. Re-run ingestion."
+        )
+    if found["embedding_model"] is None:
+        print("⚠️ Vector index has no embedding-model fingerprint; re-run ingestion to record one.")
+    elif found["embedding_model"] != expected["embedding_model"]:
+        raise ValueError(
+            f"Embedding model mismatch: index was built with {found['embedding_model']}, "
+            f"queries use {expected['embedding_model']}. Set EMBEDDING_MODEL_NAME or re-run ingestion."
+        )
+
+
+# ------------------ FACTORY ------------------
+
+def get_retriever(backend: str = VECTOR_BACKEND, chunk_store: Optional[ChunkStore] = None, **kwargs) -> BaseRetriever:
+    """
+    Build the retriever selected by VECTOR_BACKEND (or an explicit name).
+    `chunk_store` lets Pinecone skip metadata in queries (FAISS already reads texts locally).
+    """
+    if backend == "pinecone":
+        return PineconeRetriever(chunk_store=chunk_store, **kwargs)
+    if backend == "faiss":
+        return FaissRetriever(**kwargs)
+    raise ValueError(f"Unknown vector backend: {backend!r} (expected 'pinecone' or 'faiss')")
@@ -0,0 +1,217 @@
+# server.py
+
+import asyncio
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Optional
+
+from aiohttp import web
+
+from config import (
+    SERVER_HOST,
+    SERVER_PORT,
+    BATCH_MAX_SIZE,
+    BATCH_MAX_WAIT_MS,
+    SERVER_MAX_TOP_K,
+    TOP_K,
+    EMBEDDING_MODEL_NAME,
+)
+from metrics import metrics
+from micro_batcher import MicroBatcher
+from rag_pipeline import SupportRAGPipeline, log_escalation
+
+# Generation runs on one dedicated thread: FLAN-T5 already uses all cores
+# per call, so batching (not parallel calls) is what raises throughput.
+MODEL_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+# Retrieval batches (embedding + vector search) get their own thread, so /retrieve
+# never queues behind a multi-second generation batch.
+RETRIEVE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="retrieve")
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="io")
+
+PIPELINE = web.AppKey("pipeline", SupportRAGPipeline)
+ANSWER_BATCHER = web.AppKey("answer_batcher", MicroBatcher)
+RETRIEVE_BATCHER = web.AppKey("retrieve_batcher", MicroBatcher)
+
+
+# ------------------ BATCH HANDLERS ------------------
+
+def make_answer_batch(pipeline: SupportRAGPipeline):
+    def answer_batch(items: List[Tuple[str, str, Optional[str]]]) -> List[Tuple[str, List[Dict]]]:
+        """items are (question, tone, category); answer_questions takes one tone per call."""
+        by_tone = defaultdict(list)
+        for i, (_, tone, _) in enumerate(items):
+            by_tone[tone].append(i)
+
+        results = [None] * len(items)
+        for tone, idxs in by_tone.items():
+            answers = pipeline.answer_questions(
+                [items[i][0] for i in idxs], tone=tone, categories=[items[i][2] for i in idxs]
+            )
+            for i, res in zip(idxs, answers):
+                results[i] = res
+        return results
+
+    return answer_batch
+
+
+def make_retrieve_batch(pipeline: SupportRAGPipeline):
+    def retrieve_batch(items: List[Tuple[str, int, Optional[str]]]) -> List[List[Dict]]:
+        """items are (question, top_k, category); one query for the largest k, trimmed per request."""
+        k = max(top_k for _, top_k, _ in items)
+        docs = pipeline.retrieve_batch([q for q, _, _ in items], top_k=k, categories=[c for _, _, c in items])
+        return [d[:top_k] for d, (_, top_k, _) in zip(docs, items)]
+
+    return retrieve_batch
+
+
+# ------------------ HANDLERS ------------------
+
+async def _read_question(request: web.Request) -> Tuple[Dict, str]:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text="Request body must be JSON.")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="Request body must be a JSON object.")
+    question = (body.get("question") or "").strip()
+    if not question:
+        raise web.HTTPBadRequest(text="'question' is required.")
+    body["category"] = body.get("category") or None  # "" / null = let the router decide
+    return body, question
+
+
+def _read_top_k(body: Dict) -> int:
+    """`top_k` from the request body (default TOP_K), clamped to SERVER_MAX_TOP_K."""
+    raw = body.get("top_k", TOP_K)
+    try:
+        if isinstance(raw, bool) or isinstance(raw, float) and not raw.is_integer():
+            raise ValueError
+        top_k = int(raw)
+    except (TypeError, ValueError):
+        raise web.HTTPBadRequest(text="'top_k' must be an integer.")
+    if top_k < 1:
+        raise web.HTTPBadRequest(text="'top_k' must be at least 1.")
+    return min(top_k, SERVER_MAX_TOP_K)
+
+
+async def answer(request: web.Request) -> web.Response:
+    body, question = await _read_question(request)
+    tone, category = body.get("tone", "Friendly"), body["category"]
+    history, session_id = body.get("history"), body.get("session_id")
+    if history or session_id:
+        # Conversation turns carry per-session state, so they skip the micro-batcher
+        pipeline = request.app[PIPELINE]
+        text, docs = await asyncio.get_running_loop().run_in_executor(
+            MODEL_EXECUTOR,
+            lambda: pipeline.answer_question(
+                question, tone=tone, history=history, session_id=session_id, category=category
+            ),
+        )
+        return web.json_response({"answer": text, "docs": docs})
+    text, docs = await request.app[ANSWER_BATCHER].submit((question, tone, category))
+    return web.json_response({"answer": text, "docs": docs})
+
+
+async def retrieve(request: web.Request) -> web.Response:
+    body, question = await _read_question(request)
+    top_k = _read_top_k(body)
+    docs = await request.app[RETRIEVE_BATCHER].submit((question, top_k, body["category"]))
+    return web.json_response({"docs": docs})
+
+
+async def escalate(request: web.Request) -> web.Response:
+    body, question = await _read_question(request)
+    await asyncio.get_running_loop().run_in_executor(
+        IO_EXECUTOR,
+        lambda: log_escalation(
+            user_question=question,
+            model_answer=body.get("answer", ""),
+            reason=body.get("reason", "Escalated via API."),
+            top_docs=body.get("docs", []),
+            user_email=body.get("user_email", ""),
+        ),
+    )
+    return web.json_response({"status": "logged"}, status=201)
+
+
+async def health(request: web.Request) -> web.Response:
+    app = request.app
+    return web.json_response({
+        **app[PIPELINE].status(),
+        "answer_batcher": app[ANSWER_BATCHER].stats(),
+        "retrieve_batcher": app[RETRIEVE_BATCHER].stats(),
+    })
+
+
+async def metrics_endpoint(request: web.Request) -> web.Response:
+    """Prometheus text format; `?format=json` returns the same data as JSON."""
+    for name, batcher in (("answer_batcher", ANSWER_BATCHER), ("retrieve_batcher", RETRIEVE_BATCHER)):
+        for key, value in request.app[batcher].stats().items():
+            metrics.set_gauge(f"batcher_{key}", value, batcher=name)
+    if request.query.get("format") == "json":
+        return web.json_response(metrics.snapshot())
+    return web.Response(text=metrics.to_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+# ------------------ APP ------------------
+
+def create_app(
+    pipeline: SupportRAGPipeline,
+    max_batch_size: int = BATCH_MAX_SIZE,
+    max_wait_ms: float = BATCH_MAX_WAIT_MS,
+) -> web.Application:
+    """One shared pipeline behind micro-batched answer/retrieve endpoints."""
+    app = web.Application()
+    app[PIPELINE] = pipeline
+    app[ANSWER_BATCHER] = MicroBatcher(
+        make_answer_batch(pipeline), max_batch_size, max_wait_ms, MODEL_EXECUTOR, name="answer"
+    )
+    app[RETRIEVE_BATCHER] = MicroBatcher(
+        make_retrieve_batch(pipeline), max_batch_size * 4, max_wait_ms, RETRIEVE_EXECUTOR, name="retrieve"
+    )
+
+    async def on_startup(app):
+        await app[ANSWER_BATCHER].start()
+        await app[RETRIEVE_BATCHER].start()
+
+    async def on_cleanup(app):
+        await app[ANSWER_BATCHER].stop()
+        await app[RETRIEVE_BATCHER].stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+    app.router.add_post("/answer", answer)
+    app.router.add_post("/retrieve", retrieve)
+    app.router.add_post("/escalate", escalate)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics_endpoint)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SupportSphere HTTP API.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--max-batch-size", type=int, default=BATCH_MAX_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=BATCH_MAX_WAIT_MS)
+    parser.add_argument(
+        "--fake-store",
+        action="store_true",
+        help="Serve from an in-memory vector store seeded with data/faqs.json (no Pinecone/FAISS).",
+    )
+    args = parser.parse_args()
+
+    retriever = None
+    if args.fake_store:
+        from sentence_transformers import SentenceTransformer
+        from retrievers import InMemoryRetriever
+
+        retriever = InMemoryRetriever.from_faqs(SentenceTransformer(EMBEDDING_MODEL_NAME))
+
+    web.run_app(
+        create_app(SupportRAGPipeline(retriever=retriever), args.max_batch_size, args.max_wait_ms),
+        host=args.host,
+        port=args.port,
+    )
@@ -0,0 +1,199 @@
+# session_state.py
+
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from config import (
+    SESSION_REUSE_THRESHOLD,
+    SESSION_FOLLOWUP_THRESHOLD,
+    SESSION_ROLLING_WEIGHT,
+    SESSION_MAX_TURNS,
+    SESSION_MAX_SESSIONS,
+    SESSION_IDLE_SECONDS,
+)
+
+# Wording that only makes sense with the previous turn ("what about refunds for that?",
+# "and for gift cards?", "...and the fee?")
+FOLLOWUP_RE = re.compile(
+    r"\b(it|its|that|this|those|these|them|they|there|same|instead|else|"
+    r"what about|how about|and if|what if)\b"
+    r"|^\W*(and|or|but|also)\b|^\s*(\.\.\.|…)",
+    re.IGNORECASE,
+)
+
+
+def _unit(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32).ravel()
+    n = np.linalg.norm(v)
+    return v / n if n > 0 else v
+
+
+def is_follow_up(question: str) -> bool:
+    """
+    True for questions that lean on the previous turn (pronouns, "what about ...",
+    a leading "and ..." or ellipsis). Short questions that stand on their own
+    ("reset password") are not follow-ups, so they can use the FAQ / cache.
+    """
+    return bool(FOLLOWUP_RE.search(question))
+
+
+def user_turns(history: Optional[List[Dict]], max_turns: int = SESSION_MAX_TURNS) -> List[str]:
+    """Last `max_turns` user messages from a chat history of {"role", "content"} dicts."""
+    turns = [
+        (m.get("content") or "").strip()
+        for m in history or []
+        if m.get("role") == "user" and (m.get("content") or "").strip()
+    ]
+    return turns[-max_turns:] if max_turns else []
+
+
+def doc_id(doc: Dict) -> str:
+    return f"{doc.get('row_id')}-{doc.get('chunk_id')}"
+
+
+class SessionStore:
+    """
+    Compact retrieval state per conversation.
+
+    A state is a rolling (exponentially weighted, normalized) embedding of the
+    recent questions, the last few question texts and the candidates retrieved
+    for the last re-query (with their doc IDs and the category they were
+    retrieved for). `plan_turn` decides how the next question is retrieved:
+
+    - "reuse": close to the rolling embedding (same topic and category) -> reuse
+      the candidates;
+    - "followup": a follow-up that is still on topic -> re-query with the blended
+      embedding and fuse with the previous candidates (if of the same category);
+    - "new": topic shift (or no state) -> plain retrieval, the state starts over.
+
+    States are replaced, never mutated, so concurrent turns of one session are
+    safe. Sessions are LRU-bounded and evicted after `idle_seconds` without a turn.
+    """
+
+    def __init__(
+        self,
+        reuse_threshold: float = SESSION_REUSE_THRESHOLD,
+        followup_threshold: float = SESSION_FOLLOWUP_THRESHOLD,
+        rolling_weight: float = SESSION_ROLLING_WEIGHT,
+        max_turns: int = SESSION_MAX_TURNS,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        idle_seconds: float = SESSION_IDLE_SECONDS,
+    ):
+        self.reuse_threshold = reuse_threshold
+        self.followup_threshold = followup_threshold
+        self.rolling_weight = rolling_weight
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+
+        self._sessions: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    # --------- STATE ---------
+    def get(self, session_id: Optional[str]) -> Optional[Dict]:
+        if session_id is None:
+            return None
+        with self._lock:
+            self._expire()
+            state = self._sessions.get(session_id)
+            if state is not None:
+                self._sessions.move_to_end(session_id)
+            return state
+
+    def from_history(self, questions: List[str], vectors) -> Optional[Dict]:
+        """State rebuilt from earlier user questions (oldest first), without candidates."""
+        state = None
+        for question, vector in zip(questions, vectors):
+            state = self._next_state(state, "followup" if state else "new", question, vector, [], None)
+        return state
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _expire(self) -> None:
+        if not self.idle_seconds:
+            return
+        cutoff = time.time() - self.idle_seconds
+        while self._sessions:
+            oldest = next(iter(self._sessions))
+            if self._sessions[oldest]["updated"] >= cutoff:
+                break
+            del self._sessions[oldest]
+            self.evictions += 1
+
+    # --------- ROUTING ---------
+    def plan_turn(self, state: Optional[Dict], question: str, q_vec, category: Optional[str] = None) -> Dict:
+        """
+        How to retrieve for `question` in `category`: {"mode", "similarity",
+        "vector" (query embedding), "query" (BM25 text), "previous" (earlier
+        question for the prompt, or None), "candidates" (previous candidates)}.
+        """
+        q = _unit(q_vec)
+        turn = {"mode": "new", "similarity": None, "vector": q, "query": question, "previous": None, "candidates": []}
+        if state is None:
+            return turn
+
+        sim = float(state["vector"] @ q)
+        turn["similarity"] = sim
+        follow_up = is_follow_up(question)
+        if follow_up and sim >= self.followup_threshold:
+            turn["previous"] = state["questions"][-1]
+        # Candidates retrieved for another category are not reused or fused
+        previous_candidates = state["candidates"] if state.get("category") == category else []
+        if sim >= self.reuse_threshold and previous_candidates:
+            turn.update(mode="reuse", candidates=previous_candidates)
+        elif turn["previous"] is not None:
+            turn.update(
+                mode="followup",
+                vector=_unit(q + state["vector"]),
+                query=f"{turn['previous']} {question}",
+                candidates=previous_candidates,
+            )
+        return turn
+
+    def advance(self, session_id: Optional[str], state: Optional[Dict], turn: Dict,
+                question: str, q_vec, candidates: List[Dict], category: Optional[str] = None) -> None:
+        """Record the finished turn (`candidates` as retrieved for `category`, before reranking)."""
+        if session_id is None:
+            return
+        new_state = self._next_state(
+            state if turn["mode"] != "new" else None, turn["mode"], question, q_vec, candidates, category
+        )
+        with self._lock:
+            self._sessions[session_id] = new_state
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def _next_state(
+        self, state: Optional[Dict], mode: str, question: str, q_vec, candidates: List[Dict], category: Optional[str]
+    ) -> Dict:
+        q = _unit(q_vec)
+        if state is None:
+            vector, questions = q, [question]
+        else:
+            vector = _unit(self.rolling_weight * state["vector"] + (1.0 - self.rolling_weight) * q)
+            questions = (list(state["questions"]) + [question])[-max(self.max_turns, 1):]
+        if mode == "reuse" or not candidates:  # keep the previous candidates (and their category)
+            candidates = state["candidates"] if state else []
+            category = state.get("category") if state else None
+        return {
+            "vector": vector,
+            "questions": tuple(questions),
+            "candidates": list(candidates),
+            "doc_ids": tuple(doc_id(d) for d in candidates),
+            "category": category,
+            "updated": time.time(),
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"sessions": len(self._sessions), "evictions": self.evictions}
@@ -0,0 +1,467 @@
+# sparse_index.py
+
+import os
+import re
+import json
+import math
+import mmap
+import shutil
+from collections import Counter
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from config import VECTOR_BACKEND, VECTORSTORE_DIR
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in is it me my "
+    "not of on or our so that the their this to was we what when where which who why "
+    "will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased alphanumeric tokens; keeps ids and acronyms like 'upi' or '12345'."""
+    return [t for t in TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+# ------------------ SEGMENT ------------------
+
+class _Strings:
+    """
+    Strings back to back in one UTF-8 blob; string i is blob[offsets[i]:offsets[i+1]].
+    Loaded from disk, both are memory-mapped and nothing is decoded until read.
+    """
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob  # bytes in memory, memoryview over an mmap on disk
+
+    @classmethod
+    def build(cls, strings: List[str]) -> "_Strings":
+        data = [x.encode("utf-8") for x in strings]
+        offsets = np.zeros(len(data) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.array([len(d) for d in data], dtype=np.int64))
+        return cls(offsets, b"".join(data))
+
+    @classmethod
+    def load(cls, path: str, name: str) -> "_Strings":
+        offsets = np.load(os.path.join(path, f"{name}_offsets.npy"), mmap_mode="r")
+        blob: object = b""
+        with open(os.path.join(path, f"{name}.bin"), "rb") as f:
+            if os.fstat(f.fileno()).st_size:  # empty files cannot be mapped
+                blob = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return cls(offsets, blob)
+
+    def save(self, path: str, name: str) -> None:
+        np.save(os.path.join(path, f"{name}_offsets.npy"), self.offsets)
+        with open(os.path.join(path, f"{name}.bin"), "wb") as f:
+            f.write(self.blob)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def _bytes(self, i: int) -> bytes:
+        return bytes(self.blob[int(self.offsets[i]):int(self.offsets[i + 1])])
+
+    def __getitem__(self, i: int) -> str:
+        return self._bytes(i).decode("utf-8")
+
+    def find(self, value: str) -> Optional[int]:
+        """Position of `value` in a sorted _Strings (binary search), or None."""
+        key = value.encode("utf-8")  # UTF-8 byte order is code point order
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self._bytes(lo) == key else None
+
+
+class _Segment:
+    """
+    Immutable postings for one batch of documents, CSR-style:
+    term_offsets[t]:term_offsets[t+1] slices doc_ids / tfs for term id t,
+    where t is the term's position in the sorted vocabulary `terms`.
+    Documents are kept as ids, JSON records and category codes (an index
+    into `category_names`). Everything but `category_names` is
+    memory-mapped when loaded from disk, so loading decodes nothing.
+    """
+
+    def __init__(
+        self, terms: _Strings, term_offsets, doc_ids, tfs, doc_lens,
+        ids: _Strings, docs: _Strings, categories, category_names: List[str],
+    ):
+        self.terms = terms
+        self.term_offsets = term_offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lens = doc_lens
+        self.ids = ids
+        self.docs = docs
+        self.categories = categories
+        self.category_names = category_names
+        self.deleted = np.zeros(len(doc_lens), dtype=bool)
+        self._category_masks: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def build(cls, docs: List[Dict]) -> "_Segment":
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        doc_lens = np.zeros(len(docs), dtype=np.int32)
+        for local, d in enumerate(docs):
+            tokens = tokenize(f"{d.get('question', '')} {d.get('answer', '')}")
+            doc_lens[local] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((local, tf))
+
+        vocab = sorted(postings)
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        for i, t in enumerate(vocab):
+            offsets[i + 1] = offsets[i] + len(postings[t])
+
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.uint16)
+        for i, t in enumerate(vocab):
+            plist = postings[t]
+            doc_ids[offsets[i]:offsets[i + 1]] = [p[0] for p in plist]
+            tfs[offsets[i]:offsets[i + 1]] = [min(p[1], 65535) for p in plist]
+
+        category_names = sorted({d.get("category") for d in docs if d.get("category")})
+        codes = {c: i for i, c in enumerate(category_names)}
+        categories = np.array([codes.get(d.get("category"), -1) for d in docs], dtype=np.int32)
+        return cls(
+            _Strings.build(vocab), offsets, doc_ids, tfs, doc_lens,
+            _Strings.build([d["id"] for d in docs]),
+            _Strings.build([json.dumps(d, ensure_ascii=False) for d in docs]),
+            categories, category_names,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "_Segment":
+        if os.path.exists(os.path.join(path, "docs.json")):
+            return cls._load_json(path)
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in ("term_offsets", "doc_ids", "tfs", "doc_lens", "categories")
+        }
+        with open(os.path.join(path, "category_names.json"), "r", encoding="utf-8") as f:
+            category_names = json.load(f)
+        return cls(
+            terms=_Strings.load(path, "terms"),
+            ids=_Strings.load(path, "ids"),
+            docs=_Strings.load(path, "docs"),
+            category_names=category_names,
+            **arrays,
+        )
+
+    @classmethod
+    def _load_json(cls, path: str) -> "_Segment":
+        """Older segments (terms.json / docs.json) are rebuilt in memory until the next `compact`."""
+        with open(os.path.join(path, "docs.json"), "r", encoding="utf-8") as f:
+            return cls.build(json.load(f))
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        for name in ("term_offsets", "doc_ids", "tfs", "doc_lens", "categories"):
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        for name in ("terms", "ids", "docs"):
+            getattr(self, name).save(path, name)
+        with open(os.path.join(path, "category_names.json"), "w", encoding="utf-8") as f:
+            json.dump(self.category_names, f, ensure_ascii=False)
+
+    def __len__(self) -> int:
+        return len(self.doc_lens)
+
+    def doc(self, local: int) -> Dict:
+        return json.loads(self.docs[local])
+
+    def category_mask(self, category: str) -> np.ndarray:
+        mask = self._category_masks.get(category)
+        if mask is None:
+            code = self.category_names.index(category) if category in self.category_names else -2
+            mask = np.asarray(self.categories) == code
+            self._category_masks[category] = mask
+        return mask
+
+    def postings(self, term: str):
+        t = self.terms.find(term)
+        if t is None:
+            return None
+        start, end = self.term_offsets[t], self.term_offsets[t + 1]
+        return self.doc_ids[start:end], self.tfs[start:end]
+
+
+# ------------------ INDEX ------------------
+
+class BM25Index:
+    """
+    Okapi BM25 over support chunks, stored as append-only segments.
+
+    New documents go to a fresh segment on `flush`, so incremental
+    re-ingestion never rewrites existing postings. Re-added ids shadow
+    older copies and `delete` records tombstones; `compact` merges all
+    live documents back into a single segment. Tombstoned documents do
+    not count towards document frequencies or lengths.
+
+    Loading only maps the segments; the id -> location map that writes
+    need is built on the first write. `changed_on_disk` tells a reader that
+    ingestion has written a new manifest since (the app then loads it afresh).
+    """
+
+    def __init__(self, path=None, k1: float = 1.2, b: float = 0.75, max_buffer_docs: int = 50_000):
+        self.path = str(path) if path is not None else None
+        self.k1 = k1
+        self.b = b
+        self.max_buffer_docs = max_buffer_docs
+
+        self._segments: List[_Segment] = []
+        self._segment_names: List[str] = []
+        self._live: Optional[Dict[str, Tuple[int, int]]] = None  # doc id -> (segment, local index)
+        self._buffer: Dict[str, Dict] = {}
+        self._next_segment = 0
+        self._df_cache: Dict[str, int] = {}
+        self._total_len: Optional[int] = None
+        self._n_live: Optional[int] = None
+        self._manifest_stat: Optional[Tuple[int, int]] = None
+
+        if self.path and os.path.exists(os.path.join(self.path, "manifest.json")):
+            self._load()
+
+    # --------- PERSISTENCE ---------
+    def _stat_manifest(self) -> Optional[Tuple[int, int]]:
+        """(inode, mtime) of the manifest; every write replaces the file, so both change."""
+        try:
+            st = os.stat(os.path.join(self.path, "manifest.json"))
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns
+
+    def changed_on_disk(self) -> bool:
+        """True if a manifest other than the one this index read (or wrote) is on disk."""
+        if not self.path:
+            return False
+        stat = self._stat_manifest()
+        return stat is not None and stat != self._manifest_stat
+
+    def _load(self) -> None:
+        self._manifest_stat = self._stat_manifest()
+        with open(os.path.join(self.path, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self._next_segment = manifest.get("next_segment", len(manifest["segments"]))
+        for name in manifest["segments"]:
+            seg = _Segment.load(os.path.join(self.path, name))
+            # The manifest's tombstones include every shadowed copy
+            for local in manifest.get("deleted", {}).get(name, []):
+                seg.deleted[local] = True
+            self._segments.append(seg)
+            self._segment_names.append(name)
+        self._invalidate_stats()
+
+    def _live_ids(self) -> Dict[str, Tuple[int, int]]:
+        """Doc id -> (segment, local index) of live docs, built on first use."""
+        if self._live is None:
+            self._live = {}
+            for seg_idx, seg in enumerate(self._segments):
+                self._shadow(seg_idx, seg)
+        return self._live
+
+    def _shadow(self, seg_idx: int, seg: _Segment) -> None:
+        for local in np.flatnonzero(~seg.deleted).tolist():
+            doc_id = seg.ids[local]
+            prev = self._live.get(doc_id)
+            if prev is not None:  # newer copy shadows the older one
+                self._segments[prev[0]].deleted[prev[1]] = True
+            self._live[doc_id] = (seg_idx, local)
+
+    def _attach(self, name: str, seg: _Segment) -> None:
+        self._live_ids()  # from the existing segments, before the new one shadows them
+        self._segments.append(seg)
+        self._segment_names.append(name)
+        self._shadow(len(self._segments) - 1, seg)
+        self._invalidate_stats()
+
+    def _invalidate_stats(self) -> None:
+        self._df_cache = {}
+        self._total_len = None
+        self._n_live = None
+
+    def _write_manifest(self) -> None:
+        manifest = {
+            "next_segment": self._next_segment,
+            "segments": self._segment_names,
+            "deleted": {
+                name: np.flatnonzero(seg.deleted).tolist()
+                for name, seg in zip(self._segment_names, self._segments)
+                if seg.deleted.any()
+            },
+        }
+        tmp_path = os.path.join(self.path, "manifest.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(self.path, "manifest.json"))
+        self._manifest_stat = self._stat_manifest()
+
+    # --------- WRITE ---------
+    def _live_count(self) -> int:
+        if self._n_live is None:
+            self._n_live = sum(len(seg) - int(np.count_nonzero(seg.deleted)) for seg in self._segments)
+        return self._n_live
+
+    @property
+    def num_docs(self) -> int:
+        return self._live_count() + len(self._buffer)
+
+    @property
+    def num_segments(self) -> int:
+        return len(self._segments)
+
+    def add_documents(self, docs: List[Dict]) -> None:
+        """Add or replace docs ({"id", "question", "answer", "row_id", "chunk_id", optional "category"})."""
+        for d in docs:
+            self._buffer[d["id"]] = d
+        if len(self._buffer) >= self.max_buffer_docs:
+            self.flush()
+
+    def delete(self, ids: List[str]) -> None:
+        live = self._live_ids()
+        for doc_id in ids:
+            self._buffer.pop(doc_id, None)
+            loc = live.pop(doc_id, None)
+            if loc is not None:
+                self._segments[loc[0]].deleted[loc[1]] = True
+        self._invalidate_stats()
+
+    def flush(self) -> None:
+        """Write buffered docs as a new segment and persist tombstones."""
+        if self._buffer:
+            seg = _Segment.build(list(self._buffer.values()))
+            self._buffer = {}
+            name = f"seg-{self._next_segment:05d}"
+            self._next_segment += 1
+            if self.path:
+                seg.save(os.path.join(self.path, name))
+                seg = _Segment.load(os.path.join(self.path, name))
+            self._attach(name, seg)
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            self._write_manifest()
+
+    def compact(self) -> None:
+        """Merge all live documents into one segment and drop the old ones."""
+        self.flush()
+        docs = [self._segments[s].doc(l) for s, l in self._live_ids().values()]
+        old_names = list(self._segment_names)
+        self._segments, self._segment_names, self._live = [], [], {}
+        self._buffer = {d["id"]: d for d in docs}
+        self.flush()
+        if self.path:
+            for name in old_names:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    # --------- SEARCH ---------
+    def _df(self, term: str) -> int:
+        """Live documents containing `term` (tombstoned and shadowed copies excluded)."""
+        df = self._df_cache.get(term)
+        if df is None:
+            df = 0
+            for seg in self._segments:
+                p = seg.postings(term)
+                if p is not None:
+                    df += len(p[0]) - int(np.count_nonzero(seg.deleted[p[0]]))
+            self._df_cache[term] = df
+        return df
+
+    def search(self, query: str, top_k: int = 20, category: Optional[str] = None) -> List[Dict]:
+        """Top docs by BM25 score (doc dicts with a "bm25_score" field), only of `category` if given."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        n_docs = self._live_count()
+        if not terms or n_docs == 0:
+            return []
+
+        if self._total_len is None:
+            self._total_len = sum(
+                int(np.asarray(seg.doc_lens)[~seg.deleted].sum()) for seg in self._segments
+            )
+        avgdl = max(self._total_len / n_docs, 1.0)
+
+        hits: List[Tuple[float, int, int]] = []
+        for seg_idx, seg in enumerate(self._segments):
+            scores = None
+            for term in terms:
+                p = seg.postings(term)
+                if p is None:
+                    continue
+                df = self._df(term)
+                idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+                doc_ids, tfs = p
+                tf = np.asarray(tfs, dtype=np.float32)
+                dl = np.asarray(seg.doc_lens)[doc_ids]
+                if scores is None:
+                    scores = np.zeros(len(seg), dtype=np.float32)
+                # each doc appears at most once per term, so fancy-index += is safe
+                scores[doc_ids] += idf * tf * (self.k1 + 1) / (
+                    tf + self.k1 * (1 - self.b + self.b * dl / avgdl)
+                )
+            if scores is None:
+                continue
+            scores[seg.deleted] = 0.0
+            if category is not None:
+                scores[~seg.category_mask(category)] = 0.0
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            hits.extend((float(scores[i]), seg_idx, int(i)) for i in top if scores[i] > 0)
+
+        hits.sort(reverse=True)
+        results = []
+        for score, seg_idx, local in hits[:top_k]:
+            d = self._segments[seg_idx].doc(local)
+            results.append({
+                "question": d.get("question", ""),
+                "answer": d.get("answer", ""),
+                "row_id": d.get("row_id"),
+                "chunk_id": d.get("chunk_id"),
+                "category": d.get("category") or None,
+                "bm25_score": score,
+            })
+        return results
+
+
+def sparse_index_path(backend: str = VECTOR_BACKEND):
+    """BM25 index mirroring the chunks of one vector backend."""
+    return VECTORSTORE_DIR / f"bm25_{backend}"
+
+
+def load_sparse_index(path) -> Optional[BM25Index]:
+    """The BM25 index at `path`, or None if ingestion has not built one."""
+    if not os.path.exists(os.path.join(str(path), "manifest.json")):
+        return None
+    return BM25Index(path)
+
+
+# ------------------ FUSION ------------------
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict]], k: int = 60, top_k: int = 5) -> List[Dict]:
+    """
+    Merge ranked doc lists with RRF: rrf_score(d) = sum over lists of 1 / (k + rank).
+    Docs are matched on (row_id, chunk_id); the first copy seen is kept, with its
+    own fields (e.g. the dense "score"), plus an "rrf_score" field.
+    """
+    fused: Dict[Tuple, Dict] = {}
+    scores: Dict[Tuple, float] = {}
+    for results in result_lists:
+        for rank, d in enumerate(results, start=1):
+            key = (d.get("row_id"), d.get("chunk_id"))
+            if key not in fused:
+                fused[key] = dict(d)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    out = []
+    for key in ranked:
+        d = fused[key]
+        d["rrf_score"] = scores[key]
+        out.append(d)
+    return out
@@ -0,0 +1,12 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Settings must be in the environment before config.py is first imported:
+# whitespace chunking (no tokenizer download) and no background model loading.
+os.environ.setdefault("CHUNK_TOKENIZER", "words")
+os.environ.setdefault("GENERATOR_BACKGROUND_LOAD", "0")
+os.environ.setdefault("METRICS_JSON_LOG", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
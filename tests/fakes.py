@@ -0,0 +1,71 @@
+# tests/fakes.py
+"""Stand-ins for the embedding model, tokenizer and generator in tests."""
+
+import re
+import zlib
+
+import numpy as np
+
+
+class HashEmbedder:
+    """Deterministic bag-of-words vectors."""
+
+    dim = 32
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, **kwargs):
+        out = np.full((len(texts), self.dim), 1e-3, dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i, zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+        return out
+
+
+class WordTokenizer:
+    """
+    Whitespace words as tokens (for ContextBuilder.count_tokens). With
+    `return_overflowing_tokens` it windows like a fast tokenizer (for TokenChunker):
+    `max_length` words per window, `stride` shared, with character offsets.
+    """
+
+    def __call__(self, texts, add_special_tokens=False, max_length=None, stride=0,
+                 return_overflowing_tokens=False, **kwargs):
+        if not return_overflowing_tokens:
+            return {"input_ids": [t.split() for t in texts]}
+        enc = {"input_ids": [], "offset_mapping": [], "overflow_to_sample_mapping": []}
+        for i, text in enumerate(texts):
+            spans = [m.span() for m in re.finditer(r"\S+", text)]
+            for start in range(0, max(len(spans) - stride, 1), max_length - stride):
+                window = spans[start:start + max_length]
+                enc["input_ids"].append([text[s:e] for s, e in window])
+                enc["offset_mapping"].append(window)
+                enc["overflow_to_sample_mapping"].append(i)
+        return enc
+
+
+class FakeGenerator:
+    """Echoes the question; marks every plan with `time_capped` like the real generators do."""
+
+    def __init__(self, time_capped: bool = False):
+        self.time_capped = time_capped
+        self.calls = 0
+        self.batches = []  # prompts per generate_batch call
+
+    def _answer(self, prompt, plan):
+        self.calls += 1
+        if plan is not None:
+            plan["time_capped"] = self.time_capped
+        return f"answer {self.calls}"
+
+    def generate(self, prompt, plan=None):
+        return self._answer(prompt, plan)
+
+    def generate_batch(self, prompts, batch_size=8, plans=None):
+        self.batches.append(list(prompts))
+        return [self._answer(p, plan) for p, plan in zip(prompts, plans or [None] * len(prompts))]
+
+    def stream(self, prompt, plan=None):
+        for word in self._answer(prompt, plan).split():
+            yield word + " "
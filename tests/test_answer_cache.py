@@ -0,0 +1,74 @@
+# tests/test_answer_cache.py
+
+import numpy as np
+
+import answer_cache
+from answer_cache import SemanticAnswerCache
+from fakes import HashEmbedder
+
+EMBEDDER = HashEmbedder()
+
+
+def vec(text):
+    return EMBEDDER.encode([text])[0]
+
+
+def make_cache(**kwargs):
+    kwargs = {"threshold": 0.95, "max_entries": 100, "ttl_seconds": 0, "max_mb": 64, "persist_path": None, **kwargs}
+    return SemanticAnswerCache(**kwargs)
+
+
+def test_hit_miss_and_tone():
+    cache = make_cache()
+    docs = [{"question": "Refund status", "answer": "5 days"}]
+    cache.store(vec("where is my refund"), "Friendly", "where is my refund", "Soon! 😊", docs)
+
+    assert cache.lookup(vec("where is my  refund"), "Friendly") == ("Soon! 😊", docs)
+    assert cache.lookup(vec("where is my refund"), "Formal") is None  # other tones never match
+    assert cache.lookup(vec("how do I reset my password"), "Friendly") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_ttl_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = make_cache(ttl_seconds=60)
+    cache.store(vec("refund"), "Formal", "refund", "a", [])
+
+    now[0] += 30
+    assert cache.lookup(vec("refund"), "Formal") is not None
+    now[0] += 31
+    assert cache.lookup(vec("refund"), "Formal") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_keeps_recently_used_entries():
+    cache = make_cache(max_entries=2)
+    for q in ("refund", "password", "invoice"):
+        if q == "invoice":
+            assert cache.lookup(vec("refund"), "Formal") is not None  # refund is now the newest
+        cache.store(vec(q), "Formal", q, f"answer {q}", [])
+
+    assert cache.lookup(vec("password"), "Formal") is None
+    assert cache.lookup(vec("refund"), "Formal") == ("answer refund", [])
+    assert cache.lookup(vec("invoice"), "Formal") == ("answer invoice", [])
+    assert cache.stats()["evictions"] == 1
+
+
+def test_memory_cap_evicts_oldest():
+    cache = make_cache(max_mb=1e-3)  # ~1 KB
+    for i in range(5):
+        cache.store(vec(f"question {i}"), "Formal", f"question {i}", "x" * 300, [])
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    assert cache.lookup(vec("question 4"), "Formal") is not None
+    assert cache.lookup(vec("question 0"), "Formal") is None
+
+
+def test_save_and_load(tmp_path):
+    path = tmp_path / "answer_cache.npz"
+    cache = make_cache()
+    cache.store(vec("refund"), "Formal", "refund", "answer", [{"row_id": 1}])
+    cache.save(path)
+
+    restored = make_cache(persist_path=path)
+    assert restored.lookup(np.asarray(vec("refund")), "Formal") == ("answer", [{"row_id": 1}])
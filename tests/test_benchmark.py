@@ -0,0 +1,56 @@
+# tests/test_benchmark.py
+
+import pandas as pd
+
+import benchmark
+from fakes import HashEmbedder
+
+CORPUS = pd.DataFrame(
+    {
+        "question": ["How do I pay with UPI?", "Where is my refund?", "cancel my order"],
+        "answer": ["Choose UPI at checkout.", "Refunds reach your card in 5 days.", "Open Orders and cancel it."],
+        "category": ["Billing", "Billing", "Orders & Delivery"],
+    },
+    index=["faq-1", "faq-2", 7],
+)
+
+
+def report(p95=100.0, recall=0.8):
+    return {"retrieval": {"latency_ms": {"p95": p95}, "recall@1": recall, "recall@k": recall}}
+
+
+def test_percentiles():
+    stats = benchmark.percentiles([1, 2, 3, 4, 100])
+    assert stats["n"] == 5 and stats["p50"] == 3.0 and stats["max"] == 100.0
+    assert benchmark.percentiles([]) == {"n": 0}
+
+
+def test_compare_flags_only_regressions_beyond_the_threshold():
+    baseline = report()
+    assert benchmark.compare(report(p95=110.0, recall=0.85), baseline, max_regression=0.2) == []
+    problems = benchmark.compare(report(p95=130.0, recall=0.6), baseline, max_regression=0.2)
+    assert len(problems) == 3
+    assert problems[0].startswith("retrieval.latency_ms.p95 regressed 30.0%")
+    # Metrics missing from either report (e.g. --skip-generation) are not compared
+    assert benchmark.compare({}, baseline, max_regression=0.0) == []
+
+
+def test_build_stores_indexes_every_chunk(tmp_path):
+    store, sparse, n_chunks = benchmark.build_stores(CORPUS, HashEmbedder(), "memory", str(tmp_path), hybrid=True)
+    assert n_chunks == 3 and sparse.num_docs == 3
+    assert set(store._records) == {"faq-1-0", "faq-2-0", "7-0"}
+    assert store.read_fingerprint()["dimension"] == HashEmbedder.dim
+
+
+def test_retrieval_recall_and_mrr():
+    rankings = {"How do I pay with UPI?": ["faq-1", 7], "Where is my refund?": [7, "faq-2"], "cancel my order": []}
+
+    class Pipeline:
+        def _retrieve(self, question, top_k):
+            return [{"row_id": r} for r in rankings[question][:top_k]]
+
+    queries = benchmark.build_queries(CORPUS, n=10, seed=1)
+    assert [row for _, row in queries] == ["faq-1", "faq-2", "7"]  # FAQs first
+    result = benchmark.bench_retrieval(Pipeline(), queries, k=2)
+    assert result["queries"] == 3 and result["latency_ms"]["n"] == 3
+    assert (result["recall@1"], result["recall@k"], result["mrr"]) == (0.3333, 0.6667, 0.5)
@@ -0,0 +1,48 @@
+# tests/test_category_router.py
+
+import numpy as np
+
+from category_router import CategoryRouter, QuestionSampler, load_category_router
+from fakes import HashEmbedder
+
+EMBEDDER = HashEmbedder()
+SAMPLES = {
+    "Billing": ["where is my refund", "refund to my card", "refund status please"],
+    "Account & Login": ["reset my password", "forgot my password", "password reset link"],
+}
+
+
+def vec(text):
+    return EMBEDDER.encode([text])[0]
+
+
+def test_sampler_keeps_distinct_questions_up_to_the_cap():
+    sampler = QuestionSampler(per_category=2)
+    sampler.add(["Billing"] * 3 + ["", "Orders"], ["refund", "refund", "invoice", "orphan", ""])
+    assert sampler.samples == {"Billing": ["refund", "invoice"]}
+    sampler.add(["Billing"] * 20, [f"question {i}" for i in range(20)])
+    assert len(sampler.samples["Billing"]) == 2
+
+
+def test_confident_questions_are_routed_and_ambiguous_ones_are_not():
+    router = CategoryRouter.from_samples(EMBEDDER, SAMPLES, model_name="hash")
+    router.min_score, router.min_margin = 0.45, 0.1
+    assert router.categories == ["Account & Login", "Billing"]
+
+    routes = router.route([vec("refund status"), vec("password reset"), vec("refund password"), vec("hello")])
+    assert routes == ["Billing", "Account & Login", None, None]  # too close to call; too far from both
+    assert router.stats()["routed"] == 2 and router.stats()["route_rate"] == 0.5
+
+
+def test_categories_missing_from_a_rerun_keep_their_centroid(tmp_path):
+    previous = CategoryRouter.from_samples(EMBEDDER, SAMPLES, model_name="hash")
+    router = CategoryRouter.from_samples(EMBEDDER, {"Billing": ["invoice copy"]}, previous=previous, model_name="hash")
+    assert router.categories == previous.categories
+    assert np.allclose(router.centroids[0], previous.centroids[0])  # Account & Login: not sampled this time
+    assert not np.allclose(router.centroids[1], previous.centroids[1])
+
+    path = tmp_path / "categories.npz"
+    router.save(path)
+    assert np.allclose(load_category_router(path, model_name="hash").centroids, router.centroids)
+    assert load_category_router(path, model_name="other-model") is None  # built for another embedding model
+    assert load_category_router(tmp_path / "missing.npz") is None
@@ -0,0 +1,58 @@
+# tests/test_chunk_store.py
+
+import json
+import shutil
+
+from chunk_store import ChunkStore
+from fakes import HashEmbedder
+
+EMBEDDER = HashEmbedder()
+
+
+def records(*answers):
+    vectors = EMBEDDER.encode(list(answers))
+    return [
+        {"id": f"{i}-0", "values": v, "metadata": {"question": f"q{i}", "answer": a, "row_id": i, "chunk_id": 0}}
+        for i, (a, v) in enumerate(zip(answers, vectors))
+    ]
+
+
+def write(path, *answers, compact=False) -> ChunkStore:
+    store = ChunkStore(path)
+    store.upsert(records(*answers))
+    store.flush()
+    if compact:
+        store.compact()
+    return store
+
+
+def test_compaction_keeps_the_replaced_segments_for_one_generation(tmp_path):
+    write(tmp_path, "five days", "forgot password link")
+    write(tmp_path, "seven days")
+    old_manifest = (tmp_path / "manifest.json").read_text()
+
+    write(tmp_path, "ten days", compact=True)
+    # A reader that read the previous manifest can still load its segments
+    shutil.copy(tmp_path / "manifest.json", tmp_path / "new_manifest.json")
+    (tmp_path / "manifest.json").write_text(old_manifest)
+    assert ChunkStore(tmp_path).hydrate([("0-0", 1.0)])[0]["answer"] == "seven days"
+    shutil.move(tmp_path / "new_manifest.json", tmp_path / "manifest.json")
+
+    write(tmp_path, "twelve days", compact=True)
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert sorted(p.name for p in tmp_path.glob("seg-*")) == sorted(manifest["segments"] + manifest["retired"])
+    assert ChunkStore(tmp_path).hydrate([("0-0", 1.0), ("1-0", 1.0)])[1]["answer"] == "forgot password link"
+
+
+def test_reader_keeps_its_chunks_when_a_segment_disappears_mid_reload(tmp_path):
+    write(tmp_path, "five days")
+    reader = ChunkStore(tmp_path, refresh_s=0)
+    write(tmp_path, "seven days")
+    shutil.move(tmp_path / "seg-00001", tmp_path / "hidden")  # gone before the reader got to it
+
+    assert not reader.refresh()
+    assert reader.hydrate([("0-0", 1.0)])[0]["answer"] == "five days"
+
+    shutil.move(tmp_path / "hidden", tmp_path / "seg-00001")
+    assert reader.refresh()  # retried at the next check
+    assert reader.hydrate([("0-0", 1.0)])[0]["answer"] == "seven days"
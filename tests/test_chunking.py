@@ -0,0 +1,52 @@
+# tests/test_chunking.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from chunking import TokenChunker, build_chunks
+from fakes import WordTokenizer
+
+TEXT = " ".join(f"w{i}" for i in range(10))
+
+
+def token_chunker(max_tokens=4, overlap=1) -> TokenChunker:
+    """The fast-tokenizer path, with whitespace words as tokens."""
+    chunker = TokenChunker("words", max_tokens=max_tokens, overlap=overlap)
+    chunker.tokenizer = WordTokenizer()
+    return chunker
+
+
+@pytest.mark.parametrize("make", [lambda: TokenChunker("words", max_tokens=4, overlap=1), token_chunker])
+def test_windows_overlap_and_cover_the_text(make):
+    sources, chunks = make().split([TEXT, "short  answer", ""])
+    assert chunks == ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9", "short  answer", ""]
+    assert sources.tolist() == [0, 0, 0, 1, 2]
+
+
+def test_chunks_are_cut_from_the_original_text_by_offsets():
+    text = "Open  Settings,\nthen tap   Reset."
+    _, chunks = token_chunker(max_tokens=3, overlap=0).split([text])
+    assert chunks == ["Open  Settings,\nthen", "tap   Reset."]
+
+
+@pytest.mark.parametrize("max_tokens, overlap", [(0, 0), (4, 4), (4, -1)])
+def test_invalid_window_settings_are_rejected(max_tokens, overlap):
+    with pytest.raises(ValueError, match="CHUNK_OVERLAP_TOKENS"):
+        TokenChunker("words", max_tokens=max_tokens, overlap=overlap)
+
+
+def test_build_chunks_numbers_chunks_per_row_and_keeps_labels():
+    df = pd.DataFrame(
+        {"question": ["Long one", "Short one", "Empty one"], "answer": [TEXT, "five days", np.nan],
+         "category": ["Billing", None, "Orders"]},
+        index=[7, 8, "faq-1"],
+    )
+    chunks = build_chunks(df, token_chunker())
+
+    assert chunks["row_id"].tolist() == [7, 7, 7, 8, "faq-1"]
+    assert chunks["chunk_id"].tolist() == [0, 1, 2, 0, 0]
+    assert chunks["question"].tolist() == ["Long one"] * 3 + ["Short one", "Empty one"]
+    assert chunks["answer_chunk"].tolist()[3:] == ["five days", ""]
+    assert chunks["category"].tolist() == ["Billing"] * 3 + ["", "Orders"]
+    assert "intent" not in chunks
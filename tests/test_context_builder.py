@@ -0,0 +1,65 @@
+# tests/test_context_builder.py
+
+import numpy as np
+
+from context_builder import ContextBuilder, _join_overlapping
+from fakes import HashEmbedder, WordTokenizer
+
+
+def make_builder(vectors=None, **kwargs):
+    """ContextBuilder over word tokens; `vectors` maps answer text -> stored chunk vector."""
+    doc_vectors = (lambda docs: np.array([vectors[d["answer"]] for d in docs])) if vectors else None
+    return ContextBuilder(HashEmbedder().encode, tokenizer=WordTokenizer(), doc_vectors=doc_vectors, **kwargs)
+
+
+def doc(row_id, answer, chunk_id=0):
+    return {"row_id": row_id, "chunk_id": chunk_id, "answer": answer}
+
+
+def test_join_overlapping_drops_the_shared_text():
+    assert _join_overlapping("Refunds reach your card in", "reach your card in 5 days.") == (
+        "Refunds reach your card in 5 days."
+    )
+    # A few shared characters are a coincidence, not an overlap
+    assert _join_overlapping("Open the app", "app store") == "Open the app app store"
+
+
+def test_consecutive_chunks_are_merged_in_chunk_order():
+    builder = make_builder()
+    docs = [
+        doc(1, "reach your card in 5 days after approval.", chunk_id=1),
+        doc(1, "Refunds are approved first, then reach your card in", chunk_id=0),
+        doc(2, "Use the forgot password link."),
+    ]
+    context = builder.build(HashEmbedder().encode(["refund card"])[0], docs, budget_tokens=100)
+    passages = context.split("\n\n")
+    assert "Refunds are approved first, then reach your card in 5 days after approval." in passages
+    assert "Use the forgot password link." in passages and len(passages) == 2
+
+
+def test_duplicates_are_dropped():
+    vectors = {"a": [1.0, 0.0], "a again": [0.999, 0.04], "b": [0.6, 0.8]}
+    builder = make_builder(vectors, dedup_threshold=0.95)
+    docs = [doc(1, "a"), doc(2, "a again"), doc(3, "b"), doc(4, "a")]
+    assert builder.build([1.0, 0.0], docs, budget_tokens=100).split("\n\n") == ["a", "b"]
+
+
+def test_mmr_prefers_a_diverse_chunk_over_a_near_copy():
+    vectors = {
+        "refund card": [0.9, 0.43, 0.0],
+        "refund card again": [0.88, 0.47, 0.0],
+        "refund wallet": [0.8, 0.0, 0.6],
+    }
+    builder = make_builder(vectors, mmr_lambda=0.5, dedup_threshold=1.01)
+    docs = [doc(i, text) for i, text in enumerate(vectors)]
+    # Room for two of the three two/three-word chunks (plus separators)
+    context = builder.build([1.0, 0.0, 0.0], docs, budget_tokens=6)
+    assert context.split("\n\n") == ["refund card", "refund wallet"]
+
+
+def test_context_fits_the_token_budget():
+    builder = make_builder(max_tokens=8)
+    docs = [doc(i, f"answer number {i} has six words") for i in range(5)]
+    context = builder.build(HashEmbedder().encode(["answer"])[0], docs, budget_tokens=100)
+    assert sum(len(p.split()) + 1 for p in context.split("\n\n")) <= 8
+    assert builder.build([1.0] * HashEmbedder.dim, docs, budget_tokens=0) == ""
@@ -0,0 +1,78 @@
+# tests/test_decoding_policy.py
+
+import time
+
+import numpy as np
+import pytest
+
+from decoding_policy import DecodingPolicy, make_plan
+from rag_pipeline import GeneratorModel
+
+# A context the way the token budget leaves it: several retrieved passages
+CONTEXT = "\n\n".join(f"Passage {i}: " + "refunds reach the original payment method " * 10 for i in range(5))
+
+
+@pytest.mark.parametrize(
+    "question, policy",
+    [
+        ("How do I reset my password?", "greedy"),
+        ("I ordered a blue jacket last Tuesday and it has not shipped yet, when will it leave the warehouse?",
+         "short_beam"),
+        ("Why was I charged twice, and why is the refund still not showing on my card?", "full_beam"),
+    ],
+)
+def test_every_policy_is_reachable_with_a_full_context(question, policy):
+    assert DecodingPolicy("adaptive").plan(question, CONTEXT)["policy"] == policy
+
+
+def test_load_steps_down_and_pinned_modes_ignore_it():
+    adaptive = DecodingPolicy("adaptive", shed_load=2)
+    question = "Why was I charged twice, and why is the refund still not showing on my card?"
+    assert adaptive.plan(question, CONTEXT, load=2)["policy"] == "short_beam"
+    assert adaptive.plan(question, CONTEXT, load=4)["policy"] == "greedy"
+    assert DecodingPolicy("full_beam").plan("hi", load=10)["policy"] == "full_beam"
+    with pytest.raises(ValueError, match="DECODING_POLICY"):
+        DecodingPolicy("sampling")
+
+
+def test_time_cap_is_optional():
+    assert DecodingPolicy("greedy", max_time_s=3).plan("hi")["max_time"] == 3
+    assert "max_time" not in GeneratorModel._generate_kwargs(make_plan("full_beam", max_time_s=0))
+
+
+class ArrayTokenizer:
+    """Word lengths as ids ("slow" -> 999), as numpy arrays instead of torch tensors."""
+
+    @staticmethod
+    def _ids(text):
+        return [999 if w == "slow" else len(w) for w in text.split()]
+
+    def __call__(self, texts, return_tensors=None, **kwargs):
+        ids = [self._ids(t) for t in texts]
+        if return_tensors is None:
+            return {"input_ids": ids}
+        width = max(len(i) for i in ids)
+        return {"input_ids": np.array([i + [0] * (width - len(i)) for i in ids])}
+
+    def batch_decode(self, outputs, **kwargs):
+        return [" ".join(str(i) for i in row if i) for row in outputs]
+
+
+class SlowWhenAskedModel:
+    def generate(self, input_ids=None, max_time=None, **kwargs):
+        if (input_ids == 999).any():
+            time.sleep(max_time * 2)
+        return input_ids
+
+
+def test_batch_plans_are_not_shared_between_prompts():
+    generator = object.__new__(GeneratorModel)
+    generator.tokenizer = ArrayTokenizer()
+    generator.model = SlowWhenAskedModel()
+
+    shared = make_plan("greedy", max_time_s=0.02)
+    own = dict(make_plan("greedy", max_time_s=0.02), time_capped=True)  # left over from an earlier call
+    answers = generator.generate_batch(["slow one", "fast two", "fast three"], batch_size=1, plans=[shared, shared, own])
+    assert answers == ["999 3", "4 3", "4 5"]
+    assert shared["time_capped"] is True  # one of its prompts was cut short
+    assert own["time_capped"] is False
@@ -0,0 +1,25 @@
+# tests/test_embedding_service.py
+
+import numpy as np
+
+from embedding_service import EmbeddingService
+from fakes import HashEmbedder
+
+
+def make_service(path, **kwargs):
+    return EmbeddingService("hash", model=HashEmbedder(), batch_window_ms=0, disk_cache_path=path, **kwargs)
+
+
+def test_only_persisting_services_write_the_disk_cache(tmp_path):
+    path = tmp_path / "embedding_cache.db"
+    corpus = make_service(path, persist=True)
+    expected = corpus.encode(["How do I get a refund?"])
+
+    app = make_service(path)
+    np.testing.assert_allclose(app.encode(["How  do I get a refund?"]), expected, atol=1e-2)
+    assert app.disk_hits == 1 and app.encoded == 0
+
+    app.encode(["my card number is 1234"])
+    assert app.disk.count() == 1  # the question stays in memory only
+    assert app.encode(["my card number is 1234"]).shape == (1, HashEmbedder.dim)
+    assert app.encoded == 1 and app.memory_hits == 1
@@ -0,0 +1,64 @@
+# tests/test_escalation_store.py
+
+import csv
+import threading
+
+from escalation_store import COLUMNS, BatchedEscalationWriter, EscalationStore
+
+
+def row(i):
+    return {"timestamp": str(i), "user_email": f"user{i}@example.com", "user_question": f"question {i}"}
+
+
+def test_tail_returns_the_latest_rows_oldest_first(tmp_path):
+    store = EscalationStore(tmp_path / "escalations.db", legacy_csv=None)
+    store.append_many([row(i) for i in range(5)])
+    store.append(row(5))
+
+    assert store.count() == 6
+    assert [r["timestamp"] for r in store.tail(3)] == ["3", "4", "5"]
+    assert store.tail(1)[0]["model_answer"] == ""  # missing columns are stored empty
+
+
+def test_concurrent_writers_never_lose_rows(tmp_path):
+    path = tmp_path / "escalations.db"
+    EscalationStore(path, legacy_csv=None)
+
+    def write(offset):
+        store = EscalationStore(path, legacy_csv=None)  # like one per Streamlit process
+        for i in range(25):
+            store.append(row(offset + i))
+
+    threads = [threading.Thread(target=write, args=(100 * t,)) for t in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert EscalationStore(path, legacy_csv=None).count() == 100
+
+
+def test_legacy_csv_is_imported_once(tmp_path):
+    legacy = tmp_path / "escalations.csv"
+    with open(legacy, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows([row(1), row(2)])
+
+    path = tmp_path / "escalations.db"
+    assert EscalationStore(path, legacy_csv=legacy).count() == 2
+    assert EscalationStore(path, legacy_csv=legacy).count() == 2
+
+    export = tmp_path / "export.csv"
+    assert EscalationStore(path, legacy_csv=None).export_csv(export) == 2
+    with open(export, encoding="utf-8", newline="") as f:
+        assert [r["user_question"] for r in csv.DictReader(f)] == ["question 1", "question 2"]
+
+
+def test_batched_writer_flushes_on_close(tmp_path):
+    store = EscalationStore(tmp_path / "escalations.db", legacy_csv=None)
+    writer = BatchedEscalationWriter(store, max_batch=10, max_wait_s=0.05)
+    for i in range(25):
+        writer.submit(row(i))
+    writer.close()
+    assert store.count() == 25
+    assert store.tail(1)[0]["timestamp"] == "24"
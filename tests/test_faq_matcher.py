@@ -0,0 +1,61 @@
+# tests/test_faq_matcher.py
+
+import json
+
+from faq_matcher import FaqMatcher
+from fakes import HashEmbedder
+
+FAQS = [
+    {"id": 1, "category": "Account & Login", "question": "How can I reset my password?",
+     "answer": "Use the Forgot Password link."},
+    {"id": 2, "category": "Billing", "question": "How do I get an invoice?", "answer": "Invoices are emailed."},
+]
+
+
+class CountingEmbedder(HashEmbedder):
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts, **kwargs):
+        self.calls += 1
+        return super().encode(texts, **kwargs)
+
+
+def make_matcher(tmp_path, embedder=None, faqs=FAQS, **kwargs):
+    faqs_file = tmp_path / "faqs.json"
+    faqs_file.write_text(json.dumps(faqs), encoding="utf-8")
+    kwargs = {"threshold": 0.9, "embeddings_file": tmp_path / "faq_embeddings.npz", "model_name": "hash", **kwargs}
+    return FaqMatcher(embedder or HashEmbedder(), faqs_file=faqs_file, **kwargs)
+
+
+def vec(text):
+    return HashEmbedder().encode([text])[0]
+
+
+def test_close_questions_get_the_curated_answer(tmp_path):
+    matcher = make_matcher(tmp_path)
+    answer, docs = matcher.answer(vec("how can I reset my password"), tone="Formal")
+    assert answer.startswith("Use the Forgot Password link.") and "further assistance" in answer
+    assert docs[0]["row_id"] == "faq-1" and docs[0]["category"] == "Account & Login"
+    assert docs[0]["score"] >= 0.9
+
+    friendly, _ = matcher.answer(vec("how can I reset my password"), tone="Friendly")
+    assert friendly.startswith("Happy to help!")
+
+
+def test_questions_below_the_threshold_fall_through(tmp_path):
+    matcher = make_matcher(tmp_path)
+    assert matcher.answer(vec("my parcel never arrived")) is None
+    assert matcher.answer(vec("password")) is None  # related, but not the same question
+    assert matcher.stats() == {"faqs": 2, "hits": 0, "misses": 2, "hit_rate": 0.0}
+
+
+def test_faq_embeddings_are_cached_until_the_faqs_change(tmp_path):
+    embedder = CountingEmbedder()
+    make_matcher(tmp_path, embedder)
+    make_matcher(tmp_path, embedder)
+    assert embedder.calls == 1
+
+    make_matcher(tmp_path, embedder, faqs=FAQS[:1])
+    make_matcher(tmp_path, embedder, model_name="other-model")
+    assert embedder.calls == 3
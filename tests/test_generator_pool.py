@@ -0,0 +1,141 @@
+# tests/test_generator_pool.py
+
+import os
+import time
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import generator_pool
+import rag_pipeline
+from decoding_policy import make_plan
+from generator_pool import BrokenGeneratorPool, GeneratorPool
+
+pytestmark = pytest.mark.skipif("fork" not in mp.get_all_start_methods(), reason="needs the fork start method")
+
+
+class ScriptedGenerator:
+    """Loaded in the parent and forked into the workers; the prompt says what to do."""
+
+    def __init__(self, model_name=None, backend=None):
+        pass
+
+    def generate(self, prompt, plan=None):
+        if prompt == "crash":
+            os._exit(3)
+        if prompt == "fail":
+            raise ValueError("bad prompt")
+        if prompt == "hang":
+            time.sleep(3)
+        if plan is not None:
+            plan["time_capped"] = prompt == "capped"
+        return f"answer to {prompt}"
+
+    def generate_batch(self, prompts, batch_size=8, plans=None):
+        return [self.generate(p, plan) for p, plan in zip(prompts, plans or [None] * len(prompts))]
+
+    def stream(self, prompt, plan=None):
+        for word in self.generate(prompt, plan).split():
+            yield word + " "
+        if prompt.startswith("break"):
+            raise ValueError("stream broke")
+
+
+class WeightsGenerator(ScriptedGenerator):
+    """64 MB of "weights"; answers with how much of its memory is private to its process."""
+
+    def __init__(self, model_name=None, backend=None):
+        import numpy as np
+
+        self.weights = np.ones(64 * 2**20, dtype=np.uint8)
+
+    def generate(self, prompt, plan=None):
+        if prompt == "private_mb":
+            time.sleep(0.3)  # keep this worker busy so the other one takes the next job
+            with open("/proc/self/smaps_rollup") as f:
+                fields = dict(line.split(":", 1) for line in f if line.startswith("Private"))
+            return str(sum(int(v.split()[0]) for v in fields.values()) / 1024)
+        return super().generate(prompt, plan)
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "GeneratorModel", ScriptedGenerator)
+    monkeypatch.setattr(generator_pool, "_set_torch_threads", lambda n: n)
+    pools = []
+
+    def make(**kwargs):
+        kwargs = {"n_workers": 2, "start_method": "fork", "warm_up": False, **kwargs}
+        pools.append(GeneratorPool(**kwargs))
+        return pools[-1]
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def test_generate_batch_and_stream(make_pool):
+    pool = make_pool()
+    assert pool.generate("hi") == "answer to hi"
+    assert pool.generate_batch(["a", "b", "c"], batch_size=2) == ["answer to a", "answer to b", "answer to c"]
+    assert "".join(pool.stream("hi")) == "answer to hi "
+
+
+def test_time_capped_flag_reaches_the_callers_plans(make_pool):
+    pool = make_pool()
+    plans = [{"policy": "greedy"}, {"policy": "greedy"}]
+    pool.generate_batch(["capped", "fine"], plans=plans)
+    assert [p["time_capped"] for p in plans] == [True, False]
+
+    plan = {"policy": "greedy"}
+    list(pool.stream("capped", plan))
+    assert plan["time_capped"] is True
+
+
+def test_worker_errors_reach_the_caller(make_pool):
+    pool = make_pool()
+    with pytest.raises(RuntimeError, match="bad prompt"):
+        pool.generate("fail")
+    with pytest.raises(RuntimeError, match="stream broke"):
+        list(pool.stream("break it"))
+    assert pool.generate("still ok") == "answer to still ok"  # an error does not break the pool
+
+
+def test_worker_crash_fails_pending_and_later_jobs(make_pool):
+    pool = make_pool()
+    with ThreadPoolExecutor(1) as executor:
+        pending = executor.submit(lambda: list(pool.stream("hang")))  # busy on the other worker
+        time.sleep(0.2)
+        with pytest.raises(BrokenGeneratorPool, match="exit code 3"):
+            pool.generate("crash")
+        with pytest.raises(BrokenGeneratorPool):
+            pending.result(timeout=5)
+    with pytest.raises(BrokenGeneratorPool):
+        pool.generate("hi")
+
+
+def test_stuck_job_times_out(make_pool, monkeypatch):
+    monkeypatch.setattr(generator_pool, "GENERATOR_MAX_TIME_S", 0.2)
+    pool = make_pool(timeout_s=0.3)
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        pool.generate("hang")
+    assert time.perf_counter() - started < 5
+
+
+def test_uncapped_plans_give_the_job_no_deadline():
+    capped = make_plan("greedy", max_time_s=2)
+    assert generator_pool._job_budget_s("batch", (["a", "b", "c"], 2, [capped] * 3)) == 4
+    assert generator_pool._job_budget_s("batch", (["a"], 1, [make_plan("full_beam", max_time_s=0)])) is None
+    assert generator_pool._job_budget_s("stream", ("a", make_plan("full_beam", max_time_s=0))) is None
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/smaps_rollup"), reason="needs /proc/self/smaps_rollup")
+def test_workers_share_the_weights_when_not_forked_from_here(make_pool):
+    pool = make_pool(start_method="forkserver", generator_cls=WeightsGenerator)
+    private_mb = [float(mb) for mb in pool.generate_batch(["private_mb", "private_mb"], batch_size=1)]
+    assert all(mb < 32 for mb in private_mb), private_mb  # not a 64 MB copy each
+
+    with pytest.raises(BrokenGeneratorPool, match="exit code 3"):
+        pool.generate("crash")
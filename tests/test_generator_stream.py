@@ -0,0 +1,85 @@
+# tests/test_generator_stream.py
+
+import threading
+import time
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+import rag_pipeline
+from decoding_policy import make_plan
+from rag_pipeline import GeneratorModel
+
+
+class FakeTokenizer:
+    """Word ids in, "w<id> " out (enough for TextIteratorStreamer)."""
+
+    def __call__(self, text, return_tensors=None, **kwargs):
+        ids = torch.tensor([[len(w) for w in text.split()]])
+        return {"input_ids": ids, "attention_mask": torch.ones_like(ids)}
+
+    def decode(self, ids, skip_special_tokens=True, **kwargs):
+        return "".join(f"w{int(i)} " for i in ids)
+
+
+class FakeModel:
+    def __init__(self, fail_at=None, stall_s=0.0):
+        self.fail_at = fail_at
+        self.stall_s = stall_s
+
+    def generate(self, input_ids=None, attention_mask=None, streamer=None, **kwargs):
+        streamer.put(input_ids)  # the prompt, skipped by the streamer
+        for step, token in enumerate([5, 6, 7]):
+            if step == self.fail_at:
+                raise RuntimeError("CUDA out of memory")
+            time.sleep(self.stall_s)
+            streamer.put(torch.tensor([token]))
+        streamer.end()
+        return input_ids
+
+
+def make_generator(model) -> GeneratorModel:
+    generator = object.__new__(GeneratorModel)
+    generator.backend = "fp32"
+    generator.tokenizer = FakeTokenizer()
+    generator.model = model
+    return generator
+
+
+def consume(generator, plan=None, timeout=5.0):
+    """Run generator.stream on a thread; (chunks, error), failing if it is still blocked."""
+    out = {"chunks": [], "error": None}
+
+    def run():
+        try:
+            for text in generator.stream("how do I reset my password", plan=plan):
+                out["chunks"].append(text)
+        except BaseException as e:
+            out["error"] = e
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    t.join(timeout)
+    assert not t.is_alive(), "stream consumer is still blocked"
+    return out["chunks"], out["error"]
+
+
+def test_stream_yields_generated_text():
+    chunks, error = consume(make_generator(FakeModel()))
+    assert error is None
+    assert "".join(chunks).split() == ["w5", "w6", "w7"]
+
+
+def test_stream_reraises_generate_errors():
+    chunks, error = consume(make_generator(FakeModel(fail_at=1)))
+    assert isinstance(error, RuntimeError)
+    assert "out of memory" in str(error)
+
+
+def test_stream_times_out_when_generate_stalls(monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "STREAM_STALL_MARGIN_S", 0.1)
+    plan = make_plan("greedy", max_time_s=0.1)
+    chunks, error = consume(make_generator(FakeModel(stall_s=1.0)), plan=plan)
+    assert isinstance(error, TimeoutError)
@@ -0,0 +1,257 @@
+# tests/test_ingestion.py
+
+import shutil
+
+import pandas as pd
+import pytest
+
+import ingest_to_pinecone as ingest
+from chunk_store import ChunkStore
+from fakes import HashEmbedder
+from retrievers import InMemoryRetriever, PineconeRetriever
+from sparse_index import BM25Index
+from vector_client import FakeVectorIndex
+
+
+class RecordingRetriever(InMemoryRetriever):
+    """InMemoryRetriever that remembers the ids upserted by the last run."""
+
+    def __init__(self):
+        super().__init__()
+        self.upserted = []
+
+    def upsert(self, vectors):
+        self.upserted.extend(v["id"] for v in vectors)
+        super().upsert(vectors)
+
+
+BITEXT = pd.DataFrame(
+    {
+        "question": ["cancel my order", "where is my refund", "change shipping address", "delete my account"],
+        "answer": [
+            "Open Orders and choose Cancel order.",
+            "Refunds are sent to the original payment method.",
+            "Edit the address under Orders before the parcel ships.",
+            "Go to Settings and choose Delete account.",
+        ],
+        "category": ["Orders & Delivery", "Billing", "Orders & Delivery", "Account & Login"],
+        "intent": ["cancel_order", "get_refund", "change_shipping_address", "delete_account"],
+    }
+)
+
+FAQS = pd.DataFrame(
+    {
+        "question": ["How do I pay with UPI?", "Can I get an invoice?"],
+        "answer": ["Choose UPI at checkout and approve the collect request.", "Invoices are emailed after delivery."],
+        "category": ["Billing", "Billing"],
+    },
+    index=["faq-1", "faq-2"],
+)
+
+
+class IngestEnv:
+    """Runs ingest_to_pinecone against an in-memory store, with all files under tmp_path."""
+
+    def __init__(self, tmp_path, monkeypatch):
+        self.dir = tmp_path
+        self.store = RecordingRetriever()
+        self.embedder = HashEmbedder()
+        self.data = {"bitext": BITEXT.copy(), "faqs": FAQS.copy()}
+
+        def batches(name):
+            def iter_batches(batch_rows=512, start_row=0):
+                df = self.data[name]
+                for start in range(start_row, len(df), batch_rows):
+                    yield df.iloc[start:start + batch_rows]
+            return iter_batches
+
+        monkeypatch.setattr(ingest, "VECTORSTORE_DIR", tmp_path)
+        monkeypatch.setattr(ingest, "SOURCES", {name: batches(name) for name in self.data})
+        monkeypatch.setattr(ingest, "EmbeddingService", lambda *args, **kwargs: self.embedder)
+        monkeypatch.setattr(ingest, "get_target", lambda *args, **kwargs: self.store)
+        monkeypatch.setattr(ingest, "sparse_index_path", lambda target: tmp_path / f"bm25_{target}")
+        monkeypatch.setattr(ingest, "chunk_store_path", lambda target: tmp_path / f"chunks_{target}")
+        monkeypatch.setattr(ingest, "category_router_path", lambda target: tmp_path / f"categories_{target}.npz")
+
+    def run(self, sources=("bitext", "faqs"), **kwargs):
+        self.store.upserted = []
+        ingest.ingest_to_pinecone(target="memory", sources=list(sources), batch_rows=2, **kwargs)
+
+    @property
+    def bm25_path(self):
+        return self.dir / "bm25_memory"
+
+    def bm25(self) -> BM25Index:
+        return BM25Index(self.bm25_path)
+
+    @property
+    def chunks_path(self):
+        return self.dir / "chunks_memory"
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    return IngestEnv(tmp_path, monkeypatch)
+
+
+def test_ingests_every_source(env):
+    env.run()
+    assert len(env.store._records) == len(BITEXT) + len(FAQS)
+    assert env.bm25().num_docs == len(BITEXT) + len(FAQS)
+    assert env.store._records["faq-1-0"]["metadata"]["category"] == "Billing"
+    assert (env.dir / "categories_memory.npz").exists()
+
+
+def test_rebuilt_bm25_index_gets_every_source(env):
+    env.run()
+    shutil.rmtree(env.bm25_path)
+
+    env.run()
+    sparse = env.bm25()
+    assert sparse.num_docs == len(BITEXT) + len(FAQS)
+    assert sparse.search("UPI checkout")[0]["row_id"] == "faq-1"
+    assert env.store.upserted == []  # nothing changed, so nothing is re-upserted
+
+
+def test_rerun_only_touches_changed_and_removed_rows(env):
+    env.run()
+    env.data["faqs"].loc["faq-2", "answer"] = "Download invoices from the Orders page."
+    env.data["bitext"] = env.data["bitext"].iloc[:3]
+
+    env.run()
+    assert env.store.upserted == ["faq-2-0"]
+    assert "3-0" not in env.store._records
+    assert "Orders page" in env.store._records["faq-2-0"]["metadata"]["answer"]
+    sparse = env.bm25()
+    assert sparse.num_docs == len(BITEXT) - 1 + len(FAQS)
+    assert sparse.search("delete account") == []
+    assert "Orders page" in sparse.search("download invoices")[0]["answer"]
+
+
+def test_rebuilt_chunk_store_gets_every_source(env):
+    env.run()
+    shutil.rmtree(env.chunks_path)
+
+    env.run()
+    chunks = ChunkStore(env.chunks_path)
+    assert chunks.num_chunks == len(BITEXT) + len(FAQS)
+    assert chunks.hydrate([("faq-1-0", 1.0)])[0]["question"] == "How do I pay with UPI?"
+    assert env.store.upserted == []
+
+
+def test_open_chunk_store_reloads_after_reingestion(env):
+    env.run()
+    reader = ChunkStore(env.chunks_path, refresh_s=0)  # like the app: loaded once at startup
+    assert "emailed" in reader.hydrate([("faq-2-0", 1.0)])[0]["answer"]
+    assert not reader.refresh()
+
+    env.data["faqs"].loc["faq-2", "answer"] = "Download invoices from the Orders page."
+    env.data["bitext"] = env.data["bitext"].iloc[:3]
+    env.run()
+
+    assert reader.refresh()
+    assert "Orders page" in reader.hydrate([("faq-2-0", 1.0)])[0]["answer"]
+    assert reader.hydrate([("3-0", 1.0)]) is None  # deleted: the retriever falls back to metadata
+
+
+class FlakyDurableRetriever(RecordingRetriever):
+    """A store whose upserts are durable (like Pinecone) and that fails on the given upsert."""
+
+    durable_upserts = True
+
+    def __init__(self, fail_on=None):
+        super().__init__()
+        self.fail_on = fail_on
+        self.calls = 0
+
+    def upsert(self, vectors):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise ConnectionResetError("upsert failed")
+        super().upsert(vectors)
+
+
+def test_crashed_run_resumes_from_the_checkpoint_journal(env, monkeypatch):
+    monkeypatch.setattr(ingest, "CHECKPOINT_EVERY_SECONDS", 0)
+    env.store = FlakyDurableRetriever(fail_on=2)
+    with pytest.raises(ConnectionResetError):
+        env.run(sources=["bitext"], workers=1, max_inflight=0)
+
+    journal = ingest.checkpoint_path("memory", "bitext")
+    state = ingest._read_checkpoint(journal)
+    assert state["rows_done"] == 2 and set(state["hashes"]) == {"0-0", "1-0"}
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write('{"rows_done": 2, "chu')  # torn by the crash
+
+    env.store.fail_on = None
+    env.run(sources=["bitext"], workers=1, max_inflight=0)
+    assert env.store.upserted == ["2-0", "3-0"]  # rows 0-1 are not re-sent
+    assert not journal.exists()
+    manifest = ingest._read_json(ingest.manifest_path("memory"), {})
+    assert set(manifest["bitext"]) == {"0-0", "1-0", "2-0", "3-0"}
+
+
+def test_checkpoint_saves_append_to_the_journal(tmp_path):
+    journal = tmp_path / "ckpt.jsonl"
+    ingest._start_checkpoint(journal, {"rows_done": 2, "chunks_done": 2, "hashes": {"a": "1", "b": "2"}})
+    ingest._append_checkpoint(journal, {"rows_done": 1, "chunks_done": 1, "hashes": {"c": "3"}, "namespaces": {"c": "x"}})
+
+    assert len(journal.read_text().splitlines()) == 2
+    assert ingest._read_checkpoint(journal) == {  # the first line is in the older format, without namespaces
+        "rows_done": 3, "chunks_done": 3, "hashes": {"a": "1", "b": "2", "c": "3"}, "namespaces": {"c": "x"}
+    }
+
+
+def test_index_from_another_embedding_model_is_rebuilt_or_refused(env):
+    env.run()
+    env.store.write_fingerprint({"embedding_model": "some-other-model", "dimension": HashEmbedder.dim})
+    env.run()
+    assert len(env.store.upserted) == len(BITEXT) + len(FAQS)  # everything re-embedded
+    assert env.store.read_fingerprint()["embedding_model"] == ingest.EMBEDDING_MODEL_NAME
+
+    env.store.write_fingerprint({"embedding_model": ingest.EMBEDDING_MODEL_NAME, "dimension": 16})
+    with pytest.raises(ValueError, match="dimension 16"):
+        env.run()
+
+
+class RecordingPinecone(PineconeRetriever):
+    """PineconeRetriever (over a FakeVectorIndex) that remembers the ids upserted by the last run."""
+
+    def upsert(self, vectors):
+        self.upserted.extend(v["id"] for v in vectors)
+        super().upsert(vectors)
+
+
+def test_chunks_follow_their_category_namespace(env):
+    index = FakeVectorIndex(dimension=HashEmbedder.dim)
+
+    def ids_by_namespace():
+        return {ns: set(records) for ns, records in index._namespaces.items() if records and ns != "__meta__"}
+
+    env.store = RecordingPinecone(index=index, namespace="kb", partitioned=False)
+    env.run()
+    assert ids_by_namespace() == {"kb": {"0-0", "1-0", "2-0", "3-0", "faq-1-0", "faq-2-0"}}
+
+    # Switching an existing index to partitioned moves every chunk, changed or not
+    env.store = RecordingPinecone(index=index, namespace="kb", partitioned=True)
+    env.run()
+    assert ids_by_namespace() == {
+        "kb__billing": {"1-0", "faq-1-0", "faq-2-0"},
+        "kb__orders-delivery": {"0-0", "2-0"},
+        "kb__account-login": {"3-0"},
+    }
+    env.run()
+    assert env.store.upserted == []
+
+    # A category change leaves no copy in the old namespace
+    env.data["bitext"].loc[1, "category"] = "Orders & Delivery"
+    env.run()
+    assert env.store.upserted == ["1-0"]
+    assert ids_by_namespace()["kb__billing"] == {"faq-1-0", "faq-2-0"}
+    assert "1-0" in ids_by_namespace()["kb__orders-delivery"]
+    assert env.store.query(HashEmbedder().encode(["where is my refund"])[0], category="Billing")[0]["row_id"] != 1
+
+    # ... and switching back gathers them into the base namespace again
+    env.store = RecordingPinecone(index=index, namespace="kb", partitioned=False)
+    env.run()
+    assert ids_by_namespace() == {"kb": {"0-0", "1-0", "2-0", "3-0", "faq-1-0", "faq-2-0"}}
@@ -0,0 +1,75 @@
+# tests/test_metrics.py
+
+from contextlib import contextmanager
+
+from metrics import Metrics
+
+
+def test_spans_feed_the_histogram_and_the_current_trace():
+    m = Metrics(enabled=True)
+    records = []
+    m.add_trace_listener(records.append)
+
+    with m.trace("answer_question", tone="Formal"):
+        with m.span("embed"):
+            pass
+        m.annotate(path="rag", prompt_tokens=120)
+    with m.span("embed"):  # outside a trace: histogram only
+        pass
+
+    assert len(records) == 1
+    record = records[0]
+    assert record["trace"] == "answer_question" and record["tone"] == "Formal" and record["path"] == "rag"
+    assert [s["stage"] for s in record["spans"]] == ["embed"]
+    hist = m.snapshot()["histograms"]["supportsphere_stage_duration_seconds"][0]
+    assert hist["labels"] == {"stage": "embed"} and hist["count"] == 2
+    requests = m.snapshot()["counters"]["supportsphere_requests_total"]
+    assert requests == [{"labels": {"path": "rag", "trace": "answer_question"}, "value": 1.0}]
+
+
+def test_prometheus_export():
+    m = Metrics(enabled=True)
+    m.observe("prompt_tokens", 100)  # *_tokens use token buckets
+    m.inc("answer_cache_lookups_total", result="hit")
+    m.set_gauge("batcher_queue_depth", 3, batcher='say "hi"')
+
+    text = m.to_prometheus()
+    assert "# TYPE supportsphere_prompt_tokens histogram" in text
+    assert 'supportsphere_prompt_tokens_bucket{le="64.0"} 0' in text
+    assert 'supportsphere_prompt_tokens_bucket{le="128.0"} 1' in text
+    assert 'supportsphere_prompt_tokens_bucket{le="+Inf"} 1' in text
+    assert 'supportsphere_answer_cache_lookups_total{result="hit"} 1.0' in text
+    assert 'supportsphere_batcher_queue_depth{batcher="say \\"hi\\""} 3.0' in text
+
+
+def test_profilers_wrap_spans_and_broken_listeners_are_ignored():
+    m = Metrics(enabled=True)
+    entered = []
+
+    @contextmanager
+    def profile(stage):
+        entered.append(stage)
+        yield
+
+    m.add_profiler(lambda stage: profile(stage) if stage == "generate" else None)
+
+    def broken(record):
+        raise RuntimeError("listener down")
+
+    m.add_trace_listener(broken)
+    with m.trace("answer_question"):
+        with m.span("embed"):
+            pass
+        with m.span("generate"):
+            pass
+    assert entered == ["generate"]
+
+
+def test_disabled_metrics_record_nothing():
+    m = Metrics(enabled=False)
+    with m.trace("answer_question") as trace:
+        with m.span("embed"):
+            m.annotate(path="rag")
+        m.inc("requests_total")
+    assert trace is None
+    assert m.snapshot() == {"histograms": {}, "counters": {}, "gauges": {}}
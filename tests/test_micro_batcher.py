@@ -0,0 +1,101 @@
+# tests/test_micro_batcher.py
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from micro_batcher import MicroBatcher
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+
+def test_concurrent_submits_are_batched_in_order():
+    sizes = []
+
+    def double(items):
+        sizes.append(len(items))
+        time.sleep(0.01)
+        return [i * 2 for i in items]
+
+    async def main():
+        batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=20, executor=ThreadPoolExecutor(1))
+        results = await asyncio.gather(*[batcher.submit(i) for i in range(20)])
+        await batcher.stop()
+        return results, batcher.stats()
+
+    results, stats = run(main())
+    assert results == [i * 2 for i in range(20)]
+    assert max(sizes) <= 8
+    assert stats["items"] == 20 and stats["batches"] < 20
+
+
+def test_batch_error_fails_every_caller_and_batcher_keeps_serving():
+    calls = []
+
+    def flaky(items):
+        calls.append(list(items))
+        if len(calls) == 1:
+            raise RuntimeError("model crashed")
+        return [i + 1 for i in items]
+
+    async def main():
+        batcher = MicroBatcher(flaky, max_batch_size=4, max_wait_ms=20, executor=ThreadPoolExecutor(1))
+        first = await asyncio.gather(*[batcher.submit(i) for i in range(3)], return_exceptions=True)
+        second = await batcher.submit(10)
+        await batcher.stop()
+        return first, second
+
+    first, second = run(main())
+    assert all(isinstance(r, RuntimeError) for r in first)
+    assert second == 11
+
+
+def test_wrong_result_count_fails_callers_instead_of_hanging():
+    async def main():
+        batcher = MicroBatcher(lambda items: items[:1], max_batch_size=4, max_wait_ms=20)
+        results = await asyncio.gather(*[batcher.submit(i) for i in range(3)], return_exceptions=True)
+        await batcher.stop()
+        return results
+
+    results = run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_cancelled_callers_are_dropped_from_the_batch():
+    seen = []
+
+    def record(items):
+        seen.extend(items)
+        return items
+
+    async def main():
+        batcher = MicroBatcher(record, max_batch_size=4, max_wait_ms=20)
+        await batcher.start()
+        gone = asyncio.ensure_future(batcher.submit("gone"))
+        await asyncio.sleep(0)
+        gone.cancel()
+        result = await batcher.submit("kept")
+        await batcher.stop()
+        return result
+
+    assert run(main()) == "kept"
+    assert seen == ["kept"]
+
+
+def test_executor_failure_is_reported_to_the_caller():
+    executor = ThreadPoolExecutor(1)
+    executor.shutdown()
+
+    async def main():
+        batcher = MicroBatcher(lambda items: items, max_batch_size=2, max_wait_ms=5, executor=executor)
+        try:
+            return await batcher.submit(1)
+        finally:
+            await batcher.stop()
+
+    with pytest.raises(RuntimeError):
+        run(main())
@@ -0,0 +1,200 @@
+# tests/test_pipeline.py
+
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import rag_pipeline
+from category_router import CategoryRouter
+from embedding_service import EmbeddingService
+from faq_matcher import FaqMatcher
+from fakes import FakeGenerator, HashEmbedder, WordTokenizer
+from rag_pipeline import SupportRAGPipeline
+from retrievers import InMemoryRetriever
+from sparse_index import BM25Index
+
+
+class RecordingCache:
+    """Semantic cache that never hits and records what gets stored."""
+
+    def __init__(self):
+        self.stored = []
+
+    def lookup(self, vector, tone):
+        return None
+
+    def store(self, vector, tone, question, answer, docs):
+        self.stored.append(question)
+
+
+def make_pipeline(monkeypatch, generator, **kwargs) -> SupportRAGPipeline:
+    monkeypatch.setattr(rag_pipeline, "FAQ_FAST_PATH", False)
+    if generator is not None:
+        monkeypatch.setattr(rag_pipeline, "GeneratorModel", lambda *args, **kwargs: generator)
+    embedder = EmbeddingService("hash", model=HashEmbedder(), cache_size=0, batch_window_ms=0, disk_cache_path=None)
+    retriever = InMemoryRetriever()
+    vectors = embedder.encode(["Refunds reach your card in 5 days.", "Use the forgot password link."])
+    retriever.upsert([
+        {"id": f"{i}-0", "values": v, "metadata": {"question": q, "answer": a, "row_id": i, "chunk_id": 0}}
+        for i, (q, a, v) in enumerate(zip(
+            ["Refund status", "Reset password"],
+            ["Refunds reach your card in 5 days.", "Use the forgot password link."],
+            vectors,
+        ))
+    ])
+    kwargs = {"background_load": False, "warm_up": False, **kwargs}
+    pipeline = SupportRAGPipeline(retriever=retriever, cache=RecordingCache(), embedder=embedder, **kwargs)
+    pipeline.context_builder._tokenizer = WordTokenizer()
+    return pipeline
+
+
+@pytest.mark.parametrize("capped", [False, True])
+def test_time_capped_answers_are_not_cached(monkeypatch, capped):
+    pipeline = make_pipeline(monkeypatch, FakeGenerator(time_capped=capped))
+
+    answer, docs = pipeline.answer_question("where is my refund")
+    streamed, _ = pipeline.stream_answer("how do I reset my password")
+    assert "".join(streamed).strip()
+    batch = pipeline.answer_questions(["refund status please", "password reset link"])
+
+    assert answer and docs and len(batch) == 2
+    expected = [] if capped else [
+        "where is my refund", "how do I reset my password", "refund status please", "password reset link"
+    ]
+    assert pipeline.cache.stored == expected
+
+
+def test_answer_questions_generates_misses_in_one_batch(monkeypatch):
+    generator = FakeGenerator()
+    pipeline = make_pipeline(monkeypatch, generator)
+    cached = ("cached answer", [])
+    pipeline.cache.lookup = lambda vector, tone: cached if pipeline.cache.stored else None
+
+    results = pipeline.answer_questions(["when do refunds reach my card", "forgot password link"])
+    assert [answer for answer, _ in results] == ["answer 1", "answer 2"]
+    assert [docs[0]["question"] for _, docs in results] == ["Refund status", "Reset password"]
+    assert len(generator.batches) == 1 and len(generator.batches[0]) == 2
+    assert "when do refunds reach my card" in generator.batches[0][0]
+
+    # Cache hits are answered without generating
+    assert pipeline.answer_questions(["when do refunds reach my card"]) == [cached]
+    assert pipeline.answer_questions([]) == []
+    assert len(generator.batches) == 1
+
+
+def test_importing_the_pipeline_loads_no_model_libraries():
+    heavy = ["torch", "transformers", "sentence_transformers", "pinecone"]
+    code = f"import sys, rag_pipeline; print([m for m in {heavy!r} if m in sys.modules])"
+    repo = os.path.dirname(os.path.abspath(rag_pipeline.__file__))
+    out = subprocess.run([sys.executable, "-c", code], cwd=repo, capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
+
+
+def test_generator_loads_in_the_background(monkeypatch):
+    release = threading.Event()
+    generator = FakeGenerator()
+
+    def slow_generator(*args, **kwargs):
+        release.wait(5)
+        return generator
+
+    monkeypatch.setattr(rag_pipeline, "GeneratorModel", slow_generator)
+    pipeline = make_pipeline(monkeypatch, None, background_load=True, warm_up=True)
+    status = pipeline.status()
+    assert status["retrieval_ready"] and not status["generator_ready"]
+    assert "retrieval_ready_s" in status["startup_timings"]
+
+    release.set()
+    assert pipeline.wait_until_ready(5)
+    assert generator.calls == 1  # the warm-up generation
+    assert {"generator_s", "warm_up_s", "ready_s"} <= set(pipeline.status()["startup_timings"])
+    assert pipeline.answer_question("where is my refund")[0] == "answer 2"
+
+
+def test_generator_load_failure_is_reported(monkeypatch):
+    def broken_generator(*args, **kwargs):
+        raise OSError("model not found")
+
+    monkeypatch.setattr(rag_pipeline, "GeneratorModel", broken_generator)
+    pipeline = make_pipeline(monkeypatch, None, background_load=True)
+    assert not pipeline.wait_until_ready(5)
+    assert "model not found" in pipeline.status()["generator_error"]
+    with pytest.raises(RuntimeError, match="failed to load"):
+        pipeline.generator
+
+
+def test_hybrid_retrieval_reloads_the_bm25_index_after_reingestion(monkeypatch, tmp_path):
+    pipeline = make_pipeline(monkeypatch, FakeGenerator())
+    ingested = BM25Index(tmp_path)
+    ingested.add_documents([
+        {"id": "0-0", "question": "Refund status", "answer": "Refunds reach your card in 5 days.", "row_id": 0,
+         "chunk_id": 0},
+    ])
+    ingested.flush()
+    pipeline.sparse_index = BM25Index(tmp_path)
+    monkeypatch.setattr(rag_pipeline, "CHUNK_STORE_REFRESH_S", 1e-9)
+
+    docs = pipeline.retrieve_batch(["refund card"], top_k=2)[0]
+    dense = pipeline.retriever.query(pipeline.embedder.encode(["refund card"])[0], top_k=1)[0]
+    assert docs[0]["row_id"] == 0 and docs[0]["rrf_score"] == 2 / 61
+    assert docs[0]["score"] == dense["score"]  # cosine, not the fused score
+
+    ingested.add_documents([{"id": "7-0", "question": "Order ORD777", "answer": "Shipped.", "row_id": 7,
+                             "chunk_id": 0}])
+    ingested.flush()
+    docs = pipeline.retrieve_batch(["ORD777"], top_k=3)[0]
+    assert pipeline.sparse_index.num_docs == 2
+    hit = next(d for d in docs if d["row_id"] == 7)
+    assert "score" not in hit and hit["bm25_score"] > 0  # keyword-only hit
+
+
+def test_curated_faqs_are_answered_without_generation(monkeypatch, tmp_path):
+    generator = FakeGenerator()
+    pipeline = make_pipeline(monkeypatch, generator)
+    faqs_file = tmp_path / "faqs.json"
+    faqs_file.write_text(json.dumps([
+        {"id": 9, "category": "Billing", "question": "How do I get an invoice?", "answer": "Invoices are emailed."},
+    ]), encoding="utf-8")
+    pipeline.faq_matcher = FaqMatcher(pipeline.embedder, faqs_file=faqs_file, embeddings_file=None)
+
+    answer, docs = pipeline.answer_question("how do I get an invoice?", tone="Formal")
+    streamed, stream_docs = pipeline.stream_answer("How do I get an invoice?")
+    batch = pipeline.answer_questions(["how do i get an invoice?", "where is my refund"])
+
+    assert "Invoices are emailed." in answer and "Invoices are emailed." in "".join(streamed)
+    assert docs[0]["row_id"] == stream_docs[0]["row_id"] == batch[0][1][0]["row_id"] == "faq-9"
+    assert batch[1][0] == "answer 1"  # only the non-FAQ question reached the generator
+    assert generator.calls == 1 and pipeline.cache.stored == ["where is my refund"]
+
+
+def test_standalone_questions_in_a_session_use_the_faq_and_cache(monkeypatch, tmp_path):
+    generator = FakeGenerator()
+    pipeline = make_pipeline(monkeypatch, generator)
+    faqs_file = tmp_path / "faqs.json"
+    faqs_file.write_text(json.dumps([
+        {"id": 9, "category": "Billing", "question": "refund invoice", "answer": "Invoices are emailed."},
+    ]), encoding="utf-8")
+    pipeline.faq_matcher = FaqMatcher(pipeline.embedder, faqs_file=faqs_file, embeddings_file=None)
+
+    assert pipeline.answer_question("where is my refund", session_id="s")[0] == "answer 1"
+    pipeline.cache.lookup = lambda vector, tone: ("cached answer", [])
+    assert pipeline.answer_question("refund status", session_id="s")[0] == "cached answer"
+    streamed, _ = pipeline.stream_answer("refund invoice", session_id="s")
+    assert "Invoices are emailed." in "".join(streamed)
+
+    # A follow-up depends on the conversation, so it is generated
+    assert pipeline.answer_question("and what about that refund", session_id="s")[0] == "answer 2"
+    assert generator.calls == 2
+
+
+def test_questions_are_routed_unless_a_category_is_given(monkeypatch):
+    pipeline = make_pipeline(monkeypatch, FakeGenerator())
+    samples = {"Billing": ["where is my refund", "refund status"], "Account & Login": ["reset my password"]}
+    pipeline.router = CategoryRouter.from_samples(pipeline.embedder, samples, model_name="hash")
+
+    q_vecs = pipeline.embedder.encode(["refund status", "refund status", "hello"])
+    assert pipeline._route(q_vecs, ["Account & Login", None, None]) == ["Account & Login", "Billing", None]
@@ -0,0 +1,65 @@
+# tests/test_reranker.py
+
+import time
+
+import numpy as np
+import pytest
+
+import reranker
+from reranker import CrossEncoderReranker
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-np.asarray(x, dtype=np.float32)))
+
+
+class SigmoidCrossEncoder:
+    """Like an ms-marco CrossEncoder: logit = shared words - 2, Sigmoid applied unless overridden."""
+
+    def __init__(self, delay_s=0.0):
+        self.delay_s = delay_s
+
+    def _logits(self, pairs):
+        time.sleep(self.delay_s)
+        return np.array([len(set(q.split()) & set(d.split())) - 2.0 for q, d in pairs], dtype=np.float32)
+
+    def predict(self, sentences, batch_size=32, activation_fct=None):
+        logits = self._logits(sentences)
+        return activation_fct(logits) if activation_fct is not None else sigmoid(logits)
+
+
+class RenamedCrossEncoder(SigmoidCrossEncoder):
+    """sentence-transformers 4 calls the argument activation_fn."""
+
+    def predict(self, sentences, batch_size=32, activation_fn=None):
+        logits = self._logits(sentences)
+        return activation_fn(logits) if activation_fn is not None else sigmoid(logits)
+
+
+@pytest.fixture(autouse=True)
+def identity_activation(monkeypatch):
+    monkeypatch.setattr(reranker, "_identity_activation", lambda: (lambda logits: logits))
+
+
+DOCS = [
+    {"question": "Reset password", "answer": "Use the forgot password link."},
+    {"question": "Refund status", "answer": "refund card five days"},
+]
+
+
+@pytest.mark.parametrize("model", [SigmoidCrossEncoder(), RenamedCrossEncoder()], ids=["activation_fct", "activation_fn"])
+def test_scores_are_squashed_once(model):
+    ranked = CrossEncoderReranker(model=model).rerank("refund card days", DOCS)
+    assert ranked[0]["question"] == "Refund status"
+    assert np.isclose(ranked[0]["rerank_score"], sigmoid(3 - 2.0))  # not sigmoid(sigmoid(1))
+    assert np.isclose(ranked[1]["rerank_score"], sigmoid(-2.0))
+
+
+def test_candidates_past_the_budget_keep_their_retrieval_order():
+    model = CrossEncoderReranker(model=SigmoidCrossEncoder(delay_s=0.02), batch_size=1, budget_ms=1)
+    docs = [{"answer": f"doc {i}"} for i in range(3)] + [{"answer": "refund card days"}]
+    ranked = model.rerank("refund card days", docs)
+    assert ranked[0]["answer"] == "doc 0" and ranked[0]["rerank_score"] is not None
+    assert [d["rerank_score"] for d in ranked[1:]] == [None] * 3
+    assert [d["answer"] for d in ranked[1:]] == ["doc 1", "doc 2", "refund card days"]
+    assert model.budget_exceeded == 1
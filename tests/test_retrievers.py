@@ -0,0 +1,143 @@
+# tests/test_retrievers.py
+
+from functools import partial
+
+import numpy as np
+import pytest
+
+from fakes import HashEmbedder
+from retrievers import (
+    FaissRetriever,
+    InMemoryRetriever,
+    PineconeRetriever,
+    embedding_fingerprint,
+    get_retriever,
+    verify_fingerprint,
+)
+from vector_client import FakeVectorIndex
+
+TEXTS = {
+    "1-0": ("Refunds reach your card in 5 days.", "Billing"),
+    "2-0": ("Use the forgot password link to reset it.", "Account & Login"),
+    "3-0": ("Track your parcel from the Orders page.", "Orders & Delivery"),
+    "4-0": ("Refunds for cancelled orders are automatic.", "Billing"),
+}
+
+
+def records(embedder, ids=TEXTS):
+    vectors = embedder.encode([TEXTS[i][0] for i in ids])
+    return [
+        {
+            "id": i,
+            "values": v,
+            "metadata": {"question": "", "answer": TEXTS[i][0], "row_id": i.split("-")[0], "chunk_id": 0,
+                         "category": TEXTS[i][1]},
+        }
+        for i, v in zip(ids, vectors)
+    ]
+
+
+def make_faiss(tmp_path, index_type="flat", **kwargs):
+    return FaissRetriever(tmp_path / "index.bin", tmp_path / "metadata.json", index_type=index_type, **kwargs)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_faiss_round_trip(tmp_path, index_type):
+    embedder = HashEmbedder()
+    store = make_faiss(tmp_path, index_type)
+    store.upsert(records(embedder))
+    store.flush()
+
+    reloaded = make_faiss(tmp_path, index_type)
+    top = reloaded.query(embedder.encode(["reset password link"])[0], top_k=1)
+    assert top[0]["row_id"] == "2" and top[0]["category"] == "Account & Login"
+
+
+def test_faiss_delete_and_replace_merge_with_existing_index(tmp_path):
+    embedder = HashEmbedder()
+    store = make_faiss(tmp_path)
+    store.upsert(records(embedder))
+    store.flush()
+
+    store = make_faiss(tmp_path, mmap=False)
+    store.delete(["3-0"])
+    store.upsert([dict(records(embedder, ["1-0"])[0], metadata={"answer": "updated", "row_id": "1", "chunk_id": 0})])
+    store.flush()
+
+    reloaded = make_faiss(tmp_path)
+    assert reloaded.index.ntotal == 3
+    assert {m["id"] for m in reloaded.metadata} == {"1-0", "2-0", "4-0"}
+    assert next(m for m in reloaded.metadata if m["id"] == "1-0")["answer"] == "updated"
+
+
+def make_pinecone(tmp_path=None, partitioned=False, index=None):
+    return PineconeRetriever(index=index or FakeVectorIndex(dimension=HashEmbedder.dim), partitioned=partitioned)
+
+
+@pytest.mark.parametrize(
+    "make_store",
+    [InMemoryRetriever, make_faiss, make_pinecone, partial(make_pinecone, partitioned=True)],
+    ids=["memory", "faiss", "pinecone", "pinecone-partitioned"],
+)
+def test_category_queries_only_return_that_category(tmp_path, make_store):
+    embedder = HashEmbedder()
+    store = make_store() if make_store is InMemoryRetriever else make_store(tmp_path)
+    store.upsert(records(embedder))
+    store.flush()
+
+    vector = embedder.encode(["refunds"])[0]
+    docs = store.query(vector, top_k=4, category="Billing")
+    assert {d["row_id"] for d in docs} == {"1", "4"}
+    assert store.query(vector, top_k=4, category="Unknown") == []
+    batch = store.query_batch([vector, vector], top_k=1, categories=[None, "Orders & Delivery"])
+    assert batch[0][0]["category"] == "Billing" and batch[1][0]["row_id"] == "3"
+
+
+def test_scores_are_cosine_similarities():
+    embedder = HashEmbedder()
+    store = InMemoryRetriever()
+    store.upsert(records(embedder))
+    vector = embedder.encode([TEXTS["3-0"][0]])[0]
+    assert np.isclose(store.query(vector, top_k=1)[0]["score"], 1.0)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match="Unknown vector backend"):
+        get_retriever("milvus")
+
+
+def test_fingerprint_guard(tmp_path):
+    store = make_faiss(tmp_path)
+    verify_fingerprint(store, embedding_fingerprint("mini", 32))  # not ingested yet: only a warning
+    store.write_fingerprint(embedding_fingerprint("mini", 32))
+
+    store = make_faiss(tmp_path)  # the fingerprint is persisted next to the index
+    verify_fingerprint(store, embedding_fingerprint("mini", 32))
+    with pytest.raises(ValueError, match="dimension mismatch"):
+        verify_fingerprint(store, embedding_fingerprint("mini", 64))
+    with pytest.raises(ValueError, match="model mismatch"):
+        verify_fingerprint(store, embedding_fingerprint("other", 32))
+
+
+def test_index_without_a_model_fingerprint_only_checks_the_dimension():
+    store = InMemoryRetriever()
+    store.write_fingerprint({"embedding_model": None, "dimension": 32})
+    verify_fingerprint(store, embedding_fingerprint("mini", 32))
+    with pytest.raises(ValueError, match="dimension mismatch"):
+        verify_fingerprint(store, embedding_fingerprint("mini", 16))
+
+
+def test_partitioned_pinecone_writes_each_category_to_its_namespace():
+    index = FakeVectorIndex(dimension=HashEmbedder.dim)
+    store = make_pinecone(partitioned=True, index=index)
+    store.upsert(records(HashEmbedder()))
+    base = store.namespace
+    assert store.namespace_for("Billing") == f"{base}__billing"
+    assert store.namespace_for(None) == make_pinecone(index=index).namespace_for("Billing") == base
+    assert set(index._namespaces[f"{base}__billing"]) == {"1-0", "4-0"}
+    assert set(index._namespaces[f"{base}__orders-delivery"]) == {"3-0"}
+
+    store.delete(["1-0", "3-0"], namespace=f"{base}__billing")  # only where it is told
+    assert set(index._namespaces[f"{base}__billing"]) == {"4-0"} and index._namespaces[f"{base}__orders-delivery"]
+    store.delete(["3-0"])  # anywhere
+    assert not index._namespaces[f"{base}__orders-delivery"]
@@ -0,0 +1,102 @@
+# tests/test_server.py
+
+import asyncio
+import threading
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import server
+from config import SERVER_MAX_TOP_K
+
+
+class FakePipeline:
+    def __init__(self):
+        self.top_ks = []
+
+    def retrieve_batch(self, questions, top_k=5, categories=None):
+        self.top_ks.append(top_k)
+        return [[{"question": q, "answer": str(i), "score": 1.0} for i in range(top_k)] for q in questions]
+
+    def answer_questions(self, questions, tone="Friendly", categories=None):
+        return [(f"answer to {q}", []) for q in questions]
+
+    def status(self):
+        return {"retrieval_ready": True}
+
+
+def post(path, payload):
+    """(status, json or text) of one request against an app around FakePipeline."""
+
+    async def main():
+        client = TestClient(TestServer(server.create_app(FakePipeline(), max_wait_ms=1)))
+        await client.start_server()
+        try:
+            resp = await client.post(path, json=payload)
+            body = await resp.json() if resp.content_type == "application/json" else await resp.text()
+            return resp.status, body
+        finally:
+            await client.close()
+
+    return asyncio.run(main())
+
+
+def test_retrieve_returns_top_k_docs():
+    status, body = post("/retrieve", {"question": "refund", "top_k": 3})
+    assert status == 200
+    assert len(body["docs"]) == 3
+
+
+@pytest.mark.parametrize("top_k", ["abc", -1, 0, 2.5, True, None, [3]])
+def test_retrieve_rejects_invalid_top_k(top_k):
+    status, body = post("/retrieve", {"question": "refund", "top_k": top_k})
+    assert status == 400
+    assert "top_k" in body
+
+
+def test_retrieve_clamps_large_top_k():
+    status, body = post("/retrieve", {"question": "refund", "top_k": SERVER_MAX_TOP_K * 10})
+    assert status == 200
+    assert len(body["docs"]) == SERVER_MAX_TOP_K
+
+
+def test_answer_requires_a_question():
+    status, _ = post("/answer", {"question": "  "})
+    assert status == 400
+
+
+@pytest.mark.parametrize("payload", [[], "refund", 3])
+def test_non_object_bodies_are_rejected(payload):
+    status, body = post("/answer", payload)
+    assert status == 400
+    assert "JSON object" in body
+
+
+class SlowAnswerPipeline(FakePipeline):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def answer_questions(self, questions, tone="Friendly", categories=None):
+        self.release.wait(5)
+        return super().answer_questions(questions, tone, categories)
+
+
+def test_retrieval_does_not_queue_behind_generation():
+    pipeline = SlowAnswerPipeline()
+
+    async def main():
+        client = TestClient(TestServer(server.create_app(pipeline, max_wait_ms=1)))
+        await client.start_server()
+        try:
+            answering = asyncio.ensure_future(client.post("/answer", json={"question": "refund"}))
+            await asyncio.sleep(0.05)  # the answer batch is now running on the model thread
+            resp = await asyncio.wait_for(client.post("/retrieve", json={"question": "refund", "top_k": 1}), 2)
+            assert resp.status == 200 and not answering.done()
+            pipeline.release.set()
+            assert (await (await answering).json())["answer"] == "answer to refund"
+        finally:
+            pipeline.release.set()
+            await client.close()
+
+    asyncio.run(main())
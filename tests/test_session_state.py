@@ -0,0 +1,68 @@
+# tests/test_session_state.py
+
+import pytest
+
+from fakes import HashEmbedder
+from session_state import SessionStore, is_follow_up
+
+EMBEDDER = HashEmbedder()
+DOCS = [{"row_id": 1, "chunk_id": 0, "answer": "Refunds reach your card in 5 days."}]
+
+
+def vec(text):
+    return EMBEDDER.encode([text])[0]
+
+
+def make_store(**kwargs):
+    kwargs = {"reuse_threshold": 0.8, "followup_threshold": 0.2, "max_sessions": 10, "idle_seconds": 0, **kwargs}
+    return SessionStore(**kwargs)
+
+
+def start(store, question, category=None):
+    """A session whose first turn retrieved DOCS for `question`."""
+    turn = store.plan_turn(None, question, vec(question), category)
+    store.advance("s", None, turn, question, vec(question), DOCS, category)
+    return store.get("s")
+
+
+@pytest.mark.parametrize(
+    "question, expected",
+    [
+        ("what about that?", True),
+        ("and for gift cards?", True),
+        ("... and the fee?", True),
+        ("reset password", False),
+        ("refund status", False),
+        ("How do I reset my password?", False),
+    ],
+)
+def test_is_follow_up(question, expected):
+    assert is_follow_up(question) is expected
+
+
+def test_plan_turn_modes():
+    store = make_store()
+    assert store.plan_turn(None, "where is my refund", vec("where is my refund"))["mode"] == "new"
+
+    state = start(store, "where is my refund")
+    reuse = store.plan_turn(state, "where is my refund now", vec("where is my refund now"))
+    assert reuse["mode"] == "reuse" and reuse["candidates"] == DOCS
+
+    followup = store.plan_turn(state, "and what about that card", vec("and what about that card"))
+    assert followup["mode"] == "followup" and followup["previous"] == "where is my refund"
+    assert followup["query"] == "where is my refund and what about that card"
+
+    shift = store.plan_turn(state, "change shipping address", vec("change shipping address"))
+    assert shift["mode"] == "new" and shift["previous"] is None
+
+
+def test_candidates_are_only_reused_within_their_category():
+    store = make_store()
+    state = start(store, "where is my refund", category="Billing")
+    assert state["category"] == "Billing"
+
+    assert store.plan_turn(state, "where is my refund now", vec("where is my refund now"), "Billing")["mode"] == "reuse"
+    other = store.plan_turn(state, "where is my refund now", vec("where is my refund now"), "Shipping")
+    assert other["mode"] == "new" and other["candidates"] == []
+    followup = store.plan_turn(state, "and what about that card", vec("and what about that card"), "Shipping")
+    assert followup["mode"] == "followup" and followup["candidates"] == []
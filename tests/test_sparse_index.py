@@ -0,0 +1,117 @@
+# tests/test_sparse_index.py
+
+import json
+import os
+
+import numpy as np
+
+from sparse_index import BM25Index, reciprocal_rank_fusion
+
+DOCS = [
+    {"id": "1-0", "question": "Refund status", "answer": "Refunds reach your card in 5 days.",
+     "row_id": 1, "chunk_id": 0, "category": "Billing"},
+    {"id": "2-0", "question": "Reset password", "answer": "Use the forgot password link.",
+     "row_id": 2, "chunk_id": 0, "category": "Account & Login"},
+    {"id": "faq-3-0", "question": "Track order", "answer": "Order ORD12345 ships with a tracking number.",
+     "row_id": "faq-3", "chunk_id": 0, "category": "Orders & Delivery"},
+]
+
+
+def build(path=None, docs=DOCS) -> BM25Index:
+    index = BM25Index(path)
+    index.add_documents(docs)
+    index.flush()
+    return index
+
+
+def test_search_ranks_matching_docs_and_filters_by_category():
+    index = build()
+    assert index.search("password reset")[0]["row_id"] == 2
+    assert index.search("ORD12345")[0]["row_id"] == "faq-3"
+    assert index.search("refund password", category="Billing")[0]["row_id"] == 1
+    assert index.search("password", category="Billing") == []
+    assert index.search("password", category="Unknown") == []
+
+
+def test_reload_maps_segments_without_json(tmp_path):
+    build(tmp_path)
+    seg_dir = tmp_path / "seg-00000"
+    assert not (seg_dir / "docs.json").exists() and not (seg_dir / "terms.json").exists()
+
+    index = BM25Index(tmp_path)
+    seg = index._segments[0]
+    assert isinstance(seg.terms.offsets, np.memmap) and isinstance(seg.docs.blob, memoryview)
+    assert index._live is None  # read-only use never builds the id map
+    assert index.num_docs == 3
+    hit = index.search("tracking", category="Orders & Delivery")[0]
+    assert (hit["row_id"], hit["chunk_id"], hit["category"]) == ("faq-3", 0, "Orders & Delivery")
+
+
+def test_document_frequency_ignores_deleted_and_shadowed_docs(tmp_path):
+    index = build(tmp_path)
+    assert index._df("password") == 1
+
+    index.add_documents([dict(DOCS[1], answer="Contact support to unlock the account.")])
+    index.flush()
+    assert index.num_docs == 3
+    assert index._df("password") == 1  # only in the (unchanged) question now
+    assert index._df("forgot") == 0
+    index.delete(["2-0"])
+    assert index._df("password") == 0 and index.num_docs == 2
+    assert index.search("password") == []
+
+    index.flush()  # persists the tombstones
+    reloaded = BM25Index(tmp_path)
+    assert reloaded._df("password") == 0 and reloaded.num_docs == 2
+
+
+def test_compact_keeps_only_live_docs(tmp_path):
+    index = build(tmp_path)
+    index.add_documents([dict(DOCS[0], answer="Refunds take 10 days now.")])
+    index.delete(["2-0"])
+    index.flush()
+    index.compact()
+
+    reloaded = BM25Index(tmp_path)
+    assert reloaded.num_segments == 1 and reloaded.num_docs == 2
+    assert "10 days" in reloaded.search("refunds")[0]["answer"]
+    assert sorted(os.listdir(tmp_path)) == ["manifest.json", "seg-00002"]
+
+
+def test_loads_segments_in_the_json_format(tmp_path):
+    seg_dir = tmp_path / "seg-00000"
+    seg_dir.mkdir()
+    (seg_dir / "docs.json").write_text(json.dumps(DOCS), encoding="utf-8")
+    (tmp_path / "manifest.json").write_text(
+        json.dumps({"next_segment": 1, "segments": ["seg-00000"], "deleted": {"seg-00000": [0]}}),
+        encoding="utf-8",
+    )
+    index = BM25Index(tmp_path)
+    assert index.num_docs == 2
+    assert index.search("refund") == []
+    assert index.search("password")[0]["row_id"] == 2
+
+
+def test_reciprocal_rank_fusion_merges_on_row_and_chunk():
+    a = [{"row_id": 1, "chunk_id": 0}, {"row_id": 2, "chunk_id": 0}]
+    b = [{"row_id": 2, "chunk_id": 0}, {"row_id": 3, "chunk_id": 0}]
+    fused = reciprocal_rank_fusion([a, b], k=60, top_k=3)
+    assert [d["row_id"] for d in fused] == [2, 1, 3]
+
+
+def test_fusion_keeps_the_dense_score():
+    dense = [{"row_id": 1, "chunk_id": 0, "score": 0.8}]
+    fused = reciprocal_rank_fusion([dense, build().search("refund card")], k=60, top_k=3)
+    assert fused[0]["score"] == 0.8 and fused[0]["rrf_score"] == 2 / 61
+    assert "bm25_score" not in fused[0]  # the dense copy is kept
+
+
+def test_changed_on_disk(tmp_path):
+    index = build(tmp_path)
+    reader = BM25Index(tmp_path)
+    assert not index.changed_on_disk() and not reader.changed_on_disk()
+
+    index.delete(["2-0"])
+    index.flush()
+    assert reader.changed_on_disk() and not index.changed_on_disk()
+    assert not BM25Index().changed_on_disk()
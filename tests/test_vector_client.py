@@ -0,0 +1,88 @@
+# tests/test_vector_client.py
+
+import time
+
+import pytest
+
+import vector_client
+from vector_client import FakeVectorError, FakeVectorIndex, VectorClient, VectorStoreTimeout, is_retryable
+
+
+class ScriptedIndex:
+    """Raises the given errors on successive queries, then answers."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def query(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.mark.parametrize(
+    "exc, retryable",
+    [
+        (FakeVectorError(503), True),
+        (FakeVectorError(429), True),
+        (FakeVectorError(400), False),
+        (ConnectionResetError(), True),
+        (ValueError("bad dimension"), False),
+    ],
+)
+def test_is_retryable(exc, retryable):
+    assert is_retryable(exc) is retryable
+
+
+def test_transient_errors_are_retried():
+    index = ScriptedIndex(FakeVectorError(503), FakeVectorError(429))
+    client = VectorClient(index, max_retries=3, backoff_s=0.001)
+    assert client.query(vector=[1.0]) == "ok"
+    assert index.calls == 3
+    assert client.stats()["retries"] == 2 and client.stats()["errors"] == 0
+
+
+def test_retries_are_bounded():
+    index = ScriptedIndex(*[FakeVectorError(503)] * 5)
+    client = VectorClient(index, max_retries=2, backoff_s=0.001)
+    with pytest.raises(FakeVectorError):
+        client.query(vector=[1.0])
+    assert index.calls == 3
+    assert client.stats()["errors"] == 1
+
+
+def test_client_errors_are_not_retried():
+    index = ScriptedIndex(FakeVectorError(400))
+    client = VectorClient(index, max_retries=3, backoff_s=0.001)
+    with pytest.raises(FakeVectorError):
+        client.query(vector=[1.0])
+    assert index.calls == 1 and client.stats()["retries"] == 0
+
+
+def test_hung_call_times_out_at_its_deadline():
+    client = VectorClient(FakeVectorIndex(4, hang_rate=1.0, hang_s=0.5), query_timeout_s=0.1)
+    started = time.perf_counter()
+    with pytest.raises(VectorStoreTimeout):
+        client.query(vector=[1, 0, 0, 0])
+    assert time.perf_counter() - started < 0.4
+    assert client.stats()["timeouts"] == 1
+
+
+def test_no_retry_past_the_deadline(monkeypatch):
+    monkeypatch.setattr(vector_client.random, "uniform", lambda low, high: high)  # longest backoff
+    index = ScriptedIndex(FakeVectorError(503))
+    client = VectorClient(index, query_timeout_s=0.05, max_retries=3, backoff_s=1.0)
+    with pytest.raises(VectorStoreTimeout):
+        client.query(vector=[1.0])
+    assert index.calls == 1
+
+
+def test_concurrency_is_bounded():
+    index = FakeVectorIndex(4, latency_ms=10)
+    client = VectorClient(index, max_concurrency=3)
+    client.upsert(vectors=[{"id": "a", "values": [1, 0, 0, 0]}])
+    futures = [client.query_async(vector=[1, 0, 0, 0], top_k=1) for _ in range(30)]
+    assert all(f.result().matches[0].id == "a" for f in futures)
+    assert 1 < index.max_in_flight <= 3
@@ -0,0 +1,476 @@
+# vector_client.py
+
+import json
+import time
+import random
+import argparse
+import threading
+from types import SimpleNamespace
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import List, Dict, Optional, Callable
+
+import numpy as np
+
+from config import (
+    VECTOR_MAX_CONCURRENCY,
+    VECTOR_QUERY_TIMEOUT_S,
+    VECTOR_WRITE_TIMEOUT_S,
+    VECTOR_MAX_RETRIES,
+    VECTOR_BACKOFF_S,
+    PINECONE_READY_TIMEOUT_S,
+)
+from metrics import metrics
+
+# Rate limiting, timeouts and server-side failures are worth another attempt;
+# other 4xx (bad dimension, bad filter, auth) are not.
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+MAX_BACKOFF_S = 2.0
+
+
+class VectorStoreTimeout(TimeoutError):
+    """A vector-store call did not finish (including retries) within its deadline."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    status = getattr(exc, "status", None) or getattr(exc, "status_code", None)
+    if status is not None:
+        try:
+            return int(status) in RETRYABLE_STATUS
+        except (TypeError, ValueError):
+            return False
+    # Connection resets / read timeouts surface as builtin or urllib3 errors
+    return isinstance(exc, (ConnectionError, TimeoutError)) or type(exc).__module__.startswith("urllib3")
+
+
+# ------------------ CLIENT ------------------
+
+class VectorClient:
+    """
+    Wraps a Pinecone `Index` (or FakeVectorIndex) with the same methods
+    (`query`, `upsert`, `delete`, `fetch`, `describe_index_stats`), adding:
+
+    - bounded concurrency: at most `max_concurrency` calls in flight over the
+      index's pooled connection; callers beyond that wait for a slot;
+    - a deadline per call (queries and writes separately) that covers waiting
+      for a slot, every attempt and the backoff between attempts;
+    - retries of transient errors with full-jitter exponential backoff;
+    - `query_async` / `upsert_async` / `submit`, returning futures.
+
+    A call that misses its deadline raises VectorStoreTimeout; the attempt
+    itself cannot be interrupted, so it keeps its slot until it returns.
+    """
+
+    def __init__(
+        self,
+        index,
+        max_concurrency: int = VECTOR_MAX_CONCURRENCY,
+        query_timeout_s: float = VECTOR_QUERY_TIMEOUT_S,
+        write_timeout_s: float = VECTOR_WRITE_TIMEOUT_S,
+        max_retries: int = VECTOR_MAX_RETRIES,
+        backoff_s: float = VECTOR_BACKOFF_S,
+    ):
+        if max_concurrency < 1:
+            raise ValueError(f"VECTOR_MAX_CONCURRENCY must be at least 1 (got {max_concurrency}).")
+        self.index = index
+        self.max_concurrency = max_concurrency
+        self.query_timeout_s = query_timeout_s
+        self.write_timeout_s = write_timeout_s
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Attempts run on _io (never more than the slots); submit() callers on _callers
+        self._io = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="vector-io")
+        self._callers = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="vector-call")
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.in_flight = 0
+
+    # --------- INDEX METHODS ---------
+    def query(self, **kwargs):
+        return self.call("query", self.query_timeout_s, **kwargs)
+
+    def fetch(self, **kwargs):
+        return self.call("fetch", self.query_timeout_s, **kwargs)
+
+    def describe_index_stats(self, **kwargs):
+        return self.call("describe_index_stats", self.query_timeout_s, **kwargs)
+
+    def upsert(self, **kwargs):
+        return self.call("upsert", self.write_timeout_s, **kwargs)
+
+    def delete(self, **kwargs):
+        return self.call("delete", self.write_timeout_s, **kwargs)
+
+    # --------- ASYNC ---------
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Run `fn` (typically something that calls this client) on the client's caller threads."""
+        return self._callers.submit(fn, *args, **kwargs)
+
+    def query_async(self, **kwargs) -> Future:
+        return self.submit(self.query, **kwargs)
+
+    def upsert_async(self, **kwargs) -> Future:
+        return self.submit(self.upsert, **kwargs)
+
+    # --------- CALL ---------
+    def call(self, op: str, timeout_s: Optional[float], **kwargs):
+        """`index.<op>(**kwargs)` with a slot, a deadline and retries."""
+        fn = getattr(self.index, op)
+        deadline = time.monotonic() + timeout_s if timeout_s else None
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    result = self._attempt(fn, kwargs, deadline)
+                    metrics.inc("vector_calls_total", op=op, outcome="ok")
+                    return result
+                except VectorStoreTimeout:
+                    self._count("timeouts")
+                    metrics.inc("vector_calls_total", op=op, outcome="timeout")
+                    raise
+                except Exception as e:
+                    delay = random.uniform(0, min(MAX_BACKOFF_S, self.backoff_s * 2 ** attempt))
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        self._count("errors")
+                        metrics.inc("vector_calls_total", op=op, outcome="error")
+                        raise
+                    if deadline is not None and time.monotonic() + delay >= deadline:
+                        self._count("timeouts")
+                        metrics.inc("vector_calls_total", op=op, outcome="timeout")
+                        raise VectorStoreTimeout(
+                            f"Vector store {op} failed and its deadline left no time to retry: {e}"
+                        ) from e
+                    attempt += 1
+                    self._count("retries")
+                    metrics.inc("vector_retries_total", op=op)
+                    time.sleep(delay)
+        finally:
+            self._count("calls")
+            metrics.observe("vector_call_duration_seconds", time.perf_counter() - start, op=op)
+
+    def _attempt(self, fn: Callable, kwargs: Dict, deadline: Optional[float]):
+        if not self._slots.acquire(timeout=self._remaining(deadline)):
+            raise VectorStoreTimeout("Timed out waiting for a vector store connection slot.")
+        try:
+            self._count("in_flight")
+            fut = self._io.submit(fn, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        fut.add_done_callback(lambda _: self._release())  # the slot is held until the attempt returns
+        try:
+            return fut.result(timeout=self._remaining(deadline))
+        except FutureTimeout:
+            raise VectorStoreTimeout("Vector store call exceeded its deadline.") from None
+
+    @staticmethod
+    def _remaining(deadline: Optional[float]) -> Optional[float]:
+        if deadline is None:
+            return None
+        return max(deadline - time.monotonic(), 0.0)
+
+    def _release(self) -> None:
+        self._count("in_flight", -1)
+        self._slots.release()
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+        }
+
+    def close(self) -> None:
+        self._callers.shutdown(wait=True)
+        self._io.shutdown(wait=True)
+
+
+def wait_until_ready(pc, name: str, timeout_s: float = PINECONE_READY_TIMEOUT_S) -> None:
+    """Poll `describe_index` (backing off from 0.5s to 5s) until the index reports ready."""
+    deadline = time.monotonic() + timeout_s
+    delay = 0.5
+    while True:
+        status = pc.describe_index(name).status
+        ready = status.get("ready") if isinstance(status, dict) else getattr(status, "ready", False)
+        if ready:
+            return
+        if time.monotonic() + delay > deadline:
+            raise VectorStoreTimeout(f"Pinecone index '{name}' was not ready after {timeout_s:.0f}s.")
+        time.sleep(delay)
+        delay = min(delay * 2, 5.0)
+
+
+# ------------------ FAKE INDEX ------------------
+
+class FakeVectorError(Exception):
+    """Injected failure; carries an HTTP status like Pinecone's API exceptions."""
+
+    def __init__(self, status: int = 503):
+        super().__init__(f"Injected vector store failure ({status})")
+        self.status = status
+
+
+def _matches_filter(metadata: Dict, flt: Dict) -> bool:
+    """Subset of Pinecone's metadata filters: {"field": value | {"$eq"|"$ne"|"$in"|"$nin": ...}}."""
+    for field, cond in flt.items():
+        value = metadata.get(field)
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, arg in cond.items():
+            if op == "$eq" and value != arg or op == "$ne" and value == arg:
+                return False
+            if op == "$in" and value not in arg or op == "$nin" and value in arg:
+                return False
+            if op not in ("$eq", "$ne", "$in", "$nin"):
+                raise ValueError(f"Unsupported filter operator in FakeVectorIndex: {op}")
+    return True
+
+
+class FakeVectorIndex:
+    """
+    In-memory stand-in for a Pinecone `Index` (cosine metric), returning
+    the same response shapes (`.matches`, `.vectors`, `.dimension`), for
+    running VectorClient / PineconeRetriever offline.
+
+    Each call sleeps `latency_ms` (plus up to `jitter_ms`), fails with a 503
+    with probability `failure_rate` and hangs for `hang_s` with probability
+    `hang_rate`. `max_in_flight` records the highest observed concurrency.
+    """
+
+    def __init__(
+        self,
+        dimension: Optional[int] = None,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        failure_rate: float = 0.0,
+        hang_rate: float = 0.0,
+        hang_s: float = 30.0,
+        seed: Optional[int] = None,
+    ):
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.hang_rate = hang_rate
+        self.hang_s = hang_s
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # namespace -> id -> (unit vector, raw values, metadata)
+        self._namespaces: Dict[str, Dict[str, tuple]] = {}
+        self._matrices: Dict[str, tuple] = {}  # namespace -> (ids, matrix), rebuilt after writes
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _simulate(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            roll = self._rng.random()
+            delay = (self.latency_ms + self._rng.random() * self.jitter_ms) / 1000.0
+        try:
+            if roll < self.hang_rate:
+                time.sleep(self.hang_s)
+            elif delay:
+                time.sleep(delay)
+            if self.hang_rate <= roll < self.hang_rate + self.failure_rate:
+                raise FakeVectorError(503)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    # --------- WRITE ---------
+    def upsert(self, vectors: List, namespace: str = ""):
+        self._simulate()
+        with self._lock:
+            ns = self._namespaces.setdefault(namespace, {})
+            for v in vectors:
+                if isinstance(v, dict):
+                    rec_id, values, metadata = v["id"], v["values"], v.get("metadata")
+                else:  # (id, values[, metadata]) tuples
+                    rec_id, values, metadata = v[0], v[1], v[2] if len(v) > 2 else None
+                values = np.asarray(values, dtype=np.float32)
+                if self.dimension is None:
+                    self.dimension = len(values)
+                if len(values) != self.dimension:
+                    raise ValueError(
+                        f"Vector dimension {len(values)} does not match the index dimension {self.dimension}"
+                    )
+                ns[rec_id] = (values / max(float(np.linalg.norm(values)), 1e-12), values, dict(metadata or {}))
+            self._matrices.pop(namespace, None)
+        return SimpleNamespace(upserted_count=len(vectors))
+
+    def delete(self, ids: List[str], namespace: str = ""):
+        self._simulate()
+        with self._lock:
+            ns = self._namespaces.get(namespace, {})
+            for rec_id in ids:
+                ns.pop(rec_id, None)
+            self._matrices.pop(namespace, None)
+        return {}
+
+    # --------- READ ---------
+    def query(self, vector: List[float], top_k: int = 10, namespace: str = "", filter: Optional[Dict] = None,
+              include_metadata: bool = False, include_values: bool = False, **_):
+        self._simulate()
+        with self._lock:
+            cached = self._matrices.get(namespace)
+            if cached is None:
+                ns = self._namespaces.get(namespace, {})
+                ids = list(ns)
+                if ids:
+                    matrix = np.stack([ns[i][0] for i in ids])
+                else:
+                    matrix = np.zeros((0, self.dimension or 0), dtype=np.float32)
+                cached = self._matrices[namespace] = (ids, matrix)
+            ns = self._namespaces.get(namespace, {})
+        ids, matrix = cached
+        if not ids:
+            return SimpleNamespace(matches=[])
+        q = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ (q / max(float(np.linalg.norm(q)), 1e-12))
+        if filter:
+            keep = np.array([i in ns and _matches_filter(ns[i][2], filter) for i in ids], dtype=bool)
+            scores = np.where(keep, scores, -np.inf)
+            top_k = min(top_k, int(keep.sum()))
+            if not top_k:
+                return SimpleNamespace(matches=[])
+        k = min(top_k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        matches = []
+        for i in top:
+            record = ns.get(ids[i])
+            if record is None:  # deleted while querying
+                continue
+            matches.append(SimpleNamespace(
+                id=ids[i],
+                score=float(scores[i]),
+                values=record[1].tolist() if include_values else [],
+                metadata=record[2] if include_metadata else None,
+            ))
+        return SimpleNamespace(matches=matches)
+
+    def fetch(self, ids: List[str], namespace: str = ""):
+        self._simulate()
+        with self._lock:
+            ns = self._namespaces.get(namespace, {})
+            found = {
+                i: SimpleNamespace(id=i, values=ns[i][1].tolist(), metadata=ns[i][2])
+                for i in ids if i in ns
+            }
+        return SimpleNamespace(vectors=found)
+
+    def describe_index_stats(self, **_):
+        self._simulate()
+        with self._lock:
+            namespaces = {name: {"vector_count": len(ns)} for name, ns in self._namespaces.items()}
+        return SimpleNamespace(
+            dimension=self.dimension or 0,
+            total_vector_count=sum(n["vector_count"] for n in namespaces.values()),
+            namespaces=namespaces,
+        )
+
+
+# ------------------ LOAD TEST ------------------
+
+def load_test(
+    index=None,
+    vectors: int = 10_000,
+    dimension: int = 384,
+    queries: int = 2_000,
+    clients: int = 32,
+    top_k: int = 5,
+    client: Optional[VectorClient] = None,
+    seed: int = 13,
+) -> Dict:
+    """Latency percentiles and outcomes of `queries` concurrent queries through a VectorClient."""
+    rng = np.random.default_rng(seed)
+    index = index if index is not None else FakeVectorIndex(dimension)
+    client = client or VectorClient(index)
+    data = rng.standard_normal((vectors, dimension)).astype(np.float32)
+    for start in range(0, vectors, 1000):
+        batch = data[start:start + 1000]
+        client.upsert(vectors=[{"id": str(start + i), "values": v} for i, v in enumerate(batch)], namespace="load")
+
+    probes = rng.standard_normal((queries, dimension)).astype(np.float32)
+    latencies: List[float] = []
+    failures = {"timeout": 0, "error": 0}
+    lock = threading.Lock()
+
+    def one(q):
+        start = time.perf_counter()
+        try:
+            client.query(vector=q.tolist(), top_k=top_k, namespace="load")
+        except VectorStoreTimeout:
+            with lock:
+                failures["timeout"] += 1
+            return
+        except Exception:
+            with lock:
+                failures["error"] += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    before = client.stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(one, probes))
+    elapsed = time.perf_counter() - started
+
+    ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+    report = {
+        "queries": queries,
+        "clients": clients,
+        "max_concurrency": client.max_concurrency,
+        "seconds": round(elapsed, 3),
+        "qps": round(queries / elapsed, 1),
+        "ok": len(latencies),
+        **failures,
+        "retries": client.stats()["retries"] - before["retries"],
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+    }
+    if isinstance(index, FakeVectorIndex):
+        report["max_in_flight"] = index.max_in_flight
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test VectorClient against the in-memory fake index.")
+    parser.add_argument("--vectors", type=int, default=10_000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=2_000)
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent callers.")
+    parser.add_argument("--max-concurrency", type=int, default=VECTOR_MAX_CONCURRENCY)
+    parser.add_argument("--timeout-s", type=float, default=VECTOR_QUERY_TIMEOUT_S)
+    parser.add_argument("--retries", type=int, default=VECTOR_MAX_RETRIES)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    fake = FakeVectorIndex(
+        args.dimension, args.latency_ms, args.jitter_ms, args.failure_rate, args.hang_rate, seed=13
+    )
+    vc = VectorClient(fake, max_concurrency=args.max_concurrency, query_timeout_s=args.timeout_s,
+                      max_retries=args.retries)
+    report = load_test(fake, args.vectors, args.dimension, args.queries, args.clients, client=vc)
+    print(json.dumps(report, indent=2))
+    vc.close()